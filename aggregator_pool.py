@@ -0,0 +1,200 @@
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from walrus import WalrusAPIError
+import config
+
+# Runs the GETs of hedged reads, so the losing request can finish in the background
+_hedge_pool = ThreadPoolExecutor(
+    max_workers=config.WALRUS_POOL_SIZE,
+    thread_name_prefix="walrus-hedge"
+)
+
+
+class EndpointStats:
+    """Recent latency and failure record of one aggregator"""
+
+    def __init__(self, window):
+        self.latencies = deque(maxlen=window)
+        self.ewma = None
+        self.requests = 0
+        self.failures = 0
+        self.hedge_wins = 0
+
+    def record(self, seconds):
+        self.latencies.append(seconds)
+        self.ewma = seconds if self.ewma is None else 0.8 * self.ewma + 0.2 * seconds
+        self.requests += 1
+
+    def percentile(self, q):
+        if not self.latencies:
+            return None
+        ordered = sorted(self.latencies)
+        return ordered[min(int(q * len(ordered)), len(ordered) - 1)]
+
+
+class AggregatorPool:
+    """Routes blob reads across several Walrus aggregators.
+
+    Endpoints are ranked by health (circuit breaker state) and recent
+    latency (EWMA of successful reads); endpoints without samples yet rank
+    first so they get measured. A read goes to the best endpoint and fails
+    over to the next one on error. With hedging on, a second GET is sent to
+    the next endpoint when the first has not answered within the best
+    endpoint's recent p95; whichever answers first wins.
+    """
+
+    def __init__(self, urls, transport, hedging=None, window=None, hedge_min_delay=None, hedge_default_delay=None):
+        self.urls = [url.rstrip("/") for url in urls]
+        if not self.urls:
+            raise ValueError("At least one Walrus aggregator URL is required")
+        self.transport = transport
+        self.hedging = config.WALRUS_HEDGE_ENABLED if hedging is None else hedging
+        self.hedge_min_delay = config.WALRUS_HEDGE_MIN_DELAY if hedge_min_delay is None else hedge_min_delay
+        self.hedge_default_delay = hedge_default_delay or config.WALRUS_HEDGE_DEFAULT_DELAY
+        window = window or config.WALRUS_LATENCY_WINDOW
+        self._stats = {url: EndpointStats(window) for url in self.urls}
+        self._lock = threading.Lock()
+        self.hedges = 0
+
+    def ranked(self):
+        """Endpoints ordered from best to worst"""
+        with self._lock:
+            latency = {url: stats.ewma or 0.0 for url, stats in self._stats.items()}
+        return sorted(
+            self.urls,
+            key=lambda url: (self.transport.breaker(url).state != "closed", latency[url])
+        )
+
+    def best(self):
+        return self.ranked()[0]
+
+    def record(self, endpoint, seconds):
+        with self._lock:
+            self._stats[endpoint].record(seconds)
+
+    def record_failure(self, endpoint):
+        with self._lock:
+            self._stats[endpoint].failures += 1
+
+    def record_hedge(self, endpoint, waited):
+        """Count a hedge; the slow endpoint ranks as if it took at least `waited`"""
+        with self._lock:
+            self.hedges += 1
+            stats = self._stats[endpoint]
+            stats.ewma = waited if stats.ewma is None else max(stats.ewma, waited)
+
+    def record_win(self, endpoint, hedged):
+        if hedged:
+            with self._lock:
+                self._stats[endpoint].hedge_wins += 1
+
+    def hedge_delay(self, endpoint):
+        """How long to wait on `endpoint` before hedging: its recent p95"""
+        with self._lock:
+            stats = self._stats[endpoint]
+            p95 = stats.percentile(0.95) if len(stats.latencies) >= 20 else None
+        if p95 is None:
+            return self.hedge_default_delay
+        return max(p95, self.hedge_min_delay)
+
+    def attempts(self):
+        """Per-endpoint attempts: fail over instead of retrying when there is somewhere to go"""
+        return 1 if len(self.urls) > 1 else None
+
+    def final_error(self, errors):
+        """Error to raise once every endpoint failed: not found only if all of them said so"""
+        if errors and all(isinstance(e, WalrusAPIError) and e.code == 404 for e in errors):
+            return errors[0]
+        for error in reversed(errors):
+            if not (isinstance(error, WalrusAPIError) and error.code == 404):
+                return error
+        return Exception("No Walrus aggregator available")
+
+    def _timed(self, endpoint, call, record_latency=True):
+        start = time.perf_counter()
+        try:
+            result = call(endpoint)
+        except WalrusAPIError as e:
+            if e.code != 404:
+                self.record_failure(endpoint)
+            raise
+        except Exception:
+            self.record_failure(endpoint)
+            raise
+        if record_latency:
+            self.record(endpoint, time.perf_counter() - start)
+        return result
+
+    def failover(self, call):
+        """Run call(endpoint) on the ranked endpoints until one succeeds.
+
+        Only failures are recorded: latencies of streams and HEADs are not
+        comparable with the whole-blob reads the hedge delay is based on.
+        """
+        errors = []
+        for endpoint in self.ranked():
+            try:
+                return self._timed(endpoint, call, record_latency=False)
+            except Exception as e:
+                errors.append(e)
+        raise self.final_error(errors)
+
+    def get_blob(self, blob_id, headers=None):
+        """Read a blob from the fastest healthy aggregator, hedged and with failover"""
+        attempts = self.attempts()
+        remaining = self.ranked()
+        pending = {}
+        errors = []
+        hedged = False
+
+        def launch():
+            endpoint = remaining.pop(0)
+            future = _hedge_pool.submit(
+                self._timed, endpoint, lambda url: self.transport.get_blob(url, blob_id, attempts=attempts, headers=headers)
+            )
+            pending[future] = endpoint
+
+        launch()
+        while pending:
+            timeout = None
+            if self.hedging and remaining and not hedged:
+                primary = next(iter(pending.values()))
+                timeout = self.hedge_delay(primary)
+            done, _ = wait(pending, timeout=timeout, return_when=FIRST_COMPLETED)
+            if not done:
+                # Slower than this endpoint usually is: ask the next one as well
+                hedged = True
+                self.record_hedge(primary, timeout)
+                launch()
+                continue
+            for future in done:
+                endpoint = pending.pop(future)
+                try:
+                    data = future.result()
+                except Exception as e:
+                    errors.append(e)
+                    continue
+                self.record_win(endpoint, hedged)
+                return data
+            if not pending and remaining:
+                launch()
+        raise self.final_error(errors)
+
+    def stats(self):
+        with self._lock:
+            endpoints = {
+                url: {
+                    "state": self.transport.breaker(url).state,
+                    "requests": stats.requests,
+                    "failures": stats.failures,
+                    "hedge_wins": stats.hedge_wins,
+                    "ewma": stats.ewma,
+                    "p50": stats.percentile(0.5),
+                    "p95": stats.percentile(0.95)
+                }
+                for url, stats in self._stats.items()
+            }
+            hedges = self.hedges
+        return {"hedging": self.hedging, "hedges": hedges, "best": self.best(), "endpoints": endpoints}
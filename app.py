@@ -1,40 +1,319 @@
-from flask import Flask, request, jsonify, send_file
-from image_analyzer import ImageAnalyzer
-from walrus_storage import WalrusStorage
-from gemini_chat import GeminiChat
+from flask import Flask, Request, request, jsonify, send_file, Response, g
+from walrus_storage import BlobNotFoundError, RangeNotSatisfiableError
+from upload_index import content_hash
+from batch_upload import BatchUploader, BatchItem
+from job_queue import JobQueue, JobWorker, PermanentJobError
+from services import ServiceUnavailableError
+import async_runtime
+import services
+import metrics
+import tracing
+import config
+import asyncio
 import os
+import time
 import uuid
 from werkzeug.utils import secure_filename
-import io
+import json
+import tempfile
 from flask_cors import CORS
 
-app = Flask(__name__)
-app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024  # 16MB max file size
+class UploadRequest(Request):
+    """Request that keeps small uploaded files in memory and spools larger ones to disk"""
+
+    def _get_file_stream(self, total_content_length, content_type, filename=None, content_length=None):
+        # Werkzeug spills anything over 500KB to disk; use our own threshold,
+        # which also caps how much of an upload is ever held in memory
+        return tempfile.SpooledTemporaryFile(max_size=config.UPLOAD_SPOOL_MAX_MEMORY, mode='rb+')
+
+class DonatelloFlask(Flask):
+    """Flask app whose async views all run on one shared event loop.
+
+    Flask's default gives every async view call its own short-lived loop.
+    Async views hand blocking work (Walrus, Gemini, SQLite, analysis) to
+    the shared loop's executor with asyncio.to_thread, through the same
+    services the sync views use.
+    """
+
+    def async_to_sync(self, func):
+        def run(*args, **kwargs):
+            return async_runtime.run(func(*args, **kwargs))
+        return run
+
+app = DonatelloFlask(__name__)
+app.request_class = UploadRequest
+app.config['MAX_CONTENT_LENGTH'] = config.MAX_UPLOAD_BYTES
 
 # Configure CORS to allow requests from your Next.js frontend
 CORS(app, origins=["http://localhost:3000", "http://127.0.0.1:3000"], 
      methods=["GET", "POST", "PUT", "DELETE", "OPTIONS"],
      allow_headers=["Content-Type", "Authorization"])
 
-# Initialize services
-analyzer = ImageAnalyzer()
-walrus_storage = WalrusStorage()
-gemini_chat = GeminiChat()
+# Services (see services.py) are built on first use, not at import
 
 # Allowed image extensions
 ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg', 'gif', 'bmp', 'webp'}
 
+# Content types by Pillow format name, and magic bytes to sniff blobs we have no metadata for
+IMAGE_MIMETYPES = {
+    'PNG': 'image/png',
+    'JPEG': 'image/jpeg',
+    'GIF': 'image/gif',
+    'BMP': 'image/bmp',
+    'WEBP': 'image/webp'
+}
+IMAGE_SIGNATURES = (
+    (b'\x89PNG\r\n\x1a\n', 'PNG'),
+    (b'\xff\xd8\xff', 'JPEG'),
+    (b'GIF87a', 'GIF'),
+    (b'GIF89a', 'GIF'),
+    (b'BM', 'BMP')
+)
+
+# Blob IDs are content-derived, so an image response can be cached forever
+IMMUTABLE_CACHE_CONTROL = 'public, max-age=31536000, immutable'
+
 def allowed_file(filename):
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
 
+def build_upload_response(upload_result, metadata, deduplicated=False):
+    """Build the /analyze/image response body from a Walrus upload result"""
+    return {
+        "success": True,
+        "image_url": services.walrus_storage().get_image_url(upload_result["image_blob_id"]),
+        "image_blob_id": upload_result["image_blob_id"],
+        "metadata_blob_id": upload_result["metadata_blob_id"],
+        "image_object_id": upload_result["image_object_id"],
+        "metadata_object_id": upload_result["metadata_object_id"],
+        "metadata": metadata,
+        "deduplicated": deduplicated
+    }
+
+def record_upload(digest, upload_result, metadata):
+    """Record a successful upload in the dedup index, catalog and similarity index"""
+    services.upload_index().put(digest, upload_result, metadata)
+    services.upload_catalog().add(upload_result, metadata)
+    fingerprint = metadata["file_info"].get("fingerprint")
+    if fingerprint:
+        services.similarity_index().add(upload_result["image_blob_id"], fingerprint["phash"])
+
+def find_similar(phash, k, max_distance):
+    """Look up stored images whose perceptual hash is close to phash"""
+    return [
+        {
+            "image_blob_id": blob_id,
+            "distance": distance,
+            "image_url": services.walrus_storage().get_image_url(blob_id)
+        }
+        for blob_id, distance in services.similarity_index().search(phash, k=k, max_distance=max_distance)
+    ]
+
+@services.lazy
+def batch_uploader():
+    return BatchUploader(services.walrus_storage(), services.upload_index(), record_upload)
+
+def run_upload_job(job):
+    """Analyze and store a queued upload (runs on a job worker thread)"""
+    existing = services.upload_index().get(job["content_hash"])
+    if existing:
+        return build_upload_response(existing, existing["metadata"], deduplicated=True)
+
+    with open(job["payload_path"], 'rb') as image_file:
+        try:
+            metadata = services.analyzer().analyze_file(image_file, filename=job["filename"])
+        except Exception as e:
+            # A file that cannot be analyzed will not get better on retry
+            raise PermanentJobError(str(e))
+
+        fingerprint = metadata["file_info"].get("fingerprint")
+        similar = []
+        if fingerprint:
+            similar = find_similar(fingerprint["phash"], k=5, max_distance=config.SIMILARITY_MAX_DISTANCE)
+
+        upload_result = services.walrus_storage().upload_image(image_file, metadata)
+    record_upload(job["content_hash"], upload_result, metadata)
+    response = build_upload_response(upload_result, metadata)
+    response["similar"] = similar
+    return response
+
+def run_fingerprint_job(job):
+    """Fingerprint a stored upload that was answered without one (runs on a job worker thread)"""
+    entry = services.upload_index().get(job["content_hash"])
+    if entry is None:
+        raise PermanentJobError("Upload is not in the upload index")
+
+    with open(job["payload_path"], 'rb') as image_file:
+        try:
+            fingerprint = services.analyzer().fingerprint_file(image_file)
+        except Exception as e:
+            raise PermanentJobError(str(e))
+
+    metadata = entry["metadata"]
+    metadata["file_info"].pop("fingerprint_pending", None)
+    metadata["file_info"]["fingerprint"] = fingerprint
+    services.upload_index().update_metadata(job["content_hash"], metadata)
+    services.similarity_index().add(entry["image_blob_id"], fingerprint["phash"])
+    return {"image_blob_id": entry["image_blob_id"], "phash": fingerprint["phash"]}
+
+def defer_fingerprint(file, digest):
+    """Queue the fingerprint of a stored upload for the fingerprint workers"""
+    job_id = fingerprint_jobs.new_job_id()
+    file.stream.seek(0)
+    file.save(fingerprint_jobs.spool_path(job_id))
+    fingerprint_jobs.enqueue(job_id, secure_filename(file.filename), digest)
+    fingerprint_job_worker.notify()
+
+# Uploads accepted with ?async=true are stored by these workers, retried
+# through publisher outages
+upload_jobs = JobQueue(config.JOB_QUEUE_PATH, config.JOB_SPOOL_DIR)
+upload_job_worker = JobWorker(upload_jobs, run_upload_job)
+
+# Large images from /analyze/image are fingerprinted by these after the response
+fingerprint_jobs = JobQueue(config.FINGERPRINT_JOB_QUEUE_PATH, config.FINGERPRINT_JOB_SPOOL_DIR)
+fingerprint_job_worker = JobWorker(fingerprint_jobs, run_fingerprint_job, workers=config.FINGERPRINT_JOB_WORKERS)
+
+def start_background_workers():
+    """Start this process's job worker threads.
+
+    Not done at import: a pre-fork server imports the app in its master
+    process, and threads do not survive the fork. serve.py calls this in
+    each worker after forking; the first request covers other servers.
+    """
+    upload_job_worker.start()
+    fingerprint_job_worker.start()
+
+def image_mimetype(blob_id, head=b''):
+    """Content type of an image blob, from the catalog or else from its first bytes"""
+    entry = services.upload_catalog().get(blob_id)
+    image_format = entry["format"] if entry else None
+    if image_format is None:
+        if head[:4] == b'RIFF' and head[8:12] == b'WEBP':
+            image_format = 'WEBP'
+        for signature, signature_format in IMAGE_SIGNATURES:
+            if head.startswith(signature):
+                image_format = signature_format
+                break
+    return IMAGE_MIMETYPES.get(image_format, 'application/octet-stream')
+
+def stream_chunks(first, chunks):
+    """Yield an already-read first chunk followed by the rest, closing the source when done"""
+    try:
+        yield first
+        yield from chunks
+    finally:
+        chunks.close()
+
+def save_temp_file(file):
+    """Save an uploaded file under ./temp and return its path"""
+    temp_filename = f"temp_{uuid.uuid4().hex[:8]}_{secure_filename(file.filename)}"
+    temp_path = os.path.join("./temp", temp_filename)
+    os.makedirs("./temp", exist_ok=True)
+    with metrics.stage("temp_save"):
+        file.save(temp_path)
+    return temp_path
+
+def request_route():
+    """Route pattern of the current request, used as a low-cardinality metric label"""
+    return request.url_rule.rule if request.url_rule is not None else "unmatched"
+
+@app.before_request
+def ensure_background_workers():
+    start_background_workers()
+
+@app.before_request
+def start_request_metrics():
+    g.request_started = time.perf_counter()
+    metrics.gauge("http_requests_in_flight").inc()
+    if config.TRACE_ENABLED:
+        g.trace = tracing.start_trace(f"{request.method} {request_route()}", path=request.path)
+
+@app.after_request
+def record_request_metrics(response):
+    route = request_route()
+    started = g.get("request_started")
+    if started is not None:
+        metrics.histogram("http_request_seconds", route=route, method=request.method).observe(
+            time.perf_counter() - started
+        )
+    metrics.counter("http_requests_total", route=route, method=request.method, status=str(response.status_code)).inc()
+    if request.content_length:
+        metrics.counter("http_request_bytes_total", route=route).inc(request.content_length)
+    # Unknown for streamed bodies; those are counted by walrus_bytes_total as they flow
+    if response.content_length:
+        metrics.counter("http_response_bytes_total", route=route).inc(response.content_length)
+    g.status_code = response.status_code
+    return response
+
+@app.teardown_request
+def finish_request_metrics(error=None):
+    if g.get("request_started") is not None:
+        metrics.gauge("http_requests_in_flight").dec()
+    tracing.finish_trace(g.get("trace"), error=error, status=g.get("status_code"))
+
+def collect_service_metrics():
+    """Expose counters the services already keep, read only when /metrics is scraped"""
+    # Services not built yet have nothing to report; scraping must not build them
+    samples = []
+    if services.walrus_storage.loaded:
+        cache = services.walrus_storage().cache_stats()
+        if cache["enabled"]:
+            for result in ("memory_hits", "disk_hits", "misses"):
+                samples.append(("blob_cache_lookups_total", "counter", {"result": result}, cache[result]))
+            samples.append(("blob_cache_hit_ratio", "gauge", {}, cache["hit_ratio"]))
+            samples.append(("blob_cache_bytes", "gauge", {"tier": "memory"}, cache["memory_bytes"]))
+            samples.append(("blob_cache_bytes", "gauge", {"tier": "disk"}, cache["disk_bytes"]))
+
+        for endpoint, breaker in services.walrus_storage().transport.stats()["breakers"].items():
+            samples.append(("walrus_circuit_open", "gauge", {"endpoint": endpoint}, int(breaker["state"] != "closed")))
+
+    if services.variant_service.loaded:
+        variants = services.variant_service().stats()
+        for result in ("hits", "misses"):
+            samples.append(("variant_cache_lookups_total", "counter", {"result": result}, variants[result]))
+
+    if services.gemini_chat.loaded:
+        chat = services.gemini_chat().get_stats()
+        samples.append(("chat_sessions", "gauge", {}, chat["sessions"]["sessions"]))
+        samples.append(("gemini_tokens_total", "counter", {"kind": "prompt"}, chat["context"]["prompt_tokens_total"]))
+        samples.append(("gemini_tokens_total", "counter", {"kind": "response"}, chat["context"]["response_tokens_total"]))
+        if chat["response_cache"].get("enabled", True):
+            for result in ("hits", "misses", "bypassed"):
+                samples.append(("gemini_response_cache_lookups_total", "counter", {"result": result}, chat["response_cache"][result]))
+            samples.append(("gemini_response_cache_hit_ratio", "gauge", {}, chat["response_cache"]["hit_ratio"]))
+
+    jobs = upload_jobs.stats()
+    for status in ("queued", "running", "done", "failed"):
+        samples.append(("upload_jobs", "gauge", {"status": status}, jobs.get(status, 0)))
+    jobs = fingerprint_jobs.stats()
+    for status in ("queued", "running", "done", "failed"):
+        samples.append(("fingerprint_jobs", "gauge", {"status": status}, jobs.get(status, 0)))
+    return samples
+
+metrics.register_collector(collect_service_metrics)
+metrics.describe("http_request_seconds", "Time to produce the response (first byte for streamed responses)")
+metrics.describe("http_requests_in_flight", "Requests currently being handled")
+metrics.describe("stage_seconds", "Time spent per pipeline stage (hash, pil_analysis, image_put, aggregator_get, gemini_generate, ...)")
+metrics.describe("walrus_request_seconds", "Walrus HTTP call latency per endpoint and operation")
+metrics.describe("walrus_bytes_total", "Bytes sent to (out) and read from (in) Walrus")
+
+@app.route('/metrics', methods=['GET'])
+def get_metrics():
+    """Prometheus metrics endpoint"""
+    return Response(metrics.render_prometheus(), mimetype='text/plain; version=0.0.4')
+
 @app.route('/health', methods=['GET'])
 def health_check():
     """Health check endpoint"""
     return jsonify({"status": "healthy", "service": "Image Analyzer with Walrus Storage"})
 
+def chat_session_id():
+    """Session ID of a chat request, from the JSON body, X-Session-Id header or query string"""
+    data = request.get_json(silent=True) or {}
+    return data.get('session_id') or request.headers.get('X-Session-Id') or request.args.get('session_id')
+
 @app.route('/chat', methods=['POST'])
-def chat_with_gemini():
-    """Chat with Gemini AI"""
+async def chat_with_gemini():
+    """Chat with Gemini AI (starts a new session when no session_id is given)"""
     try:
         data = request.get_json()
         message = data.get('message', '')
@@ -43,118 +322,383 @@ def chat_with_gemini():
         if not message:
             return jsonify({"error": "No message provided"}), 400
         
-        result = gemini_chat.send_message(message, image_context)
+        result = await asyncio.to_thread(
+            services.gemini_chat().send_message,
+            message,
+            image_context,
+            session_id=chat_session_id(),
+            bypass_cache=bool(data.get('bypass_cache', False))
+        )
         return jsonify(result), 200
         
+    except ServiceUnavailableError as e:
+        return jsonify({"error": str(e)}), 503
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+def sse_events(events):
+    """Format chat stream events as Server-Sent Events, closing the source on disconnect"""
+    try:
+        for event in events:
+            yield f"event: {event['type']}\ndata: {json.dumps(event)}\n\n"
+    finally:
+        events.close()
+
+@app.route('/chat/stream', methods=['POST'])
+def stream_chat_with_gemini():
+    """Chat with Gemini AI, streaming the reply as Server-Sent Events"""
+    try:
+        data = request.get_json()
+        message = data.get('message', '')
+        image_context = data.get('image_context', None)
+        
+        if not message:
+            return jsonify({"error": "No message provided"}), 400
+        
+        events = services.gemini_chat().send_message(
+            message,
+            image_context,
+            session_id=chat_session_id(),
+            stream=True,
+            bypass_cache=bool(data.get('bypass_cache', False))
+        )
+        return Response(
+            sse_events(events),
+            mimetype='text/event-stream',
+            headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+        )
+        
+    except ServiceUnavailableError as e:
+        return jsonify({"error": str(e)}), 503
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
 @app.route('/chat/history', methods=['GET'])
 def get_chat_history():
-    """Get chat history"""
+    """Get chat history of a session"""
+    try:
+        session_id = chat_session_id()
+        if not session_id:
+            return jsonify({"error": "No session_id provided"}), 400
+        history = services.gemini_chat().get_chat_history(session_id)
+        return jsonify({"session_id": session_id, "history": history}), 200
+    except ServiceUnavailableError as e:
+        return jsonify({"error": str(e)}), 503
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+@app.route('/chat/stats', methods=['GET'])
+def get_chat_stats():
+    """Get chat session counts and tokens-per-request metrics"""
     try:
-        history = gemini_chat.get_chat_history()
-        return jsonify({"history": history}), 200
+        return jsonify(services.gemini_chat().get_stats()), 200
+    except ServiceUnavailableError as e:
+        return jsonify({"error": str(e)}), 503
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
 @app.route('/chat/reset', methods=['POST'])
 def reset_chat():
-    """Reset chat history while maintaining Donatello's personality"""
+    """Reset a session's chat history while maintaining Donatello's personality"""
     try:
-        result = gemini_chat.reset_chat()
+        session_id = chat_session_id()
+        if not session_id:
+            return jsonify({"error": "No session_id provided"}), 400
+        result = services.gemini_chat().reset_chat(session_id)
         return jsonify(result), 200
+    except ServiceUnavailableError as e:
+        return jsonify({"error": str(e)}), 503
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
 @app.route('/analyze/image', methods=['POST'])
-def analyze_image():
+async def analyze_image():
     """Analyze image and store result in Walrus"""
     try:
+        # Parsing the multipart body reads from the socket, keep it off the event loop
+        with metrics.stage("receive_upload"):
+            files = await asyncio.to_thread(lambda: request.files)
+        
         # Check if image file is present
-        if 'image' not in request.files:
+        if 'image' not in files:
             return jsonify({"error": "No image file provided"}), 400
         
-        file = request.files['image']
+        file = files['image']
         if file.filename == '':
             return jsonify({"error": "No image file selected"}), 400
         
         if not allowed_file(file.filename):
             return jsonify({"error": "Invalid file type. Allowed: " + ", ".join(ALLOWED_EXTENSIONS)}), 400
         
-        # Save uploaded image temporarily
-        temp_filename = f"temp_{uuid.uuid4().hex[:8]}_{secure_filename(file.filename)}"
-        temp_path = os.path.join("./temp", temp_filename)
-        os.makedirs("./temp", exist_ok=True)
-        file.save(temp_path)
+        # Repeat uploads of the same content are answered from the local index
+        # without analysis or publisher traffic
+        digest = await asyncio.to_thread(content_hash, file.stream)
+        file.stream.seek(0)
+        # The index and similarity lookups are SQLite queries, also kept off the loop
+        existing = await asyncio.to_thread(lambda: services.upload_index().get(digest))
+        if existing:
+            return jsonify(build_upload_response(existing, existing["metadata"], deduplicated=True)), 200
         
-        try:
-            # Analyze image and get metadata
-            metadata, image_data = analyzer.analyze_image(temp_path)
-            
-            # Upload to Walrus storage
-            upload_result = walrus_storage.upload_image(image_data, metadata)
-            
-            # Get image URL
-            image_url = walrus_storage.get_image_url(upload_result["image_blob_id"])
-            
-            # Clean up temp file
-            os.remove(temp_path)
-            
-            # Return response with Walrus info
-            response = {
-                "success": True,
-                "image_url": image_url,
-                "image_blob_id": upload_result["image_blob_id"],
-                "metadata_blob_id": upload_result["metadata_blob_id"],
-                "image_object_id": upload_result["image_object_id"],
-                "metadata_object_id": upload_result["metadata_object_id"],
-                "metadata": metadata
-            }
-            
-            return jsonify(response), 200
-            
-        except Exception as e:
-            # Clean up temp file on error
-            if os.path.exists(temp_path):
-                os.remove(temp_path)
-            raise e
+        # Asynchronous mode: persist the upload, answer 202 and let a job
+        # worker do the analysis and Walrus upload
+        if request.args.get('async', 'false').lower() == 'true':
+            job_id = upload_jobs.new_job_id()
+            with metrics.stage("temp_save"):
+                await asyncio.to_thread(file.save, upload_jobs.spool_path(job_id))
+            await asyncio.to_thread(upload_jobs.enqueue, job_id, secure_filename(file.filename), digest)
+            upload_job_worker.notify()
+            status_url = f"/jobs/{job_id}"
+            return jsonify({"job_id": job_id, "status": "queued", "status_url": status_url}), 202, {"Location": status_url}
+        
+        # Analyze straight from the upload stream (in memory, or spooled to
+        # disk for large files) without reading it whole; this is CPU work,
+        # so it runs in a thread rather than on the event loop. Fingerprints
+        # that need a full decode are computed after the response.
+        metadata = await asyncio.to_thread(
+            lambda: services.analyzer().analyze_file(
+                file.stream, filename=secure_filename(file.filename), defer_fingerprint=True
+            )
+        )
+        
+        # Look for close copies that were already stored
+        fingerprint = metadata["file_info"].get("fingerprint")
+        similar = []
+        if fingerprint:
+            similar = await asyncio.to_thread(
+                find_similar, fingerprint["phash"], k=5, max_distance=config.SIMILARITY_MAX_DISTANCE
+            )
+        
+        # Upload to Walrus storage, streaming the file in bounded chunks
+        upload_result = await asyncio.to_thread(services.walrus_storage().upload_image, file.stream, metadata)
+        await asyncio.to_thread(record_upload, digest, upload_result, metadata)
+        if metadata["file_info"].get("fingerprint_pending"):
+            await asyncio.to_thread(defer_fingerprint, file, digest)
+        
+        # Return response with Walrus info
+        response = build_upload_response(upload_result, metadata)
+        response["similar"] = similar
+        return jsonify(response), 200
         
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
+def prepare_batch_item(index, file):
+    """Validate, hash and save one file of a batch upload"""
+    if file.filename == '':
+        return BatchItem(index, file.filename, error="No image file selected")
+    if not allowed_file(file.filename):
+        return BatchItem(index, file.filename, error="Invalid file type. Allowed: " + ", ".join(ALLOWED_EXTENSIONS))
+    digest = content_hash(file.stream)
+    file.stream.seek(0)
+    return BatchItem(index, file.filename, temp_path=save_temp_file(file), digest=digest)
+
+def build_batch_result(result):
+    """Turn a BatchUploader result into the per-file response entry"""
+    if "upload_result" not in result:
+        return result
+    response = build_upload_response(result["upload_result"], result["metadata"], result["deduplicated"])
+    return {"index": result["index"], "filename": result["filename"], **response}
+
+@app.route('/analyze/images', methods=['POST'])
+def analyze_images():
+    """Analyze a batch of images and store them in Walrus.
+
+    Returns per-file results (including per-file errors). With ?stream=true
+    the results are streamed as NDJSON, one line per file as it finishes.
+    """
+    try:
+        files = request.files.getlist('images')
+        if not files:
+            return jsonify({"error": "No image files provided"}), 400
+        if len(files) > config.BATCH_MAX_FILES:
+            return jsonify({"error": f"Too many files. Maximum per batch: {config.BATCH_MAX_FILES}"}), 400
+
+        items = [prepare_batch_item(index, file) for index, file in enumerate(files)]
+        results = (build_batch_result(result) for result in batch_uploader().process(items))
+
+        if request.args.get('stream', '').lower() in ('1', 'true'):
+            return Response(
+                (json.dumps(result) + "\n" for result in results),
+                mimetype='application/x-ndjson'
+            )
+
+        results = sorted(results, key=lambda result: result["index"])
+        return jsonify({
+            "success": all(result["success"] for result in results),
+            "results": results
+        }), 200
+
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+@app.route('/search/similar', methods=['GET', 'POST'])
+def search_similar():
+    """Find stored images that are near-duplicates of an uploaded image or a perceptual hash"""
+    try:
+        k = int(request.values.get('k', 10))
+        max_distance = int(request.values.get('max_distance', config.SIMILARITY_MAX_DISTANCE))
+
+        if 'image' in request.files:
+            phash = services.analyzer().fingerprint_file(request.files['image'].stream)["phash"]
+        else:
+            phash = request.values.get('hash', '').strip().lower()
+            if not phash:
+                return jsonify({"error": "Provide an image file or a hash"}), 400
+            int(phash, 16)
+
+        return jsonify({
+            "hash": phash,
+            "results": find_similar(phash, k=k, max_distance=max_distance)
+        }), 200
+    except ValueError as e:
+        return jsonify({"error": f"Invalid parameter: {str(e)}"}), 400
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+@app.route('/jobs/<job_id>', methods=['GET'])
+def get_job(job_id):
+    """Get the status (and, once done, the result) of a background upload job"""
+    try:
+        job = upload_jobs.get(job_id)
+        if job is None:
+            return jsonify({"error": f"Job not found: {job_id}"}), 404
+        return jsonify(job), 200
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
 @app.route('/image/<blob_id>', methods=['GET'])
 def get_image(blob_id):
-    """Download image from Walrus by blob ID"""
+    """Stream an image from Walrus by blob ID.
+
+    Cached blobs are served from disk, others are proxied chunk by chunk from
+    the aggregator, so memory use does not depend on the image size. Supports
+    Range requests and answers If-None-Match with 304 (the ETag is the blob ID).
+    """
+    try:
+        if request.if_none_match.contains(blob_id):
+            response = Response(status=304)
+            response.set_etag(blob_id)
+            response.headers['Cache-Control'] = IMMUTABLE_CACHE_CONTROL
+            return response
+
+        cached_path = services.walrus_storage().cached_blob_path(blob_id)
+        if cached_path:
+            with open(cached_path, 'rb') as f:
+                head = f.read(16)
+            # send_file handles Range, Content-Length and conditional requests
+            response = send_file(
+                cached_path,
+                mimetype=image_mimetype(blob_id, head),
+                conditional=True,
+                etag=blob_id
+            )
+            response.headers['Cache-Control'] = IMMUTABLE_CACHE_CONTROL
+            return response
+
+        status, headers, chunks = services.walrus_storage().stream_blob(blob_id, request.headers.get('Range'))
+        first = next(chunks, b'')
+        headers.pop('Content-Type', None)
+        response = Response(
+            stream_chunks(first, chunks),
+            status=status,
+            mimetype=image_mimetype(blob_id, first),
+            headers=headers,
+            direct_passthrough=True
+        )
+        response.set_etag(blob_id)
+        response.headers['Accept-Ranges'] = 'bytes'
+        response.headers['Cache-Control'] = IMMUTABLE_CACHE_CONTROL
+        return response
+
+    except BlobNotFoundError as e:
+        return jsonify({"error": str(e)}), 404
+    except RangeNotSatisfiableError as e:
+        # Same answer send_file gives for a cached blob
+        return Response(status=416, headers={"Content-Range": f"bytes */{e.size}", "Accept-Ranges": "bytes"})
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+@app.route('/image/<blob_id>/variant', methods=['GET'])
+def get_image_variant(blob_id):
+    """Get a resized, re-encoded variant of an image (?w=&h=&fmt=webp|jpeg|png)"""
     try:
-        image_data = walrus_storage.download_image(blob_id)
-        return send_file(
-            io.BytesIO(image_data),
-            mimetype='image/*'
+        variant_service = services.variant_service()
+        width, height, fmt = variant_service.parse_params(
+            request.args.get('w'), request.args.get('h'), request.args.get('fmt')
         )
+        etag = variant_service.variant_key(blob_id, width, height, fmt)
+        if request.if_none_match.contains(etag):
+            response = Response(status=304)
+            response.set_etag(etag)
+            response.headers['Cache-Control'] = IMMUTABLE_CACHE_CONTROL
+            return response
+
+        data, mimetype = variant_service.get_variant(blob_id, width, height, fmt)
+        response = Response(data, mimetype=mimetype)
+        response.set_etag(etag)
+        response.headers['Cache-Control'] = IMMUTABLE_CACHE_CONTROL
+        return response
+    except ValueError as e:
+        return jsonify({"error": f"Invalid parameter: {str(e)}"}), 400
+    except BlobNotFoundError as e:
+        return jsonify({"error": str(e)}), 404
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
 @app.route('/metadata/<blob_id>', methods=['GET'])
-def get_metadata(blob_id):
+async def get_metadata(blob_id):
     """Download metadata from Walrus by blob ID"""
     try:
-        metadata = walrus_storage.download_metadata(blob_id)
+        metadata = await asyncio.to_thread(services.walrus_storage().download_metadata, blob_id)
         return jsonify(metadata), 200
+    except BlobNotFoundError as e:
+        return jsonify({"error": str(e)}), 404
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+@app.route('/cache/stats', methods=['GET'])
+def get_cache_stats():
+    """Get blob cache hit/miss/eviction counters"""
+    try:
+        stats = services.walrus_storage().cache_stats()
+        stats["variants"] = services.variant_service().stats()
+        return jsonify(stats), 200
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+@app.route('/walrus/stats', methods=['GET'])
+def get_walrus_stats():
+    """Get Walrus connection pool, circuit breaker and per-endpoint latency stats"""
+    try:
+        return jsonify(services.walrus_storage().transport_stats()), 200
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
 @app.route('/blobs', methods=['GET'])
 def list_blobs():
-    """List all blobs (placeholder - would need Walrus SDK support for listing)"""
+    """List uploaded blobs from the local catalog, newest first unless sort says otherwise"""
     try:
-        # This is a placeholder - the Walrus SDK doesn't currently support listing blobs
-        # You would need to maintain your own database of uploaded blobs
-        return jsonify({
-            "message": "Blob listing not yet implemented",
-            "note": "The Walrus SDK doesn't currently support listing all blobs",
-            "suggestion": "Maintain your own database of uploaded blob IDs"
-        }), 200
+        blobs, next_cursor = services.upload_catalog().list(
+            cursor=request.args.get('cursor'),
+            limit=request.args.get('limit', 50),
+            format=request.args.get('format'),
+            min_size=request.args.get('min_size'),
+            max_size=request.args.get('max_size'),
+            since=request.args.get('since'),
+            until=request.args.get('until'),
+            sort=request.args.get('sort', 'newest')
+        )
+        return jsonify({"blobs": blobs, "next_cursor": next_cursor}), 200
+    except ValueError as e:
+        return jsonify({"error": f"Invalid query parameter: {str(e)}"}), 400
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
@@ -0,0 +1,63 @@
+import asyncio
+import contextvars
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+import config
+
+_loop = None
+_loop_pid = None
+_lock = threading.Lock()
+
+
+def get_loop():
+    """The process-wide event loop, running in a background thread.
+
+    All async views of a worker process share this loop instead of each
+    call getting its own. Its default executor, which runs their
+    asyncio.to_thread calls, has one thread per serving thread: a request
+    awaits one blocking call at a time, so a waiting call (e.g. on a chat
+    session lock) never starves another request of a thread. It is
+    recreated after a fork.
+    """
+    global _loop, _loop_pid
+    with _lock:
+        if _loop is None or _loop_pid != os.getpid():
+            _loop = asyncio.new_event_loop()
+            _loop.set_default_executor(
+                ThreadPoolExecutor(max_workers=config.WEB_THREADS, thread_name_prefix="async-runtime")
+            )
+            _loop_pid = os.getpid()
+            threading.Thread(target=_loop.run_forever, name="async-runtime", daemon=True).start()
+        return _loop
+
+
+def run(coro):
+    """Run a coroutine on the shared loop and wait for its result.
+
+    The calling thread blocks until the coroutine is done, so a request
+    still needs its own server thread. The caller's contextvars (e.g. Flask's request context) are carried
+    over, so async views can use `request` as usual.
+    """
+    loop = get_loop()
+    context = contextvars.copy_context()
+    done = threading.Event()
+    outcome = {}
+
+    def schedule():
+        task = context.run(loop.create_task, coro)
+
+        def finished(task):
+            try:
+                outcome["result"] = task.result()
+            except BaseException as e:
+                outcome["error"] = e
+            done.set()
+
+        task.add_done_callback(finished)
+
+    loop.call_soon_threadsafe(schedule)
+    done.wait()
+    if "error" in outcome:
+        raise outcome["error"]
+    return outcome.get("result")
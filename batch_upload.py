@@ -0,0 +1,200 @@
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+import json
+import multiprocessing
+import os
+import threading
+from werkzeug.utils import secure_filename
+import config
+
+_analysis_pool = None
+_upload_pool = None
+_pool_lock = threading.Lock()
+
+
+def _analyze_path(path, filename):
+    """Analyze one image in a worker process, returning only the metadata"""
+    from image_analyzer import ImageAnalyzer
+    with open(path, 'rb') as f:
+        try:
+            return ImageAnalyzer().analyze_file(f, filename=filename)
+        except Exception as e:
+            # Pillow names the open file in its errors; never show clients the temp path
+            raise Exception(str(e).replace(repr(f), filename).replace(path, filename))
+
+
+def _get_pools():
+    """Create the shared analysis (per CPU core) and upload pools on first use"""
+    global _analysis_pool, _upload_pool
+    with _pool_lock:
+        if _analysis_pool is None:
+            # Never fork the web worker itself: its event loop, job and upload
+            # threads may hold locks at fork time and deadlock the child
+            start_method = "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+            _analysis_pool = ProcessPoolExecutor(
+                max_workers=config.BATCH_ANALYSIS_WORKERS,
+                mp_context=multiprocessing.get_context(start_method)
+            )
+            _upload_pool = ThreadPoolExecutor(
+                max_workers=config.BATCH_UPLOAD_CONCURRENCY,
+                thread_name_prefix="batch-upload"
+            )
+    return _analysis_pool, _upload_pool
+
+
+class BatchItem:
+    """One file of a batch, already saved to a temp path and hashed.
+
+    Batch files are staged on disk because they are handed to analysis
+    worker processes; single uploads are analyzed in memory.
+    """
+
+    def __init__(self, index, filename, temp_path=None, digest=None, error=None):
+        self.index = index
+        self.filename = filename
+        self.temp_path = temp_path
+        self.digest = digest
+        self.error = error
+
+
+class BatchUploader:
+    """Analyze and upload many images at once.
+
+    Images are analyzed in parallel across CPU cores and uploaded to Walrus
+    with bounded concurrency. Results are yielded as each file finishes, so
+    callers can stream progress; a failing file yields an error entry
+    instead of aborting the batch.
+    """
+
+    def __init__(self, storage, upload_index, record_upload):
+        self.storage = storage
+        self.upload_index = upload_index
+        # Called as record_upload(digest, upload_result, metadata) after each upload
+        self.record_upload = record_upload
+
+    def _upload(self, item, metadata):
+        with open(item.temp_path, 'rb') as f:
+            upload_result = self.storage.upload_image(f, metadata)
+        self.record_upload(item.digest, upload_result, metadata)
+        return upload_result
+
+    def _put_image(self, item):
+        with open(item.temp_path, 'rb') as f:
+            return self.storage.put_image(f)
+
+    def _packed_result(self, item, metadata, image_part, packed):
+        """Combine the image PUT and packed metadata of one item into an upload result"""
+        metadata_blob_id, metadata_object_id = self.storage.record_packed_metadata(
+            packed, json.dumps(metadata).encode('utf-8')
+        )
+        upload_result = {
+            "image_blob_id": image_part[0],
+            "metadata_blob_id": metadata_blob_id,
+            "image_object_id": image_part[1],
+            "metadata_object_id": metadata_object_id
+        }
+        self.record_upload(item.digest, upload_result, metadata)
+        return upload_result
+
+    def _result(self, item, upload_result=None, metadata=None, deduplicated=False, error=None):
+        if error is not None:
+            return {"index": item.index, "filename": item.filename, "success": False, "error": str(error)}
+        return {
+            "index": item.index,
+            "filename": item.filename,
+            "upload_result": upload_result,
+            "metadata": metadata,
+            "deduplicated": deduplicated
+        }
+
+    def process(self, items):
+        """Yield one result dict per item, in completion order.
+
+        With metadata packing, an item's image PUT starts as soon as it is
+        analyzed, while its metadata waits for the other analyses and goes
+        to the packer with them (up to a full pack at a time). The records
+        of a batch then share packs instead of one pack per round of
+        BATCH_UPLOAD_CONCURRENCY uploads.
+        """
+        analysis_pool, upload_pool = _get_pools()
+        packer = self.storage.metadata_packer
+        pending = {}
+        # Identical files within one batch are analyzed and uploaded once
+        duplicates = {}
+        analyzing = 0
+        # Packing only: analyzed items whose metadata is not with the packer yet,
+        # and the finished parts (image, metadata) of each item
+        to_pack = []
+        parts = {}
+
+        try:
+            for item in items:
+                if item.error is not None:
+                    yield self._result(item, error=item.error)
+                    continue
+
+                existing = self.upload_index.get(item.digest)
+                if existing:
+                    yield self._result(item, existing, existing["metadata"], deduplicated=True)
+                    continue
+
+                if item.digest in duplicates:
+                    duplicates[item.digest].append(item)
+                    continue
+                duplicates[item.digest] = []
+
+                future = analysis_pool.submit(_analyze_path, item.temp_path, secure_filename(item.filename))
+                pending[future] = ("analyze", item, None)
+                analyzing += 1
+
+            while pending or to_pack:
+                if to_pack and (analyzing == 0 or len(to_pack) >= packer.max_records):
+                    records = [json.dumps(metadata).encode('utf-8') for _, metadata in to_pack]
+                    for (entry, metadata), packed in zip(to_pack, packer.add_many(records)):
+                        pending[packed] = ("metadata", entry, metadata)
+                    to_pack = []
+
+                future = next(as_completed(pending))
+                stage, item, metadata = pending.pop(future)
+                if stage == "analyze":
+                    analyzing -= 1
+                try:
+                    result = future.result()
+                except Exception as e:
+                    # Once one part of an item failed, its other part is ignored
+                    if parts.get(item.index, {}) is not None:
+                        for entry in [item] + duplicates[item.digest]:
+                            yield self._result(entry, error=e)
+                    parts[item.index] = None
+                    continue
+
+                if stage == "analyze" and packer is None:
+                    upload_future = upload_pool.submit(self._upload, item, result)
+                    pending[upload_future] = ("upload", item, result)
+                    continue
+                if stage == "analyze":
+                    parts[item.index] = {}
+                    pending[upload_pool.submit(self._put_image, item)] = ("image", item, result)
+                    to_pack.append((item, result))
+                    continue
+
+                if stage in ("image", "metadata"):
+                    if parts[item.index] is None:
+                        continue
+                    parts[item.index][stage] = result
+                    if len(parts[item.index]) < 2:
+                        continue
+                    done = parts.pop(item.index)
+                    try:
+                        result = self._packed_result(item, metadata, done["image"], done["metadata"])
+                    except Exception as e:
+                        for entry in [item] + duplicates[item.digest]:
+                            yield self._result(entry, error=e)
+                        continue
+
+                yield self._result(item, result, metadata)
+                for entry in duplicates[item.digest]:
+                    yield self._result(entry, result, metadata, deduplicated=True)
+        finally:
+            for item in items:
+                if item.temp_path and os.path.exists(item.temp_path):
+                    os.remove(item.temp_path)
@@ -0,0 +1,75 @@
+#!/usr/bin/env python3
+"""
+Micro-benchmark: header-only probing vs the previous analysis path
+
+Compares, on a large PNG and a multi-frame GIF:
+- legacy: Image.open on the path (handle never closed) + a second full read
+- probe:  ImageAnalyzer.probe_image (header only, closed deterministically)
+- decode: counting frames by decoding each one, what a naive frame count costs
+
+Run from the repository root:
+    python -m benchmarks.bench_image_probe
+"""
+
+import os
+import tempfile
+import time
+from PIL import Image, ImageSequence
+from image_analyzer import ImageAnalyzer
+
+ROUNDS = 20
+
+
+def make_large_png(path, size=(4000, 4000)):
+    noise = Image.effect_noise(size, 64).convert('RGB')
+    noise.save(path, 'PNG')
+
+
+def make_multiframe_gif(path, frames=120, size=(800, 600)):
+    images = [Image.effect_noise(size, 32 + i % 64).convert('P') for i in range(frames)]
+    images[0].save(path, 'GIF', save_all=True, append_images=images[1:], duration=40, loop=0)
+
+
+def legacy_analyze(path):
+    img = Image.open(path)
+    with open(path, 'rb') as img_file:
+        image_data = img_file.read()
+    return img.format, img.size, img.mode, len(image_data)
+
+
+def probe_analyze(analyzer, path):
+    with open(path, 'rb') as f:
+        return analyzer.probe_image(f)
+
+
+def decode_frames(path):
+    with Image.open(path) as img:
+        return sum(1 for frame in ImageSequence.Iterator(img) if frame.load() is not None)
+
+
+def timed(fn, *args):
+    start = time.perf_counter()
+    for _ in range(ROUNDS):
+        fn(*args)
+    return (time.perf_counter() - start) / ROUNDS * 1000
+
+
+def main():
+    analyzer = ImageAnalyzer()
+    with tempfile.TemporaryDirectory() as tmp:
+        png_path = os.path.join(tmp, 'large.png')
+        gif_path = os.path.join(tmp, 'animated.gif')
+        print("Generating test images...")
+        make_large_png(png_path)
+        make_multiframe_gif(gif_path)
+
+        for label, path in (("4000x4000 PNG", png_path), ("120-frame GIF", gif_path)):
+            print(f"\n=== {label} ({os.path.getsize(path) / 1024 / 1024:.1f} MB) ===")
+            print(f"legacy open + read : {timed(legacy_analyze, path):8.2f} ms")
+            print(f"header probe       : {timed(probe_analyze, analyzer, path):8.2f} ms")
+            print(f"decode all frames  : {timed(decode_frames, path):8.2f} ms")
+            print(f"probe result       : {probe_analyze(analyzer, path)['n_frames']} frame(s)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,368 @@
+#!/usr/bin/env python3
+"""
+Load benchmark: the production server against local Walrus and Gemini stand-ins
+
+Starts benchmarks.fake_services and serve.py (one gunicorn worker, throwaway
+DATA_DIR), then drives each scenario at each concurrency level:
+- upload:   POST /analyze/image with distinct noise PNGs
+- image:    GET /image/<id> of the uploaded images
+- metadata: GET /metadata/<id> of the uploaded images
+- chat:     POST /chat, one session per client thread
+
+For every run it reports throughput, p50/p95/p99 latency, errors and the
+server's resident memory as JSON. With --baseline it compares against a
+previous report and exits non-zero on a regression.
+
+Run from the repository root:
+    python -m benchmarks.bench_load --concurrency 1,16 --requests 200 --output bench.json
+    python -m benchmarks.bench_load --walrus-latency 0.2 --walrus-error-rate 0.05 --baseline bench.json
+"""
+
+import argparse
+import io
+import json
+import os
+import platform
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+import requests
+from PIL import Image
+
+SCENARIOS = ("upload", "image", "metadata", "chat")
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def wait_for(url, process, timeout=30):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if process.poll() is not None:
+            raise Exception(f"Process exited with code {process.returncode} before {url} came up")
+        try:
+            requests.get(url, timeout=1)
+            return
+        except requests.RequestException:
+            time.sleep(0.1)
+    raise Exception(f"Timed out waiting for {url}")
+
+
+def process_tree(pid):
+    """pid and all its descendants, read from /proc"""
+    children = {}
+    for entry in os.listdir("/proc"):
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f"/proc/{entry}/stat") as f:
+                ppid = int(f.read().rsplit(")", 1)[1].split()[1])
+        except (OSError, IndexError, ValueError):
+            continue
+        children.setdefault(ppid, []).append(int(entry))
+    pids, pending = [], [pid]
+    while pending:
+        current = pending.pop()
+        pids.append(current)
+        pending.extend(children.get(current, []))
+    return pids
+
+
+def memory_mb(pid):
+    """Current (VmRSS) and peak (VmHWM) resident memory of a process tree in MB"""
+    totals = {"VmRSS": 0, "VmHWM": 0}
+    for child in process_tree(pid):
+        try:
+            with open(f"/proc/{child}/status") as f:
+                for line in f:
+                    key, _, value = line.partition(":")
+                    if key in totals:
+                        totals[key] += int(value.split()[0])
+        except OSError:
+            continue
+    return round(totals["VmRSS"] / 1024, 1), round(totals["VmHWM"] / 1024, 1)
+
+
+def reset_peak_memory(pid):
+    """Reset VmHWM so each run reports its own peak (Linux 4.0+, best effort)"""
+    for child in process_tree(pid):
+        try:
+            with open(f"/proc/{child}/clear_refs", "w") as f:
+                f.write("5")
+        except OSError:
+            pass
+
+
+def make_png(seed, size):
+    """A noise PNG of size x size pixels, distinct per seed so uploads never deduplicate"""
+    image = Image.effect_noise((size, size), 64).convert("RGB")
+    image.putpixel((0, 0), (seed % 256, seed // 256 % 256, seed // 65536 % 256))
+    buffer = io.BytesIO()
+    image.save(buffer, "PNG")
+    return buffer.getvalue()
+
+
+def percentile(values, p):
+    if not values:
+        return None
+    index = min(len(values) - 1, max(0, int(round(p / 100 * len(values))) - 1))
+    return round(values[index] * 1000, 2)
+
+
+class LoadRunner:
+    """Runs one scenario at a fixed concurrency with a keep-alive session per client thread"""
+
+    def __init__(self, base_url, server_pid):
+        self.base_url = base_url
+        self.server_pid = server_pid
+        self._local = threading.local()
+
+    def session(self):
+        if not hasattr(self._local, "session"):
+            self._local.session = requests.Session()
+            self._local.state = {}
+        return self._local.session, self._local.state
+
+    def run(self, name, call, items, concurrency):
+        latencies, errors, results = [], [], []
+        lock = threading.Lock()
+
+        def one(item):
+            session, state = self.session()
+            start = time.perf_counter()
+            try:
+                result = call(session, state, item)
+                error = None
+            except Exception as e:
+                result, error = None, str(e)
+            elapsed = time.perf_counter() - start
+            with lock:
+                latencies.append(elapsed)
+                if error:
+                    errors.append(error)
+                else:
+                    results.append(result)
+
+        reset_peak_memory(self.server_pid)
+        rss_start, _ = memory_mb(self.server_pid)
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            list(pool.map(one, items))
+        duration = time.perf_counter() - started
+        rss_end, rss_peak = memory_mb(self.server_pid)
+
+        latencies.sort()
+        report = {
+            "scenario": name,
+            "concurrency": concurrency,
+            "requests": len(latencies),
+            "errors": len(errors),
+            "duration_s": round(duration, 3),
+            "throughput_rps": round(len(latencies) / duration, 2) if duration else None,
+            "latency_ms": {
+                "p50": percentile(latencies, 50),
+                "p95": percentile(latencies, 95),
+                "p99": percentile(latencies, 99),
+                "mean": round(sum(latencies) / len(latencies) * 1000, 2) if latencies else None,
+                "max": percentile(latencies, 100)
+            },
+            "memory_mb": {"rss_start": rss_start, "rss_end": rss_end, "peak": rss_peak}
+        }
+        if errors:
+            report["sample_errors"] = sorted(set(errors))[:5]
+        return report, results
+
+
+def check(response, status=200):
+    if response.status_code != status:
+        raise Exception(f"HTTP {response.status_code}: {response.text[:200]}")
+    return response
+
+
+def upload(base_url):
+    def call(session, state, image):
+        response = check(session.post(f"{base_url}/analyze/image", files={"image": ("bench.png", image, "image/png")}))
+        body = response.json()
+        return body["image_blob_id"], body["metadata_blob_id"]
+    return call
+
+
+def get_image(base_url):
+    def call(session, state, blob_id):
+        return len(check(session.get(f"{base_url}/image/{blob_id}")).content)
+    return call
+
+
+def get_metadata(base_url):
+    def call(session, state, blob_id):
+        return check(session.get(f"{base_url}/metadata/{blob_id}")).json()
+    return call
+
+
+def chat(base_url):
+    def call(session, state, i):
+        payload = {"message": f"Tell me about brushwork in painting number {i}."}
+        if "session_id" in state:
+            payload["session_id"] = state["session_id"]
+        body = check(session.post(f"{base_url}/chat", json=payload)).json()
+        state["session_id"] = body.get("session_id")
+        return body
+    return call
+
+
+def compare(reports, baseline, tolerance):
+    """Regressions of p95 latency or throughput beyond `tolerance` against a baseline report"""
+    previous = {(r["scenario"], r["concurrency"]): r for r in baseline["runs"]}
+    regressions = []
+    for run in reports:
+        before = previous.get((run["scenario"], run["concurrency"]))
+        if not before:
+            continue
+        label = f"{run['scenario']} @ {run['concurrency']}"
+        if before["latency_ms"]["p95"] and run["latency_ms"]["p95"] > before["latency_ms"]["p95"] * (1 + tolerance):
+            regressions.append(f"{label}: p95 {before['latency_ms']['p95']} -> {run['latency_ms']['p95']} ms")
+        if before["throughput_rps"] and run["throughput_rps"] < before["throughput_rps"] * (1 - tolerance):
+            regressions.append(f"{label}: throughput {before['throughput_rps']} -> {run['throughput_rps']} req/s")
+        if run["errors"] > before["errors"]:
+            regressions.append(f"{label}: errors {before['errors']} -> {run['errors']}")
+    return regressions
+
+
+def git_revision():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS), help="comma-separated subset of " + ", ".join(SCENARIOS))
+    parser.add_argument("--concurrency", default="1,16", help="comma-separated client thread counts")
+    parser.add_argument("--requests", type=int, default=200, help="requests per scenario and concurrency level")
+    parser.add_argument("--image-size", type=int, default=256, help="edge of the uploaded noise PNGs in pixels")
+    parser.add_argument("--walrus-latency", type=float, default=0.05)
+    parser.add_argument("--walrus-jitter", type=float, default=0.01)
+    parser.add_argument("--walrus-error-rate", type=float, default=0.0)
+    parser.add_argument("--gemini-latency", type=float, default=0.3)
+    parser.add_argument("--gemini-jitter", type=float, default=0.05)
+    parser.add_argument("--gemini-error-rate", type=float, default=0.0)
+    parser.add_argument("--gemini-reply-chars", type=int, default=400)
+    parser.add_argument("--web-threads", type=int, default=32, help="gunicorn threads of the single worker")
+    parser.add_argument("--blob-cache", action="store_true", help="serve /image reads from the blob cache")
+    parser.add_argument("--output", help="write the JSON report here instead of stdout")
+    parser.add_argument("--baseline", help="previous JSON report to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.15, help="allowed relative regression")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    scenarios = [s.strip() for s in args.scenarios.split(",") if s.strip()]
+    unknown = set(scenarios) - set(SCENARIOS)
+    if unknown:
+        sys.exit(f"Unknown scenario(s): {', '.join(sorted(unknown))}")
+    levels = [int(c) for c in args.concurrency.split(",")]
+
+    walrus_port, gemini_port, app_port = free_port(), free_port(), free_port()
+    processes = []
+    with tempfile.TemporaryDirectory() as data_dir:
+        try:
+            fakes = subprocess.Popen([
+                sys.executable, "-m", "benchmarks.fake_services",
+                "--walrus-port", str(walrus_port), "--gemini-port", str(gemini_port),
+                "--walrus-latency", str(args.walrus_latency), "--walrus-jitter", str(args.walrus_jitter),
+                "--walrus-error-rate", str(args.walrus_error_rate),
+                "--gemini-latency", str(args.gemini_latency), "--gemini-jitter", str(args.gemini_jitter),
+                "--gemini-error-rate", str(args.gemini_error_rate),
+                "--gemini-reply-chars", str(args.gemini_reply_chars)
+            ], cwd=ROOT, stdout=subprocess.DEVNULL)
+            processes.append(fakes)
+
+            walrus_url = f"http://127.0.0.1:{walrus_port}"
+            env = dict(
+                os.environ,
+                DATA_DIR=data_dir,
+                WALRUS_PUBLISHER_URL=walrus_url,
+                WALRUS_AGGREGATOR_URL=walrus_url,
+                WALRUS_AGGREGATOR_URLS=walrus_url,
+                GEMINI_API_ENDPOINT=f"http://127.0.0.1:{gemini_port}",
+                GEMINI_API_KEY=os.getenv("GEMINI_API_KEY", "bench-key"),
+                BLOB_CACHE_ENABLED="true" if args.blob_cache else "false",
+                BIND=f"127.0.0.1:{app_port}",
+                WEB_WORKERS="1",
+                WEB_THREADS=str(args.web_threads)
+            )
+            server = subprocess.Popen([sys.executable, "serve.py"], cwd=ROOT, env=env,
+                                      stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+            processes.append(server)
+
+            base_url = f"http://127.0.0.1:{app_port}"
+            wait_for(f"{walrus_url}/v1/blobs/ready", fakes)
+            wait_for(f"{base_url}/health", server)
+
+            runner = LoadRunner(base_url, server.pid)
+            # Images and metadata reads need stored blobs, so an upload pass always runs first
+            images = [make_png(i, args.image_size) for i in range(args.requests * (len(levels) + 1))]
+            _, blobs = runner.run("seed", upload(base_url), images[:args.requests], max(levels))
+            if not blobs:
+                raise Exception("Seeding uploads failed; is the server configured correctly?")
+
+            runs = []
+            for scenario in scenarios:
+                for n, concurrency in enumerate(levels):
+                    if scenario == "upload":
+                        chunk = images[(n + 1) * args.requests:(n + 2) * args.requests]
+                        report, _ = runner.run(scenario, upload(base_url), chunk, concurrency)
+                    elif scenario == "image":
+                        items = [blobs[i % len(blobs)][0] for i in range(args.requests)]
+                        report, _ = runner.run(scenario, get_image(base_url), items, concurrency)
+                    elif scenario == "metadata":
+                        items = [blobs[i % len(blobs)][1] for i in range(args.requests)]
+                        report, _ = runner.run(scenario, get_metadata(base_url), items, concurrency)
+                    else:
+                        report, _ = runner.run(scenario, chat(base_url), range(args.requests), concurrency)
+                    print(f"{scenario:>8} @ {concurrency:<3} {report['throughput_rps']:>8} req/s  "
+                          f"p95 {report['latency_ms']['p95']} ms  errors {report['errors']}", file=sys.stderr)
+                    runs.append(report)
+        finally:
+            for process in reversed(processes):
+                process.terminate()
+                try:
+                    process.wait(timeout=10)
+                except subprocess.TimeoutExpired:
+                    process.kill()
+
+    result = {
+        "revision": git_revision(),
+        "python": platform.python_version(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+        "settings": vars(args),
+        "runs": runs
+    }
+    output = json.dumps(result, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output + "\n")
+    else:
+        print(output)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(runs, json.load(f), args.tolerance)
+        for regression in regressions:
+            print(f"REGRESSION {regression}", file=sys.stderr)
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
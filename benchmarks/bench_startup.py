@@ -0,0 +1,78 @@
+#!/usr/bin/env python3
+"""
+Startup benchmark: how soon a fresh worker process can answer requests
+
+Each round starts a new interpreter, imports app and times:
+- import:  importing app (services are built lazily, on first use)
+- health:  first GET /health
+- blobs:   first GET /blobs (a storage route, builds the upload catalog)
+- eager:   building every remaining service, i.e. what startup used to pay
+Wall time is measured from process spawn to the first /health answer.
+
+Run from the repository root:
+    python -m benchmarks.bench_startup
+"""
+
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+ROUNDS = 5
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+PROBE = """
+import json, time
+start = time.perf_counter()
+import app
+imported = time.perf_counter()
+client = app.app.test_client()
+assert client.get('/health').status_code == 200
+healthy = time.perf_counter()
+healthy_at = time.time()
+assert client.get('/blobs').status_code == 200
+blobs = time.perf_counter()
+import services
+for service in (services.analyzer, services.walrus_storage, services.gemini_chat, services.upload_index,
+                services.similarity_index, services.variant_service):
+    service()
+services.gemini_chat().model
+eager = time.perf_counter()
+print(json.dumps({
+    "import": imported - start,
+    "health": healthy - imported,
+    "blobs": blobs - healthy,
+    "eager": eager - blobs,
+    "healthy_at": healthy_at
+}))
+"""
+
+
+def run_once(data_dir):
+    env = dict(os.environ, DATA_DIR=data_dir, GEMINI_API_KEY=os.getenv("GEMINI_API_KEY", "bench-key"))
+    spawned = time.time()
+    output = subprocess.run([sys.executable, "-c", PROBE], cwd=ROOT, env=env, capture_output=True, text=True,
+                            check=True).stdout
+    timings = json.loads(output.strip().splitlines()[-1])
+    timings["wall_to_health"] = timings.pop("healthy_at") - spawned
+    return {name: value * 1000 for name, value in timings.items()}
+
+
+def main():
+    results = []
+    with tempfile.TemporaryDirectory() as data_dir:
+        # Warm the OS file cache so every round measures the same thing
+        run_once(data_dir)
+        for _ in range(ROUNDS):
+            results.append(run_once(data_dir))
+
+    print(f"=== Startup over {ROUNDS} rounds (median ms) ===")
+    for name in ("import", "health", "blobs", "eager", "wall_to_health"):
+        print(f"{name:<15}: {statistics.median(r[name] for r in results):8.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,184 @@
+#!/usr/bin/env python3
+"""
+Local stand-ins for the Walrus publisher/aggregator and the Gemini REST API
+
+Both servers keep everything in memory and can be told to answer slowly,
+fail a fraction of requests with 503, or send large replies, so load tests
+run reproducibly without touching testnet or spending API quota.
+
+Run standalone (the load benchmark starts it for you):
+    python -m benchmarks.fake_services --walrus-port 9001 --gemini-port 9002 --walrus-latency 0.05
+"""
+
+import argparse
+import hashlib
+import json
+import random
+import re
+import threading
+import time
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+
+class Behaviour:
+    """Latency (mean +/- jitter, seconds) and error rate of a fake endpoint"""
+
+    def __init__(self, latency=0.0, jitter=0.0, error_rate=0.0):
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+
+    def delay(self):
+        if self.latency or self.jitter:
+            time.sleep(max(0.0, self.latency + random.uniform(-self.jitter, self.jitter)))
+
+    def should_fail(self):
+        return self.error_rate > 0 and random.random() < self.error_rate
+
+
+class FakeHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def send_body(self, status, body, content_type="application/json", headers=None):
+        self.send_response(status)
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        if self.command != "HEAD":
+            self.wfile.write(body)
+
+    def read_body(self):
+        """Read a request body sent with Content-Length or chunked encoding"""
+        if self.headers.get("Transfer-Encoding", "").lower() == "chunked":
+            parts = []
+            while True:
+                size = int(self.rfile.readline().split(b";")[0].strip(), 16)
+                if size == 0:
+                    self.rfile.readline()
+                    break
+                parts.append(self.rfile.read(size))
+                self.rfile.readline()
+            return b"".join(parts)
+        return self.rfile.read(int(self.headers.get("Content-Length", 0)))
+
+
+class FakeWalrusHandler(FakeHandler):
+    """PUT /v1/blobs stores a blob; GET/HEAD /v1/blobs/<id> reads it back (Range supported)"""
+
+    blobs = {}
+    lock = threading.Lock()
+    publisher = Behaviour()
+    aggregator = Behaviour()
+
+    def do_PUT(self):
+        data = self.read_body()
+        self.publisher.delay()
+        if self.publisher.should_fail():
+            return self.send_body(503, b'{"error": {"code": 503, "status": "UNAVAILABLE", "message": "fake outage"}}')
+        blob_id = hashlib.sha256(data).hexdigest()[:43]
+        with self.lock:
+            created = blob_id not in self.blobs
+            self.blobs[blob_id] = data
+        if created:
+            answer = {"newlyCreated": {"blobObject": {"blobId": blob_id, "id": "0x" + blob_id}}}
+        else:
+            answer = {"alreadyCertified": {"blobId": blob_id}}
+        self.send_body(200, json.dumps(answer).encode())
+
+    def do_GET(self):
+        self.aggregator.delay()
+        if self.aggregator.should_fail():
+            return self.send_body(503, b"fake outage", "text/plain")
+        blob_id = self.path.rsplit("/", 1)[-1]
+        with self.lock:
+            data = self.blobs.get(blob_id)
+        if data is None:
+            return self.send_body(404, b"blob not found", "text/plain")
+        # Single "bytes=start-end" ranges, as used for packed metadata records
+        match = re.fullmatch(r"bytes=(\d+)-(\d*)", self.headers.get("Range", ""))
+        if match:
+            start = int(match.group(1))
+            end = int(match.group(2)) if match.group(2) else len(data) - 1
+            if start >= len(data):
+                self.send_response(416)
+                self.send_header("Content-Range", f"bytes */{len(data)}")
+                self.send_header("Content-Length", "0")
+                return self.end_headers()
+            end = min(end, len(data) - 1)
+            return self.send_body(206, data[start:end + 1], "application/octet-stream",
+                                  {"Content-Range": f"bytes {start}-{end}/{len(data)}"})
+        self.send_body(200, data, "application/octet-stream")
+
+    do_HEAD = do_GET
+
+
+class FakeGeminiHandler(FakeHandler):
+    """POST /v1beta/models/<model>:generateContent (or :streamGenerateContent) answers with a canned reply"""
+
+    behaviour = Behaviour()
+    reply_chars = 400
+
+    def do_POST(self):
+        request = json.loads(self.read_body() or b"{}")
+        self.behaviour.delay()
+        if self.behaviour.should_fail():
+            return self.send_body(503, b'{"error": {"code": 503, "message": "fake overload"}}')
+        prompt_chars = sum(
+            len(part.get("text", ""))
+            for content in request.get("contents", [])
+            for part in content.get("parts", [])
+        )
+        text = ("Bellissimo! " * (self.reply_chars // 12 + 1))[:self.reply_chars]
+        answer = {
+            "candidates": [{"content": {"role": "model", "parts": [{"text": text}]}}],
+            "usageMetadata": {"promptTokenCount": prompt_chars // 4 + 1, "candidatesTokenCount": len(text) // 4 + 1}
+        }
+        # The SDK's REST transport reads a stream as a JSON array of chunks
+        body = [answer] if ":streamGenerateContent" in self.path else answer
+        self.send_body(200, json.dumps(body).encode())
+
+
+def start_server(handler, port=0):
+    """Serve handler on 127.0.0.1 in a daemon thread; returns the server"""
+    server = ThreadingHTTPServer(("127.0.0.1", port), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--walrus-port", type=int, default=9001)
+    parser.add_argument("--gemini-port", type=int, default=9002)
+    parser.add_argument("--walrus-latency", type=float, default=0.0, help="seconds per publisher/aggregator call")
+    parser.add_argument("--walrus-jitter", type=float, default=0.0)
+    parser.add_argument("--walrus-error-rate", type=float, default=0.0)
+    parser.add_argument("--gemini-latency", type=float, default=0.0, help="seconds per generateContent call")
+    parser.add_argument("--gemini-jitter", type=float, default=0.0)
+    parser.add_argument("--gemini-error-rate", type=float, default=0.0)
+    parser.add_argument("--gemini-reply-chars", type=int, default=400)
+    args = parser.parse_args()
+
+    walrus = Behaviour(args.walrus_latency, args.walrus_jitter, args.walrus_error_rate)
+    FakeWalrusHandler.publisher = walrus
+    FakeWalrusHandler.aggregator = walrus
+    FakeGeminiHandler.behaviour = Behaviour(args.gemini_latency, args.gemini_jitter, args.gemini_error_rate)
+    FakeGeminiHandler.reply_chars = args.gemini_reply_chars
+
+    start_server(FakeWalrusHandler, args.walrus_port)
+    start_server(FakeGeminiHandler, args.gemini_port)
+    print(f"fake walrus on :{args.walrus_port}, fake gemini on :{args.gemini_port}", flush=True)
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,326 @@
+import hashlib
+import os
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+
+
+class MemoryLRU:
+    """In-memory LRU cache bounded by the total size of the stored values"""
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.current_bytes = 0
+        self.evictions = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            data = self._entries.get(key)
+            if data is not None:
+                self._entries.move_to_end(key)
+            return data
+
+    def put(self, key, data):
+        # Values larger than the whole budget would just flush everything else
+        if len(data) > self.max_bytes:
+            return
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self.current_bytes -= len(previous)
+            self._entries[key] = data
+            self.current_bytes += len(data)
+            while self.current_bytes > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self.current_bytes -= len(evicted)
+                self.evictions += 1
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class DiskCache:
+    """On-disk blob store bounded by total size and entry age.
+
+    Entries are written atomically (temp file + rename) so several worker
+    processes can share the same directory. Recency is tracked through the
+    file mtime, which is refreshed on every hit. Once over budget, eviction
+    goes down to LOW_WATER of it, so the directory scan it takes runs
+    rarely rather than on every write.
+    """
+
+    LOW_WATER = 0.9
+
+    def __init__(self, directory, max_bytes, max_age=0, on_store=None):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        # Called as on_store(key, size) after an entry was written
+        self.on_store = on_store
+        self.evictions = 0
+        self._lock = threading.Lock()
+        os.makedirs(self.directory, exist_ok=True)
+        self.current_bytes = sum(size for _, size, _ in self._scan())
+
+    def _path(self, key):
+        digest = hashlib.sha256(key.encode('utf-8')).hexdigest()
+        return os.path.join(self.directory, digest[:2], digest)
+
+    def _scan(self):
+        """Yield (path, size, mtime) for every cached entry"""
+        for shard in os.scandir(self.directory):
+            if not shard.is_dir():
+                continue
+            for entry in os.scandir(shard.path):
+                if entry.name.startswith('.'):
+                    continue
+                try:
+                    stat = entry.stat()
+                except FileNotFoundError:
+                    continue
+                yield entry.path, stat.st_size, stat.st_mtime
+
+    def _is_expired(self, mtime):
+        return self.max_age > 0 and time.time() - mtime > self.max_age
+
+    def get_path(self, key):
+        """Return the file path of a fresh cached entry, or None"""
+        path = self._path(key)
+        try:
+            stat = os.stat(path)
+        except FileNotFoundError:
+            return None
+        if self._is_expired(stat.st_mtime):
+            self._remove(path, stat.st_size)
+            return None
+        try:
+            os.utime(path)
+        except FileNotFoundError:
+            return None
+        return path
+
+    def get(self, key):
+        path = self.get_path(key)
+        if path is None:
+            return None
+        try:
+            with open(path, 'rb') as f:
+                return f.read()
+        except FileNotFoundError:
+            return None
+
+    def put(self, key, data):
+        if len(data) > self.max_bytes:
+            return
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(path), prefix='.tmp-')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(data)
+            self._publish(key, temp_path, path, len(data))
+        except Exception:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            raise
+
+    def _publish(self, key, temp_path, path, size):
+        """Move a fully written temp file into place and account for it"""
+        try:
+            # Concurrent misses on the same blob rewrite the same entry
+            replaced = os.stat(path).st_size
+        except FileNotFoundError:
+            replaced = 0
+        os.replace(temp_path, path)
+        with self._lock:
+            self.current_bytes += size - replaced
+        if self.on_store is not None:
+            self.on_store(key, size)
+        if self.current_bytes > self.max_bytes:
+            self.evict()
+
+    def open_writer(self, key):
+        """Return a writer that streams an entry to disk and publishes it on commit()"""
+        return DiskCacheWriter(self, key)
+
+    def _remove(self, path, size):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            return
+        with self._lock:
+            self.current_bytes -= size
+            self.evictions += 1
+
+    def evict(self):
+        """Drop expired entries, then the least recently used ones down to the low-water mark"""
+        entries = sorted(self._scan(), key=lambda entry: entry[2])
+        with self._lock:
+            # Re-sync the size counter since other processes share the directory
+            self.current_bytes = sum(size for _, size, _ in entries)
+        target = self.max_bytes * self.LOW_WATER
+        for path, size, mtime in entries:
+            if self.current_bytes <= target and not self._is_expired(mtime):
+                break
+            self._remove(path, size)
+
+
+class DiskCacheWriter:
+    """Incrementally write one DiskCache entry without holding it in memory.
+
+    The entry only becomes visible on commit(); abort() (or exceeding the
+    cache budget) throws the partial file away.
+    """
+
+    def __init__(self, disk_cache, key):
+        self.disk_cache = disk_cache
+        self.key = key
+        self.path = disk_cache._path(key)
+        self.size = 0
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        fd, self.temp_path = tempfile.mkstemp(dir=os.path.dirname(self.path), prefix='.tmp-')
+        self._file = os.fdopen(fd, 'wb')
+
+    def write(self, chunk):
+        if self._file is None:
+            return
+        self.size += len(chunk)
+        if self.size > self.disk_cache.max_bytes:
+            self.abort()
+            return
+        self._file.write(chunk)
+
+    def commit(self):
+        if self._file is None:
+            return
+        self._file.close()
+        self._file = None
+        self.disk_cache._publish(self.key, self.temp_path, self.path, self.size)
+
+    def abort(self):
+        if self._file is None:
+            return
+        self._file.close()
+        self._file = None
+        if os.path.exists(self.temp_path):
+            os.remove(self.temp_path)
+
+
+class BlobCache:
+    """Two-tier read-through cache for immutable Walrus blobs.
+
+    Blob IDs are derived from blob content, so a cached entry never goes
+    stale; the only reasons to drop one are the size and age budgets.
+
+    With a shared store (see shared_state.py) the IDs of blobs written to
+    disk are recorded there, since disk entries are named by a hash of the
+    ID; warm() uses them to preload recently used blobs.
+    """
+
+    NAMESPACE = "blob_cache"
+
+    def __init__(self, directory, memory_bytes, disk_bytes, max_age=0, store=None):
+        self.store = store
+        self.memory = MemoryLRU(memory_bytes)
+        self.disk = DiskCache(directory, disk_bytes, max_age, on_store=self._remember if store else None)
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+    def get(self, blob_id):
+        data = self.memory.get(blob_id)
+        if data is not None:
+            self.memory_hits += 1
+            return data
+
+        data = self.disk.get(blob_id)
+        if data is not None:
+            self.disk_hits += 1
+            self.memory.put(blob_id, data)
+            return data
+
+        self.misses += 1
+        return None
+
+    def put(self, blob_id, data):
+        self.memory.put(blob_id, data)
+        self.disk.put(blob_id, data)
+
+    def get_path(self, blob_id):
+        """Return the on-disk path of a cached blob (for streaming it), or None"""
+        path = self.disk.get_path(blob_id)
+        if path is None:
+            self.misses += 1
+        else:
+            self.disk_hits += 1
+        return path
+
+    def open_writer(self, blob_id):
+        """Stream a blob into the disk tier; see DiskCacheWriter"""
+        return self.disk.open_writer(blob_id)
+
+    def _remember(self, blob_id, size):
+        try:
+            self.store.put(self.NAMESPACE, blob_id, {"size": size}, ttl=self.disk.max_age or None)
+        except Exception:
+            # The index only feeds warm(); never fail a cache write over it
+            pass
+
+    def warm(self, max_bytes, limit=10000):
+        """Load the most recently used disk entries into memory, up to max_bytes.
+
+        Returns the number of blobs loaded. Recency is the entry's mtime,
+        which every worker refreshes on a hit.
+        """
+        if self.store is None:
+            return 0
+        entries = []
+        for blob_id, _ in self.store.recent(self.NAMESPACE, limit):
+            path = self.disk._path(blob_id)
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:
+                continue
+            if not self.disk._is_expired(stat.st_mtime):
+                entries.append((stat.st_mtime, stat.st_size, blob_id, path))
+        selected = []
+        budget = min(max_bytes, self.memory.max_bytes)
+        for _, size, blob_id, path in sorted(entries, reverse=True):
+            if size <= budget:
+                selected.append((blob_id, path))
+                budget -= size
+        loaded = 0
+        # Oldest first, so the most recent blobs end up at the hot end of the LRU
+        for blob_id, path in reversed(selected):
+            try:
+                with open(path, 'rb') as f:
+                    self.memory.put(blob_id, f.read())
+            except FileNotFoundError:
+                continue
+            loaded += 1
+        return loaded
+
+    def get_or_fetch(self, blob_id, fetch):
+        """Return the cached blob, calling fetch(blob_id) and caching the result on a miss"""
+        data = self.get(blob_id)
+        if data is None:
+            data = fetch(blob_id)
+            self.put(blob_id, data)
+        return data
+
+    def stats(self):
+        lookups = self.memory_hits + self.disk_hits + self.misses
+        return {
+            "memory_hits": self.memory_hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "hit_ratio": (self.memory_hits + self.disk_hits) / lookups if lookups else 0.0,
+            "memory_entries": len(self.memory),
+            "memory_bytes": self.memory.current_bytes,
+            "memory_evictions": self.memory.evictions,
+            "disk_bytes": self.disk.current_bytes,
+            "disk_evictions": self.disk.evictions
+        }
@@ -0,0 +1,122 @@
+import threading
+import metrics
+
+SUMMARY_PROMPT = """Summarize the conversation below between an artist and Donatello, an art mentor helping them put artwork on the blockchain.
+Keep every fact the artist shared (names, artworks, blob IDs, URLs, sizes, formats), decisions made and open questions.
+Write at most {max_words} words in plain prose.
+
+{previous}Conversation:
+{transcript}"""
+
+
+def estimate_tokens(text):
+    """Cheap token estimate (about 4 characters per token), no API call"""
+    return len(text) // 4 + 1
+
+
+class ContextWindow:
+    """Caps how much chat history is sent to Gemini on each turn.
+
+    The most recent max_turns messages are sent verbatim; older ones are
+    folded into a rolling summary stored on the session. Folding happens in
+    batches so the summarization call is amortized over several turns, and
+    more is folded whenever the verbatim part exceeds token_budget. The full
+    transcript stays on the session for /chat/history.
+    """
+
+    def __init__(self, get_model, max_turns=12, token_budget=6000, fold_batch=6, summary_words=200):
+        # Called for the model on the first summary, so building it can be deferred
+        self.get_model = get_model
+        self.max_turns = max_turns
+        self.token_budget = token_budget
+        self.fold_batch = fold_batch
+        self.summary_words = summary_words
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.prompt_tokens = 0
+        self.response_tokens = 0
+        self.full_history_tokens = 0
+        self.summaries = 0
+        self.last_prompt_tokens = 0
+
+    def _pending(self, state):
+        return state.turns[state.summarized:]
+
+    def _fold_count(self, state):
+        """How many of the oldest unsummarized turns to fold now"""
+        pending = self._pending(state)
+        count = 0
+        if len(pending) >= self.max_turns + self.fold_batch:
+            count = len(pending) - self.max_turns
+        # Keep at least the last exchange verbatim, fold more if over budget
+        tokens = sum(estimate_tokens(text) for _, text in pending[count:])
+        while tokens > self.token_budget and count < len(pending) - 2:
+            tokens -= estimate_tokens(pending[count][1])
+            count += 1
+        # Fold whole exchanges so the verbatim part starts with a user turn
+        if count % 2:
+            count += 1
+        return min(count, max(len(pending) - 2, 0))
+
+    def compact(self, state):
+        """Fold old turns of a session into its rolling summary if needed.
+
+        Returns (summary, summarized) to store on the session, or None.
+        """
+        count = self._fold_count(state)
+        if count <= 0:
+            return None
+        folded = self._pending(state)[:count]
+        transcript = "\n".join(f"{role}: {text.strip()}" for role, text in folded)
+        previous = f"Summary so far:\n{state.summary}\n\n" if state.summary else ""
+        prompt = SUMMARY_PROMPT.format(max_words=self.summary_words, previous=previous, transcript=transcript)
+        try:
+            with metrics.stage("gemini_summary"):
+                summary = self.get_model().generate_content(prompt).text.strip()
+        except Exception:
+            # Sending a longer history beats failing the turn
+            return None
+        with self._lock:
+            self.summaries += 1
+        return summary, state.summarized + count
+
+    def build_history(self, system_prompt, state):
+        """Gemini history for a session: system prompt, summary, recent turns"""
+        history = [
+            {"role": "user", "parts": [system_prompt]},
+            {"role": "model", "parts": [state.greeting]}
+        ]
+        if state.summary:
+            history.append({"role": "user", "parts": [f"Summary of our conversation so far:\n{state.summary}"]})
+            history.append({"role": "model", "parts": ["Understood, I remember our conversation."]})
+        history.extend({"role": role, "parts": [text]} for role, text in self._pending(state))
+        return history
+
+    def record_usage(self, response, system_prompt, state):
+        """Track tokens per request, and what the full history would have cost"""
+        usage = getattr(response, 'usage_metadata', None)
+        prompt_tokens = getattr(usage, 'prompt_token_count', 0) or 0
+        response_tokens = getattr(usage, 'candidates_token_count', 0) or 0
+        full_tokens = estimate_tokens(system_prompt) + estimate_tokens(state.greeting) + sum(
+            estimate_tokens(text) for _, text in state.turns
+        )
+        with self._lock:
+            self.requests += 1
+            self.prompt_tokens += prompt_tokens
+            self.response_tokens += response_tokens
+            self.full_history_tokens += full_tokens
+            self.last_prompt_tokens = prompt_tokens
+        return {"prompt_tokens": prompt_tokens, "response_tokens": response_tokens}
+
+    def stats(self):
+        requests = self.requests or 1
+        return {
+            "requests": self.requests,
+            "summaries": self.summaries,
+            "prompt_tokens_total": self.prompt_tokens,
+            "response_tokens_total": self.response_tokens,
+            "prompt_tokens_per_request": self.prompt_tokens / requests,
+            "last_prompt_tokens": self.last_prompt_tokens,
+            # Estimated (chars / 4) prompt size had the whole history been resent
+            "full_history_tokens_per_request": self.full_history_tokens / requests
+        }
@@ -0,0 +1,300 @@
+from collections import OrderedDict
+import json
+import os
+import re
+import tempfile
+import threading
+import time
+import uuid
+
+SESSION_ID_PATTERN = re.compile(r'^[A-Za-z0-9_-]{1,64}$')
+SHARED_NAMESPACE = "chat_sessions"
+SHARED_TURNS_NAMESPACE = "chat_turns"
+
+
+class ChatSessionState:
+    """Compact per-session chat state: the greeting, (role, text) turns and a
+    rolling summary covering the first `summarized` turns"""
+
+    def __init__(self, session_id, greeting, turns=None, summary="", summarized=0, version=0, epoch=None):
+        self.session_id = session_id
+        self.greeting = greeting
+        self.turns = turns or []
+        self.summary = summary
+        self.summarized = summarized
+        # Bumped on every saved change, to spot a newer copy in the shared store
+        self.version = version
+        # Identifies this conversation across resets; shared turn rows are keyed by it
+        self.epoch = epoch or uuid.uuid4().hex
+        # Turns already written to the shared store
+        self.saved_turns = 0
+        self.size = len(greeting) + len(summary) + sum(len(text) for _, text in self.turns)
+        self.last_used = time.time()
+        # Serializes turns of one conversation; also marks the session as busy
+        self.lock = threading.Lock()
+
+    def append(self, role, text):
+        self.turns.append((role, text))
+        self.size += len(text)
+
+    def set_summary(self, summary, summarized):
+        self.size += len(summary) - len(self.summary)
+        self.summary = summary
+        self.summarized = summarized
+
+    def to_json(self):
+        return {
+            "session_id": self.session_id,
+            "greeting": self.greeting,
+            "turns": self.turns,
+            "summary": self.summary,
+            "summarized": self.summarized,
+            "version": self.version,
+            "epoch": self.epoch
+        }
+
+    def shared_header(self):
+        """Everything but the turns, which are stored one row each"""
+        return {
+            "session_id": self.session_id,
+            "greeting": self.greeting,
+            "summary": self.summary,
+            "summarized": self.summarized,
+            "version": self.version,
+            "epoch": self.epoch,
+            "turn_count": len(self.turns)
+        }
+
+    @classmethod
+    def from_json(cls, data):
+        return cls(
+            data["session_id"],
+            data["greeting"],
+            [tuple(turn) for turn in data["turns"]],
+            data.get("summary", ""),
+            data.get("summarized", 0),
+            data.get("version", 0),
+            data.get("epoch")
+        )
+
+
+class ChatSessionManager:
+    """Holds many independent chat sessions in memory.
+
+    Sessions idle for longer than idle_ttl are evicted, and the least recently
+    used ones go first when max_sessions or max_bytes (total characters of
+    history) is exceeded. With a spill directory, evicted sessions are
+    written to disk and transparently restored on their next use.
+
+    With a shared store (see shared_state.py) every change is written
+    through to it instead, and a session changed by another worker process
+    is reloaded on its next use, so conversations follow users across
+    workers. The store holds a small header per session (summary, version,
+    turn count) and one append-only row per turn, so a turn writes only
+    its own messages and a lookup reads the header, plus only the turns
+    this worker has not seen when the version moved on. Concurrent turns of
+    one session in two workers: last write wins.
+    """
+
+    def __init__(self, default_greeting, max_sessions=1000, max_bytes=64 * 1024 * 1024,
+                 idle_ttl=3600, spill_dir=None, spill_max_age=7 * 24 * 3600, store=None):
+        self.default_greeting = default_greeting
+        self.store = store
+        self.max_sessions = max_sessions
+        self.max_bytes = max_bytes
+        self.idle_ttl = idle_ttl
+        self.spill_dir = spill_dir
+        self.spill_max_age = spill_max_age
+        self.current_bytes = 0
+        self.evictions = 0
+        self.restored = 0
+        self._sessions = OrderedDict()
+        self._lock = threading.Lock()
+        if self.spill_dir:
+            os.makedirs(self.spill_dir, exist_ok=True)
+            self._purge_spilled()
+
+    def _validate(self, session_id):
+        if not SESSION_ID_PATTERN.match(session_id):
+            raise ValueError("session_id must be 1-64 letters, digits, '-' or '_'")
+
+    def _spill_path(self, session_id):
+        return os.path.join(self.spill_dir, f"{session_id}.json")
+
+    def _spill(self, state):
+        if not self.spill_dir:
+            return
+        fd, temp_path = tempfile.mkstemp(dir=self.spill_dir, prefix='.tmp-')
+        with os.fdopen(fd, 'w') as f:
+            json.dump(state.to_json(), f)
+        os.replace(temp_path, self._spill_path(state.session_id))
+
+    def _restore(self, session_id):
+        """Load a spilled session back from disk, or return None"""
+        if not self.spill_dir:
+            return None
+        path = self._spill_path(session_id)
+        try:
+            with open(path) as f:
+                data = json.load(f)
+            os.remove(path)
+        except (FileNotFoundError, ValueError):
+            return None
+        self.restored += 1
+        return ChatSessionState.from_json(data)
+
+    def _turn_key(self, session_id, epoch, index):
+        return f"{session_id}:{epoch}:{index}"
+
+    def _load_shared(self, session_id, local=None):
+        """The session as last saved by any worker, or None if missing or not newer than local"""
+        if self.store is None:
+            return None
+        header = self.store.get(SHARED_NAMESPACE, session_id)
+        if not header:
+            return None
+        if "turns" in header:
+            # Saved whole, before turns were stored one row each
+            state = ChatSessionState.from_json(header)
+            return state if local is None or state.version > local.version else None
+        if local is not None and header["version"] <= local.version:
+            return None
+
+        # Turns are append-only within an epoch: only fetch the ones not held locally
+        turns = list(local.turns) if local is not None and local.epoch == header["epoch"] else []
+        turns = turns[:header["turn_count"]]
+        for index in range(len(turns), header["turn_count"]):
+            turn = self.store.get(SHARED_TURNS_NAMESPACE, self._turn_key(session_id, header["epoch"], index))
+            # An expired row: keep the roles in step, the text is gone
+            turns.append(tuple(turn) if turn else (("user", "model")[index % 2], ""))
+        state = ChatSessionState(
+            session_id, header["greeting"], turns, header["summary"], header["summarized"],
+            header["version"], header["epoch"]
+        )
+        state.saved_turns = len(turns)
+        return state
+
+    def _save(self, state):
+        """Write a changed session through to the shared store: its new turns, then its header"""
+        if self.store is None:
+            return
+        with self._lock:
+            state.version += 1
+            header = state.shared_header()
+            new_turns = list(enumerate(state.turns[state.saved_turns:], start=state.saved_turns))
+            state.saved_turns = len(state.turns)
+        for index, turn in new_turns:
+            self.store.put(
+                SHARED_TURNS_NAMESPACE, self._turn_key(state.session_id, state.epoch, index), list(turn),
+                ttl=self.spill_max_age
+            )
+        self.store.put(SHARED_NAMESPACE, state.session_id, header, ttl=self.spill_max_age)
+
+    def _purge_spilled(self):
+        """Drop spilled sessions nobody came back for"""
+        cutoff = time.time() - self.spill_max_age
+        for entry in os.scandir(self.spill_dir):
+            try:
+                if entry.stat().st_mtime < cutoff:
+                    os.remove(entry.path)
+            except FileNotFoundError:
+                continue
+
+    def _add(self, state):
+        self._sessions[state.session_id] = state
+        self.current_bytes += state.size
+
+    def _evict(self):
+        """Evict idle sessions, then LRU ones until within budget (caller holds _lock)"""
+        now = time.time()
+        for session_id in list(self._sessions):
+            state = self._sessions[session_id]
+            over_budget = len(self._sessions) > self.max_sessions or self.current_bytes > self.max_bytes
+            if not over_budget and now - state.last_used <= self.idle_ttl:
+                break
+            # Never evict a session in the middle of a turn
+            if state.lock.locked():
+                continue
+            del self._sessions[session_id]
+            self.current_bytes -= state.size
+            self.evictions += 1
+            self._spill(state)
+
+    def get(self, session_id, create=True):
+        """Return the session state for session_id (a new ID when None)"""
+        shared = None
+        if session_id is None:
+            session_id = uuid.uuid4().hex
+        else:
+            self._validate(session_id)
+            with self._lock:
+                local = self._sessions.get(session_id)
+            shared = self._load_shared(session_id, local)
+
+        with self._lock:
+            state = self._sessions.get(session_id)
+            # Another worker moved the conversation on; never swap a session mid-turn
+            if shared is not None and (state is None or (shared.version > state.version and not state.lock.locked())):
+                if state is not None:
+                    del self._sessions[session_id]
+                    self.current_bytes -= state.size
+                else:
+                    self.restored += 1
+                state = shared
+                self._add(state)
+            if state is None:
+                state = self._restore(session_id)
+                if state is None:
+                    if not create:
+                        return None
+                    state = ChatSessionState(session_id, self.default_greeting)
+                self._add(state)
+
+            self._sessions.move_to_end(session_id)
+            state.last_used = time.time()
+            self._evict()
+            return state
+
+    def record_exchange(self, state, user_text, model_text):
+        """Append a user message and its reply to a session in one step"""
+        with self._lock:
+            state.append("user", user_text)
+            state.append("model", model_text)
+            if self._sessions.get(state.session_id) is state:
+                self.current_bytes += len(user_text) + len(model_text)
+        self._save(state)
+
+    def set_summary(self, state, summary, summarized):
+        """Store a new rolling summary on a session"""
+        with self._lock:
+            previous_size = state.size
+            state.set_summary(summary, summarized)
+            if self._sessions.get(state.session_id) is state:
+                self.current_bytes += state.size - previous_size
+        self._save(state)
+
+    def reset(self, session_id, greeting):
+        """Replace a session with an empty one that opens with greeting"""
+        self._validate(session_id)
+        header = self.store.get(SHARED_NAMESPACE, session_id) if self.store is not None else None
+        with self._lock:
+            previous = self._sessions.pop(session_id, None)
+            if previous is not None:
+                self.current_bytes -= previous.size
+            if self.spill_dir and os.path.exists(self._spill_path(session_id)):
+                os.remove(self._spill_path(session_id))
+            # Continue the version sequence so other workers pick up the reset
+            version = max(previous.version if previous else 0, header["version"] if header else 0)
+            state = ChatSessionState(session_id, greeting, version=version)
+            self._add(state)
+            self._evict()
+        self._save(state)
+        return state
+
+    def stats(self):
+        return {
+            "sessions": len(self._sessions),
+            "bytes": self.current_bytes,
+            "evictions": self.evictions,
+            "restored": self.restored
+        }
@@ -6,3 +6,142 @@ load_dotenv()
 # Walrus Configuration
 WALRUS_PUBLISHER_URL = os.getenv("WALRUS_PUBLISHER_URL", "https://publisher.walrus-testnet.walrus.space")
 WALRUS_AGGREGATOR_URL = os.getenv("WALRUS_AGGREGATOR_URL", "https://aggregator.walrus-testnet.walrus.space")
+
+# Serving threads per worker process (serve.py); async views get as many
+# threads for their blocking calls
+WEB_THREADS = int(os.getenv("WEB_THREADS", 32))
+
+# Local data directory for caches and indexes
+DATA_DIR = os.getenv("DATA_DIR", "./data")
+
+# Blob cache (memory LRU backed by an on-disk store)
+BLOB_CACHE_ENABLED = os.getenv("BLOB_CACHE_ENABLED", "true").lower() == "true"
+BLOB_CACHE_DIR = os.getenv("BLOB_CACHE_DIR", os.path.join(DATA_DIR, "blob_cache"))
+BLOB_CACHE_MEMORY_BYTES = int(os.getenv("BLOB_CACHE_MEMORY_BYTES", 64 * 1024 * 1024))
+BLOB_CACHE_DISK_BYTES = int(os.getenv("BLOB_CACHE_DISK_BYTES", 1024 * 1024 * 1024))
+BLOB_CACHE_MAX_AGE = int(os.getenv("BLOB_CACHE_MAX_AGE", 7 * 24 * 3600))  # seconds, 0 disables
+
+# Upload dedup index (content hash -> stored blobs), shared by all workers
+UPLOAD_INDEX_PATH = os.getenv("UPLOAD_INDEX_PATH", os.path.join(DATA_DIR, "upload_index.db"))
+
+# Local catalog of uploaded blobs backing GET /blobs
+UPLOAD_CATALOG_PATH = os.getenv("UPLOAD_CATALOG_PATH", os.path.join(DATA_DIR, "upload_catalog.db"))
+
+# Walrus uploads: image and metadata PUTs run concurrently on a shared pool
+WALRUS_UPLOAD_WORKERS = int(os.getenv("WALRUS_UPLOAD_WORKERS", 16))
+WALRUS_UPLOAD_ATTEMPTS = int(os.getenv("WALRUS_UPLOAD_ATTEMPTS", 3))
+WALRUS_UPLOAD_BACKOFF = float(os.getenv("WALRUS_UPLOAD_BACKOFF", 0.5))  # seconds, doubled per retry
+
+# Metadata packing (opt-in): metadata JSONs of concurrent uploads are stored
+# together as one pack blob and addressed as <pack_blob_id>:<offset>:<length>
+METADATA_PACK_ENABLED = os.getenv("METADATA_PACK_ENABLED", "false").lower() == "true"
+METADATA_PACK_MAX_RECORDS = int(os.getenv("METADATA_PACK_MAX_RECORDS", 64))
+METADATA_PACK_MAX_BYTES = int(os.getenv("METADATA_PACK_MAX_BYTES", 1024 * 1024))
+METADATA_PACK_MAX_DELAY = float(os.getenv("METADATA_PACK_MAX_DELAY", 0.1))  # seconds a record waits for others
+
+# Walrus HTTP transport: keep-alive connections per endpoint (enough for every
+# serving thread plus the upload pool), timeouts, GET retries and circuit breaker
+WALRUS_POOL_SIZE = int(os.getenv("WALRUS_POOL_SIZE", WEB_THREADS + WALRUS_UPLOAD_WORKERS))
+WALRUS_CONNECT_TIMEOUT = float(os.getenv("WALRUS_CONNECT_TIMEOUT", 5))  # seconds
+WALRUS_READ_TIMEOUT = float(os.getenv("WALRUS_READ_TIMEOUT", 30))  # seconds
+WALRUS_GET_ATTEMPTS = int(os.getenv("WALRUS_GET_ATTEMPTS", 3))
+WALRUS_GET_BACKOFF = float(os.getenv("WALRUS_GET_BACKOFF", 0.2))  # seconds, jittered and doubled per retry
+WALRUS_BREAKER_THRESHOLD = int(os.getenv("WALRUS_BREAKER_THRESHOLD", 5))  # consecutive failures
+WALRUS_BREAKER_RESET = float(os.getenv("WALRUS_BREAKER_RESET", 30))  # seconds before a probe call
+
+# Walrus reads: comma-separated aggregators to fail over between (defaults to
+# WALRUS_AGGREGATOR_URL) and hedged GETs once a read is slower than the p95
+WALRUS_AGGREGATOR_URLS = [
+    url.strip() for url in os.getenv("WALRUS_AGGREGATOR_URLS", WALRUS_AGGREGATOR_URL).split(",") if url.strip()
+]
+WALRUS_HEDGE_ENABLED = os.getenv("WALRUS_HEDGE_ENABLED", "true").lower() == "true"
+WALRUS_HEDGE_MIN_DELAY = float(os.getenv("WALRUS_HEDGE_MIN_DELAY", 0.05))  # seconds
+WALRUS_HEDGE_DEFAULT_DELAY = float(os.getenv("WALRUS_HEDGE_DEFAULT_DELAY", 1.0))  # seconds, until p95 is known
+WALRUS_LATENCY_WINDOW = int(os.getenv("WALRUS_LATENCY_WINDOW", 200))  # recent reads per aggregator
+
+# Batch uploads (/analyze/images)
+BATCH_MAX_FILES = int(os.getenv("BATCH_MAX_FILES", 100))
+BATCH_ANALYSIS_WORKERS = int(os.getenv("BATCH_ANALYSIS_WORKERS", os.cpu_count() or 1))
+BATCH_UPLOAD_CONCURRENCY = int(os.getenv("BATCH_UPLOAD_CONCURRENCY", 4))
+
+# Largest accepted request body; uploads are streamed, so this does not bound memory
+MAX_UPLOAD_BYTES = int(os.getenv("MAX_UPLOAD_BYTES", 256 * 1024 * 1024))
+
+# Uploads up to this size stay in memory; larger ones are spooled to a temp file
+UPLOAD_SPOOL_MAX_MEMORY = int(os.getenv("UPLOAD_SPOOL_MAX_MEMORY", 4 * 1024 * 1024))
+
+# Image analysis: images whose header claims more pixels than this are rejected
+IMAGE_MAX_PIXELS = int(os.getenv("IMAGE_MAX_PIXELS", 178956970))
+IMAGE_FINGERPRINT_ENABLED = os.getenv("IMAGE_FINGERPRINT_ENABLED", "true").lower() == "true"
+# Larger non-JPEG images are not fingerprinted (decoding them needs width x height x 4 bytes);
+# the default covers 4K UHD and 4096x4096 artwork
+IMAGE_FINGERPRINT_MAX_PIXELS = int(os.getenv("IMAGE_FINGERPRINT_MAX_PIXELS", 4096 * 4096))
+# How many full-size fingerprint decodes (non-JPEG over IMAGE_FINGERPRINT_INLINE_PIXELS) a process
+# runs at once; each needs up to IMAGE_FINGERPRINT_MAX_PIXELS x 4 bytes, others wait their turn
+IMAGE_FINGERPRINT_CONCURRENCY = int(os.getenv("IMAGE_FINGERPRINT_CONCURRENCY", 2))
+# /analyze/image fingerprints larger non-JPEG images after responding (a full decode
+# costs ~25 ms per megapixel); the default stays within ~20 ms
+IMAGE_FINGERPRINT_INLINE_PIXELS = int(os.getenv("IMAGE_FINGERPRINT_INLINE_PIXELS", 800 * 600))
+FINGERPRINT_JOB_QUEUE_PATH = os.getenv("FINGERPRINT_JOB_QUEUE_PATH", os.path.join(DATA_DIR, "fingerprint_jobs.db"))
+FINGERPRINT_JOB_SPOOL_DIR = os.getenv("FINGERPRINT_JOB_SPOOL_DIR", os.path.join(DATA_DIR, "fingerprint_uploads"))
+FINGERPRINT_JOB_WORKERS = int(os.getenv("FINGERPRINT_JOB_WORKERS", 1))
+
+# Near-duplicate search over perceptual hashes
+SIMILARITY_INDEX_PATH = os.getenv("SIMILARITY_INDEX_PATH", os.path.join(DATA_DIR, "similarity_index.db"))
+SIMILARITY_MAX_DISTANCE = int(os.getenv("SIMILARITY_MAX_DISTANCE", 10))  # Hamming distance, at most 16
+
+# Resized image variants (/image/<blob_id>/variant), cached on disk
+VARIANT_CACHE_DIR = os.getenv("VARIANT_CACHE_DIR", os.path.join(DATA_DIR, "variant_cache"))
+VARIANT_CACHE_BYTES = int(os.getenv("VARIANT_CACHE_BYTES", 512 * 1024 * 1024))
+VARIANT_CACHE_MAX_AGE = int(os.getenv("VARIANT_CACHE_MAX_AGE", 30 * 24 * 3600))  # seconds, 0 disables
+VARIANT_MAX_DIMENSION = int(os.getenv("VARIANT_MAX_DIMENSION", 2048))
+VARIANT_QUALITY = int(os.getenv("VARIANT_QUALITY", 80))
+
+# Gemini chat sessions (one conversation per session_id)
+CHAT_MAX_SESSIONS = int(os.getenv("CHAT_MAX_SESSIONS", 10000))
+CHAT_MAX_BYTES = int(os.getenv("CHAT_MAX_BYTES", 256 * 1024 * 1024))  # characters of history kept in memory
+CHAT_SESSION_IDLE_TTL = int(os.getenv("CHAT_SESSION_IDLE_TTL", 3600))  # seconds
+CHAT_SPILL_DIR = os.getenv("CHAT_SPILL_DIR", os.path.join(DATA_DIR, "chat_sessions"))  # empty disables spilling
+CHAT_CONTEXT_TURNS = int(os.getenv("CHAT_CONTEXT_TURNS", 12))  # messages sent verbatim
+CHAT_CONTEXT_TOKEN_BUDGET = int(os.getenv("CHAT_CONTEXT_TOKEN_BUDGET", 6000))  # estimated tokens of verbatim history
+CHAT_SUMMARY_BATCH = int(os.getenv("CHAT_SUMMARY_BATCH", 6))  # messages folded into the summary at once
+
+# Opt-in cache of Gemini artwork-analysis replies
+GEMINI_RESPONSE_CACHE_ENABLED = os.getenv("GEMINI_RESPONSE_CACHE_ENABLED", "false").lower() == "true"
+GEMINI_RESPONSE_CACHE_PATH = os.getenv("GEMINI_RESPONSE_CACHE_PATH", os.path.join(DATA_DIR, "response_cache.db"))
+GEMINI_RESPONSE_CACHE_TTL = int(os.getenv("GEMINI_RESPONSE_CACHE_TTL", 24 * 3600))  # seconds
+GEMINI_RESPONSE_CACHE_MAX_ENTRIES = int(os.getenv("GEMINI_RESPONSE_CACHE_MAX_ENTRIES", 10000))
+
+# Gemini API host override (e.g. a local stand-in for benchmarks); uses the REST transport
+GEMINI_API_ENDPOINT = os.getenv("GEMINI_API_ENDPOINT", "")
+
+# Background upload jobs (/analyze/image?async=true): durable queue, spooled
+# uploads, worker threads per process and retries through publisher outages
+JOB_QUEUE_PATH = os.getenv("JOB_QUEUE_PATH", os.path.join(DATA_DIR, "jobs.db"))
+JOB_SPOOL_DIR = os.getenv("JOB_SPOOL_DIR", os.path.join(DATA_DIR, "job_uploads"))
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", 4))
+JOB_MAX_ATTEMPTS = int(os.getenv("JOB_MAX_ATTEMPTS", 20))
+JOB_RETRY_BACKOFF = float(os.getenv("JOB_RETRY_BACKOFF", 5))  # seconds, doubled per retry
+JOB_RETRY_MAX_BACKOFF = float(os.getenv("JOB_RETRY_MAX_BACKOFF", 300))  # seconds
+JOB_LEASE_SECONDS = float(os.getenv("JOB_LEASE_SECONDS", 600))  # a job not finished by then is run again
+JOB_RETENTION_SECONDS = float(os.getenv("JOB_RETENTION_SECONDS", 7 * 24 * 3600))  # done/failed jobs are then deleted
+JOB_POLL_INTERVAL = float(os.getenv("JOB_POLL_INTERVAL", 1))  # seconds
+
+# Per-request span tracing (off by default); TRACE_EXPORTER is "log", "jsonl"
+# or "package.module:factory" for a custom exporter
+TRACE_ENABLED = os.getenv("TRACE_ENABLED", "false").lower() == "true"
+TRACE_SAMPLE_RATE = float(os.getenv("TRACE_SAMPLE_RATE", 1.0))
+TRACE_EXPORTER = os.getenv("TRACE_EXPORTER", "log")
+TRACE_JSONL_PATH = os.getenv("TRACE_JSONL_PATH", os.path.join(DATA_DIR, "traces.jsonl"))
+TRACE_QUEUE_SIZE = int(os.getenv("TRACE_QUEUE_SIZE", 10000))  # finished traces waiting for export; extra ones are dropped
+
+# State shared by worker processes (chat sessions, upload index, blob cache
+# index): "sqlite" (one file per host), "package.module:factory" for a custom
+# backend, or empty to keep chat sessions per process
+SHARED_STATE_BACKEND = os.getenv("SHARED_STATE_BACKEND", "sqlite")
+SHARED_STATE_PATH = os.getenv("SHARED_STATE_PATH", os.path.join(DATA_DIR, "shared_state.db"))
+
+# Pre-fork warm-up (serve.py): build services and load hot entries once in the
+# master so workers share them copy-on-write
+WARMUP_ENABLED = os.getenv("WARMUP_ENABLED", "true").lower() == "true"
+WARMUP_BLOB_CACHE_BYTES = int(os.getenv("WARMUP_BLOB_CACHE_BYTES", 32 * 1024 * 1024))  # recently used blobs preloaded into memory
@@ -1,18 +1,29 @@
-import google.generativeai as genai
 import os
-from dotenv import load_dotenv
+import textwrap
+import threading
+import time
+from chat_sessions import ChatSessionManager
+from chat_context import ContextWindow
+from response_cache import ResponseCache
+import metrics
+import config
+
+GREETING = "Greetings, fellow artist! I am Donatello, and I am here to help you bring your magnificent creations to the blockchain. Just as I once carved marble to reveal the beauty within, we shall now carve your digital legacy into the eternal blockchain! Tell me, what artistic vision shall we immortalize today? 🎨✨"
+WELCOME_BACK = "Welcome back, fellow artist! I am ready to help you create another masterpiece for the blockchain. What artistic vision shall we bring to life today? 🎨"
 
 class GeminiChat:
-    def __init__(self):
-        load_dotenv()
+    def __init__(self, session_store=None):
         api_key = os.getenv('GEMINI_API_KEY')
         if not api_key:
             raise ValueError("GEMINI_API_KEY not found in environment variables")
         
-        genai.configure(api_key=api_key)
-        self.model = genai.GenerativeModel('gemini-1.5-flash')
+        self.api_key = api_key
+        self.model_name = 'gemini-1.5-flash'
+        self._model = None
+        self._model_lock = threading.Lock()
         
-        # Donatello's personality system prompt
+        # Donatello's personality system prompt (dedented below, the
+        # indentation would otherwise be paid for in tokens on every turn)
         self.system_prompt = """
         You are Donatello, the legendary Renaissance sculptor and artist, brought to the modern age to help artists put their artwork onto the blockchain. You speak with the wisdom of centuries of artistic experience, but you've embraced modern technology to democratize art ownership.
 
@@ -46,79 +57,244 @@ class GeminiChat:
         - How it could appeal to collectors
         - Suggestions for NFT metadata and description
         """
+        self.system_prompt = textwrap.dedent(self.system_prompt).strip()
         
-        # Initialize chat with system prompt and Donatello's greeting
-        self.chat = self.model.start_chat(history=[
-            {
-                "role": "user",
-                "parts": [self.system_prompt]
-            },
-            {
-                "role": "model", 
-                "parts": ["Greetings, fellow artist! I am Donatello, and I am here to help you bring your magnificent creations to the blockchain. Just as I once carved marble to reveal the beauty within, we shall now carve your digital legacy into the eternal blockchain! Tell me, what artistic vision shall we immortalize today? 🎨✨"]
-            }
-        ])
+        # Each user gets their own conversation; all of them share the model
+        # and Donatello's system prompt. With a shared store sessions are kept
+        # there rather than spilled to a local directory.
+        self.sessions = ChatSessionManager(
+            default_greeting=GREETING,
+            max_sessions=config.CHAT_MAX_SESSIONS,
+            max_bytes=config.CHAT_MAX_BYTES,
+            idle_ttl=config.CHAT_SESSION_IDLE_TTL,
+            spill_dir=None if session_store is not None else config.CHAT_SPILL_DIR or None,
+            store=session_store
+        )
+
+        # Only the last turns go to Gemini verbatim, older ones as a summary
+        self.context = ContextWindow(
+            lambda: self.model,
+            max_turns=config.CHAT_CONTEXT_TURNS,
+            token_budget=config.CHAT_CONTEXT_TOKEN_BUDGET,
+            fold_batch=config.CHAT_SUMMARY_BATCH
+        )
+
+        # Opt-in cache for artwork-analysis replies, whose prompt is fully
+        # determined by the artwork details and the artist's message
+        self.response_cache = None
+        if config.GEMINI_RESPONSE_CACHE_ENABLED:
+            self.response_cache = ResponseCache(
+                config.GEMINI_RESPONSE_CACHE_PATH,
+                ttl=config.GEMINI_RESPONSE_CACHE_TTL,
+                max_entries=config.GEMINI_RESPONSE_CACHE_MAX_ENTRIES
+            )
+
+    @property
+    def model(self):
+        """The google-generativeai model, imported and configured on first use"""
+        if self._model is None:
+            with self._model_lock:
+                if self._model is None:
+                    import google.generativeai as genai
+                    if config.GEMINI_API_ENDPOINT:
+                        genai.configure(api_key=self.api_key, transport="rest",
+                                        client_options={"api_endpoint": config.GEMINI_API_ENDPOINT})
+                    else:
+                        genai.configure(api_key=self.api_key)
+                    self._model = genai.GenerativeModel(self.model_name)
+        return self._model
+
+    def _start_chat(self, state):
+        """Start a Gemini chat from a session's compact state"""
+        return self.model.start_chat(history=self.context.build_history(self.system_prompt, state))
     
-    def send_message(self, message: str, image_context: dict = None):
-        """Send a message to Gemini with optional image context"""
-        try:
-            # If image context is provided, enhance the message with artistic analysis prompt
-            if image_context:
-                enhanced_message = f"""
-                Maestro Donatello, please analyze this artwork with your expert eye:
-
-                Artist's message: {message}
-                
-                Artwork details:
-                - Title/Filename: {image_context.get('filename', 'Untitled Masterpiece')}
-                - Canvas size: {image_context.get('size', {}).get('width', 'N/A')} × {image_context.get('size', {}).get('height', 'N/A')} pixels
-                - Medium: {image_context.get('format', 'Digital')}
-                - File size: {image_context.get('file_size', 'N/A')} bytes
-                - Preserved on Walrus: {image_context.get('blob_id', 'N/A')}
-                - Gallery URL: {image_context.get('image_url', 'N/A')}
-                
-                Please provide your artistic assessment, suggestions for NFT creation, and guidance for the artist. Speak as the master Donatello helping a fellow creator.
-                """
-                message = enhanced_message
-            else:
-                # Add some Donatello flair to regular messages
-                message = f"Maestro Donatello, {message}"
+    def _build_prompt(self, message, image_context=None):
+        """Turn the artist's message into the prompt sent to Gemini"""
+        # If image context is provided, enhance the message with artistic analysis prompt
+        if image_context:
+            enhanced_message = f"""
+            Maestro Donatello, please analyze this artwork with your expert eye:
+
+            Artist's message: {message}
+            
+            Artwork details:
+            - Title/Filename: {image_context.get('filename', 'Untitled Masterpiece')}
+            - Canvas size: {image_context.get('size', {}).get('width', 'N/A')} × {image_context.get('size', {}).get('height', 'N/A')} pixels
+            - Medium: {image_context.get('format', 'Digital')}
+            - File size: {image_context.get('file_size', 'N/A')} bytes
+            - Preserved on Walrus: {image_context.get('blob_id', 'N/A')}
+            - Gallery URL: {image_context.get('image_url', 'N/A')}
             
-            response = self.chat.send_message(message)
+            Please provide your artistic assessment, suggestions for NFT creation, and guidance for the artist. Speak as the master Donatello helping a fellow creator.
+            """
+            return textwrap.dedent(enhanced_message).strip()
+        # Add some Donatello flair to regular messages
+        return f"Maestro Donatello, {message}"
+
+    def _error_message(self, error):
+        return f"Ah, fellow artist, it seems the divine inspiration has been interrupted: {str(error)}"
+
+    def _cached_reply(self, message, image_context, bypass_cache):
+        """Return (cache_key, cached reply or None) for an artwork-analysis prompt"""
+        if self.response_cache is None or not image_context:
+            return None, None
+        cache_key = ResponseCache.make_key(self.model_name, message)
+        if bypass_cache:
+            self.response_cache.bypass()
+            return cache_key, None
+        return cache_key, self.response_cache.get(cache_key)
+
+    def send_message(self, message: str, image_context: dict = None, session_id: str = None,
+                     stream: bool = False, bypass_cache: bool = False):
+        """Send a message to Gemini with optional image context.
+
+        A new session is started when session_id is None; the response
+        carries the session_id to use for follow-up messages. With
+        stream=True a generator of events is returned instead (see
+        _stream_reply). Artwork analyses may be answered from the response
+        cache unless bypass_cache is set; a bypassed call refreshes the entry.
+        """
+        state = self.sessions.get(session_id)
+        message = self._build_prompt(message, image_context)
+        cache_key, cached = self._cached_reply(message, image_context, bypass_cache)
+        if stream:
+            return self._stream_reply(state, message, cache_key, cached)
+
+        try:
+            # Turns of one session run one at a time; other sessions are unaffected
+            with state.lock:
+                if cached is not None:
+                    self.sessions.record_exchange(state, message, cached)
+                    return {
+                        "success": True,
+                        "response": cached,
+                        "message_id": len(state.turns) + 2,
+                        "session_id": state.session_id,
+                        "usage": {"prompt_tokens": 0, "response_tokens": 0},
+                        "cached": True
+                    }
+
+                summary = self.context.compact(state)
+                if summary:
+                    self.sessions.set_summary(state, *summary)
+                with metrics.stage("gemini_generate"):
+                    response = self._start_chat(state).send_message(message)
+                self.sessions.record_exchange(state, message, response.text)
+                usage = self.context.record_usage(response, self.system_prompt, state)
+                if cache_key:
+                    self.response_cache.put(cache_key, response.text)
+
             return {
                 "success": True,
                 "response": response.text,
-                "message_id": len(self.chat.history)
+                "message_id": len(state.turns) + 2,
+                "session_id": state.session_id,
+                "usage": usage,
+                "cached": False
             }
         except Exception as e:
             return {
                 "success": False,
-                "error": f"Ah, fellow artist, it seems the divine inspiration has been interrupted: {str(e)}"
+                "error": self._error_message(e)
             }
-    
-    def get_chat_history(self):
-        """Get the chat history (excluding system prompt)"""
-        # Skip the first two messages (system prompt and initial greeting)
-        chat_messages = self.chat.history[2:] if len(self.chat.history) > 2 else []
+
+    def _cancel_stream(self, response):
+        """Stop an in-flight streaming generation (best effort, the SDK has no public cancel)"""
+        iterator = getattr(response, '_iterator', None)
+        for method in ('cancel', 'close'):
+            stop = getattr(iterator, method, None)
+            if callable(stop):
+                try:
+                    stop()
+                except Exception:
+                    pass
+
+    def _stream_reply(self, state, message, cache_key=None, cached=None):
+        """Yield {"type": "session" | "token" | "done" | "error", ...} events.
+
+        The exchange is added to the session history only once the whole
+        reply has arrived. If the consumer stops early (client disconnect),
+        the upstream generation is cancelled and the history is untouched.
+        """
+        yield {"type": "session", "session_id": state.session_id}
+        with state.lock:
+            if cached is not None:
+                yield {"type": "token", "text": cached}
+                self.sessions.record_exchange(state, message, cached)
+                yield {
+                    "type": "done",
+                    "message_id": len(state.turns) + 2,
+                    "session_id": state.session_id,
+                    "usage": {"prompt_tokens": 0, "response_tokens": 0},
+                    "cached": True
+                }
+                return
+
+            response = None
+            completed = False
+            try:
+                summary = self.context.compact(state)
+                if summary:
+                    self.sessions.set_summary(state, *summary)
+                # Timed by hand: the stream outlives the request's trace context
+                started = time.perf_counter()
+                response = self._start_chat(state).send_message(message, stream=True)
+
+                parts = []
+                for chunk in response:
+                    try:
+                        text = chunk.text
+                    except ValueError:
+                        # Chunks without text parts (e.g. only safety ratings)
+                        continue
+                    if not parts:
+                        metrics.histogram("stage_seconds", stage="gemini_first_token").observe(time.perf_counter() - started)
+                    parts.append(text)
+                    yield {"type": "token", "text": text}
+                completed = True
+                metrics.histogram("stage_seconds", stage="gemini_stream").observe(time.perf_counter() - started)
+
+                reply = "".join(parts)
+                self.sessions.record_exchange(state, message, reply)
+                usage = self.context.record_usage(response, self.system_prompt, state)
+                if cache_key:
+                    self.response_cache.put(cache_key, reply)
+                yield {
+                    "type": "done",
+                    "message_id": len(state.turns) + 2,
+                    "session_id": state.session_id,
+                    "usage": usage,
+                    "cached": False
+                }
+            except Exception as e:
+                yield {"type": "error", "error": self._error_message(e)}
+            finally:
+                if response is not None and not completed:
+                    self._cancel_stream(response)
+
+    def get_chat_history(self, session_id: str):
+        """Get the chat history of a session (excluding system prompt)"""
+        state = self.sessions.get(session_id, create=False)
+        if state is None:
+            return []
         
         return [
             {
-                "role": msg.role,
-                "content": msg.parts[0].text if msg.parts else ""
+                "role": role,
+                "content": text
             }
-            for msg in chat_messages
+            for role, text in state.turns
         ]
     
-    def reset_chat(self):
-        """Reset the chat while maintaining Donatello's personality"""
-        self.chat = self.model.start_chat(history=[
-            {
-                "role": "user",
-                "parts": [self.system_prompt]
-            },
-            {
-                "role": "model", 
-                "parts": ["Welcome back, fellow artist! I am ready to help you create another masterpiece for the blockchain. What artistic vision shall we bring to life today? 🎨"]
-            }
-        ])
-        return {"success": True, "message": "Chat reset successfully"}
+    def get_stats(self):
+        """Session store and token usage metrics"""
+        return {
+            "sessions": self.sessions.stats(),
+            "context": self.context.stats(),
+            "response_cache": self.response_cache.stats() if self.response_cache else {"enabled": False}
+        }
+
+    def reset_chat(self, session_id: str):
+        """Reset a session's chat while maintaining Donatello's personality"""
+        self.sessions.reset(session_id, WELCOME_BACK)
+        return {"success": True, "message": "Chat reset successfully", "session_id": session_id}
@@ -1,54 +1,217 @@
 from PIL import Image
+import io
+import math
 import os
+import threading
 from datetime import datetime
 import json
+from image_fingerprint import compute_fingerprint
+import metrics
+import config
+
+# Fingerprinting a non-JPEG image decodes it at full size (about 4 bytes per
+# pixel, 64 MB for 4096x4096); these slots cap how many such decodes a process
+# runs at once, so their memory is bounded by the concurrency, not the traffic
+_full_decode_slots = threading.BoundedSemaphore(config.IMAGE_FINGERPRINT_CONCURRENCY)
+# Pillow keeps that many freed blocks for reuse: handed back to malloc, they
+# would linger in per-thread arenas and RSS would grow with the thread count
+Image.core.set_blocks_max(max(
+    Image.core.get_blocks_max(),
+    config.IMAGE_FINGERPRINT_CONCURRENCY
+    * (math.ceil(config.IMAGE_FINGERPRINT_MAX_PIXELS * 4 / Image.core.get_block_size()) + 2)
+))
 
 class ImageAnalyzer:
-    def __init__(self):
-        pass
+    def __init__(self, max_pixels=None, fingerprint=None, fingerprint_max_pixels=None,
+                 fingerprint_inline_pixels=None):
+        # Decompression-bomb budget: images claiming more pixels are rejected
+        # from their header, before any pixel data is touched
+        self.max_pixels = max_pixels or config.IMAGE_MAX_PIXELS
+        self.fingerprint = config.IMAGE_FINGERPRINT_ENABLED if fingerprint is None else fingerprint
+        # Largest image fingerprinted by analyze_file (except JPEG, which is
+        # decoded at reduced scale); keeps its memory use bounded
+        self.fingerprint_max_pixels = fingerprint_max_pixels or config.IMAGE_FINGERPRINT_MAX_PIXELS
+        # Largest non-JPEG image analyze_file fingerprints when asked to defer
+        # expensive fingerprints; bigger ones take a full decode
+        self.fingerprint_inline_pixels = fingerprint_inline_pixels or config.IMAGE_FINGERPRINT_INLINE_PIXELS
+
+    def _read_source(self, source):
+        """Read a path, bytes-like object or binary stream into (image_data, name)"""
+        if isinstance(source, (str, os.PathLike)):
+            with open(source, 'rb') as img_file:
+                return img_file.read(), os.path.basename(source)
+        if isinstance(source, bytes):
+            return source, None
+        if isinstance(source, (bytearray, memoryview)):
+            return bytes(source), None
+        if hasattr(source, 'read'):
+            name = getattr(source, 'name', None)
+            return source.read(), os.path.basename(name) if isinstance(name, str) else None
+        raise TypeError(f"Unsupported image source: {type(source).__name__}")
+
+    def _clean_info(self, info):
+        """Filter out any non-serializable values from image info"""
+        clean_info = {}
+        for key, value in info.items():
+            try:
+                # Test if the value is JSON serializable
+                json.dumps({key: value})
+                clean_info[key] = value
+            except (TypeError, ValueError):
+                # Skip non-serializable values
+                continue
+        return clean_info
+
+    def probe_image(self, fp):
+        """Read format, size, mode, frame count and info from the image header.
 
-    def analyze_image(self, image_path):
+        Pixel data is never decoded: Pillow only parses the header, frame
+        counts of animated GIF/WebP/PNG come from the container structure
+        without decoding frames, and the image is closed before returning.
+        """
+        try:
+            img_context = Image.open(fp)
+        except Image.DecompressionBombError as e:
+            raise Exception(f"Image exceeds the pixel budget: {str(e)}")
+
+        with img_context as img:
+            width, height = img.size
+            if width * height > self.max_pixels:
+                raise Exception(
+                    f"Image exceeds the pixel budget: {width}x{height} is more than {self.max_pixels} pixels"
+                )
+
+            # Read info before counting frames, GIF info changes per frame
+            clean_info = self._clean_info(img.info)
+            n_frames = getattr(img, 'n_frames', 1)
+
+            return {
+                "format": img.format,
+                "size": {
+                    "width": width,
+                    "height": height
+                },
+                "mode": img.mode,
+                "n_frames": n_frames,
+                "is_animated": n_frames > 1,
+                "image_info": clean_info
+            }
+
+    def _build_metadata(self, probe, filename, file_size):
+        # Ensure all values are JSON-serializable
+        metadata = {
+            "file_info": {
+                "filename": filename,
+                "format": probe["format"],
+                "size": probe["size"],
+                "mode": probe["mode"],
+                "n_frames": probe["n_frames"],
+                "is_animated": probe["is_animated"],
+                "file_size": file_size,
+                "analyzed_at": datetime.now().isoformat()
+            }
+        }
+
+        # Add image details if available
+        if probe["image_info"]:
+            metadata["file_info"]["image_info"] = probe["image_info"]
+        return metadata
+
+    def fingerprint_file(self, fp):
+        """Fingerprint an image from a seekable binary file, within the same limits as analyze_file.
+
+        The header is probed first, so images over max_pixels are rejected
+        and non-JPEG images over fingerprint_max_pixels raise ValueError
+        before any pixel data is decoded.
+        """
+        probe = self.probe_image(fp)
+        pixels = probe["size"]["width"] * probe["size"]["height"]
+        if probe["format"] != "JPEG" and pixels > self.fingerprint_max_pixels:
+            raise ValueError(
+                f"{probe['size']['width']}x{probe['size']['height']} {probe['format']} image is over "
+                f"the {self.fingerprint_max_pixels}-pixel fingerprint limit"
+            )
+        fp.seek(0)
+        with metrics.stage("fingerprint"):
+            return self._fingerprint(fp, probe)
+
+    def _fingerprint(self, fp, probe):
+        """compute_fingerprint, in a full-decode slot unless the image is JPEG or small"""
+        if probe["format"] == "JPEG" or probe["size"]["width"] * probe["size"]["height"] <= self.fingerprint_inline_pixels:
+            return compute_fingerprint(fp)
+        with _full_decode_slots:
+            return compute_fingerprint(fp)
+
+    def analyze_file(self, fp, filename=None, defer_fingerprint=False):
+        """Analyze an image from a seekable binary file without reading it into memory.
+
+        Only the header is parsed, so memory use does not grow with the file
+        size. The fingerprint decodes pixels and is skipped for images over
+        fingerprint_max_pixels, unless they are JPEG: Pillow decodes those
+        at reduced scale. A skipped fingerprint is recorded, with the reason,
+        as file_info.fingerprint_skipped. With defer_fingerprint, non-JPEG
+        images over fingerprint_inline_pixels are not fingerprinted either;
+        file_info.fingerprint_pending tells the caller to fingerprint_file
+        them later. Returns the metadata; fp is rewound for the upload.
+        """
+        try:
+            fp.seek(0, os.SEEK_END)
+            file_size = fp.tell()
+            fp.seek(0)
+
+            with metrics.stage("pil_analysis"):
+                probe = self.probe_image(fp)
+            name = getattr(fp, 'name', None)
+            metadata = self._build_metadata(
+                probe, filename or (os.path.basename(name) if isinstance(name, str) else None), file_size
+            )
+
+            pixels = probe["size"]["width"] * probe["size"]["height"]
+            if (self.fingerprint and defer_fingerprint and probe["format"] != "JPEG"
+                    and self.fingerprint_inline_pixels < pixels <= self.fingerprint_max_pixels):
+                # A full decode (hundreds of ms for 4K PNG/WebP) is left to the caller
+                metadata["file_info"]["fingerprint_pending"] = True
+            elif self.fingerprint and (probe["format"] == "JPEG" or pixels <= self.fingerprint_max_pixels):
+                fp.seek(0)
+                with metrics.stage("fingerprint"):
+                    metadata["file_info"]["fingerprint"] = self._fingerprint(fp, probe)
+            elif self.fingerprint:
+                # Without a fingerprint the image is invisible to similarity search
+                metadata["file_info"]["fingerprint_skipped"] = (
+                    f"{probe['size']['width']}x{probe['size']['height']} {probe['format']} image is over "
+                    f"the {self.fingerprint_max_pixels}-pixel fingerprint limit (IMAGE_FINGERPRINT_MAX_PIXELS)"
+                )
+
+            fp.seek(0)
+            return metadata
+
+        except Exception as e:
+            raise Exception(f"Failed to process image: {str(e)}")
+
+    def analyze_image(self, source, filename=None):
+        """Analyze an image given as a file path, bytes-like object or binary stream.
+
+        The image is read exactly once; Pillow parses it from memory, so
+        callers holding the upload in memory never need to write it to disk.
+        Only the fingerprint decodes pixels, and only down to a thumbnail.
+        """
         try:
-            # Load image with Pillow
-            img = Image.open(image_path)
-            
             # Get the original image data
-            with open(image_path, 'rb') as img_file:
-                image_data = img_file.read()
+            image_data, source_name = self._read_source(source)
+
+            # Probe the header with Pillow (BytesIO shares the bytes buffer, no copy)
+            with metrics.stage("pil_analysis"):
+                probe = self.probe_image(io.BytesIO(image_data))
 
             # Create metadata dictionary with Pillow information
-            # Ensure all values are JSON-serializable
-            metadata = {
-                "file_info": {
-                    "filename": os.path.basename(image_path),
-                    "format": img.format,
-                    "size": {
-                        "width": img.width,
-                        "height": img.height
-                    },
-                    "mode": img.mode,
-                    "file_size": len(image_data),
-                    "analyzed_at": datetime.now().isoformat()
-                }
-            }
+            metadata = self._build_metadata(probe, filename or source_name, len(image_data))
 
-            # Add image details if available (ensure they're JSON-serializable)
-            if hasattr(img, 'info'):
-                # Filter out any non-serializable values from image info
-                clean_info = {}
-                for key, value in img.info.items():
-                    try:
-                        # Test if the value is JSON serializable
-                        json.dumps({key: value})
-                        clean_info[key] = value
-                    except (TypeError, ValueError):
-                        # Skip non-serializable values
-                        continue
-                
-                if clean_info:
-                    metadata["file_info"]["image_info"] = clean_info
+            # Perceptual hashes and colour statistics for dedup and search
+            if self.fingerprint:
+                with metrics.stage("fingerprint"):
+                    metadata["file_info"]["fingerprint"] = self._fingerprint(io.BytesIO(image_data), probe)
 
             return metadata, image_data
 
         except Exception as e:
-            raise Exception(f"Failed to process image: {str(e)}")
\ No newline at end of file
+            raise Exception(f"Failed to process image: {str(e)}")
@@ -0,0 +1,97 @@
+from PIL import Image
+import numpy as np
+
+# Everything is computed from one small thumbnail, never from full resolution
+THUMBNAIL_SIZE = (128, 128)
+HASH_SIZE = 8
+PHASH_SIZE = 32
+HISTOGRAM_BINS = 16
+PALETTE_SIZE = 5
+
+
+def _dct_matrix(n):
+    """Orthonormal DCT-II basis, so a 2D DCT is two matrix products"""
+    k = np.arange(n)[:, None]
+    x = np.arange(n)[None, :]
+    matrix = np.cos(np.pi * (2 * x + 1) * k / (2 * n)) * np.sqrt(2.0 / n)
+    matrix[0] /= np.sqrt(2.0)
+    return matrix
+
+
+_DCT = _dct_matrix(PHASH_SIZE)
+
+
+def _bits_to_hex(bits):
+    return f"{int(''.join('1' if bit else '0' for bit in bits.ravel()), 2):016x}"
+
+
+def _grayscale(img, size):
+    return np.asarray(img.convert('L').resize(size, Image.BILINEAR), dtype=np.float32)
+
+
+def perceptual_hash(img):
+    """64-bit pHash: sign of the low-frequency DCT coefficients against their median"""
+    pixels = _grayscale(img, (PHASH_SIZE, PHASH_SIZE))
+    dct = _DCT @ pixels @ _DCT.T
+    low = dct[:HASH_SIZE, :HASH_SIZE].ravel()[1:]  # drop the DC term
+    bits = np.concatenate(([False], low > np.median(low)))
+    return _bits_to_hex(bits)
+
+
+def difference_hash(img):
+    """64-bit dHash: whether each pixel is brighter than its right neighbour"""
+    pixels = _grayscale(img, (HASH_SIZE + 1, HASH_SIZE))
+    return _bits_to_hex(pixels[:, 1:] > pixels[:, :-1])
+
+
+def color_histogram(rgb):
+    """Normalized per-channel histogram with HISTOGRAM_BINS bins"""
+    shift = 8 - int(np.log2(HISTOGRAM_BINS))
+    total = rgb.shape[0]
+    return {
+        channel: np.round(np.bincount(rgb[:, i] >> shift, minlength=HISTOGRAM_BINS) / total, 4).tolist()
+        for i, channel in enumerate(("r", "g", "b"))
+    }
+
+
+def dominant_colors(rgb, count=PALETTE_SIZE):
+    """Most common colours after quantizing to 4 bits per channel.
+
+    Each palette entry is the mean of the pixels that fell in its bin, so
+    colours stay true to the image instead of snapping to bin corners.
+    """
+    quantized = rgb >> 4
+    codes = (quantized[:, 0].astype(np.int32) << 8) | (quantized[:, 1].astype(np.int32) << 4) | quantized[:, 2]
+    counts = np.bincount(codes, minlength=4096)
+    top = np.argsort(counts)[::-1][:count]
+    top = top[counts[top] > 0]
+
+    palette = []
+    for code in top:
+        mean = rgb[codes == code].mean(axis=0).round().astype(int)
+        palette.append({
+            "hex": "#{:02x}{:02x}{:02x}".format(*mean),
+            "rgb": mean.tolist(),
+            "ratio": round(float(counts[code]) / rgb.shape[0], 4)
+        })
+    return palette
+
+
+def compute_fingerprint(fp):
+    """Compute perceptual hashes, dominant colours and a colour histogram.
+
+    fp is anything Image.open accepts. The image is downscaled with
+    Image.thumbnail, which lets JPEG decode at reduced scale (draft mode),
+    and all statistics come from vectorized NumPy over that thumbnail.
+    """
+    with Image.open(fp) as img:
+        img.thumbnail(THUMBNAIL_SIZE, reducing_gap=2.0)
+        thumbnail = img.convert('RGB')
+
+    rgb = np.asarray(thumbnail, dtype=np.uint8).reshape(-1, 3)
+    return {
+        "phash": perceptual_hash(thumbnail),
+        "dhash": difference_hash(thumbnail),
+        "dominant_colors": dominant_colors(rgb),
+        "histogram": color_histogram(rgb)
+    }
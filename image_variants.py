@@ -0,0 +1,106 @@
+from concurrent.futures import Future
+from PIL import Image
+import io
+import threading
+from blob_cache import DiskCache
+import config
+
+VARIANT_FORMATS = {
+    'webp': ('WEBP', 'image/webp'),
+    'jpeg': ('JPEG', 'image/jpeg'),
+    'jpg': ('JPEG', 'image/jpeg'),
+    'png': ('PNG', 'image/png')
+}
+
+
+class VariantService:
+    """Resized, re-encoded variants of stored images.
+
+    Variants are cached on disk (LRU bounded by size and age) under a key of
+    blob ID and parameters. Concurrent requests for the same variant share
+    a single render (single-flight) instead of decoding the original N times.
+    """
+
+    def __init__(self, storage, cache_dir, max_bytes, max_age=0):
+        self.storage = storage
+        self.cache = DiskCache(cache_dir, max_bytes, max_age)
+        self.hits = 0
+        self.misses = 0
+        self._inflight = {}
+        self._lock = threading.Lock()
+
+    def parse_params(self, width, height, fmt):
+        """Validate query parameters into (width, height, fmt); raises ValueError"""
+        width = int(width) if width else None
+        height = int(height) if height else None
+        if width is None and height is None:
+            raise ValueError("w or h is required")
+        for value in (width, height):
+            if value is not None and not 1 <= value <= config.VARIANT_MAX_DIMENSION:
+                raise ValueError(f"w and h must be between 1 and {config.VARIANT_MAX_DIMENSION}")
+        fmt = (fmt or 'webp').lower()
+        if fmt not in VARIANT_FORMATS:
+            raise ValueError("fmt must be one of: " + ", ".join(VARIANT_FORMATS))
+        return width, height, 'jpeg' if fmt == 'jpg' else fmt
+
+    def variant_key(self, blob_id, width, height, fmt):
+        return f"{blob_id}-{width or 0}x{height or 0}.{fmt}"
+
+    def get_variant(self, blob_id, width, height, fmt):
+        """Return (data, mimetype) of a variant, rendering it at most once at a time"""
+        key = self.variant_key(blob_id, width, height, fmt)
+        mimetype = VARIANT_FORMATS[fmt][1]
+
+        data = self.cache.get(key)
+        if data is not None:
+            self.hits += 1
+            return data, mimetype
+
+        with self._lock:
+            future = self._inflight.get(key)
+            leader = future is None
+            if leader:
+                future = Future()
+                self._inflight[key] = future
+
+        if leader:
+            self.misses += 1
+            try:
+                data = self._render(blob_id, width, height, fmt)
+                self.cache.put(key, data)
+                future.set_result(data)
+            except Exception as e:
+                future.set_exception(e)
+            finally:
+                with self._lock:
+                    self._inflight.pop(key, None)
+
+        return future.result(), mimetype
+
+    def _render(self, blob_id, width, height, fmt):
+        image_format = VARIANT_FORMATS[fmt][0]
+        target = (width or config.VARIANT_MAX_DIMENSION, height or config.VARIANT_MAX_DIMENSION)
+        original = self.storage.download_image(blob_id)
+
+        with Image.open(io.BytesIO(original)) as img:
+            if img.width * img.height > config.IMAGE_MAX_PIXELS:
+                raise Exception(f"Image exceeds the pixel budget: {img.width}x{img.height}")
+            # thumbnail keeps the aspect ratio, never upscales, and lets JPEG
+            # decode at reduced scale
+            img.thumbnail(target, reducing_gap=2.0)
+            if image_format == 'JPEG':
+                img = img.convert('RGB')
+            elif img.mode not in ('RGB', 'RGBA', 'L', 'LA'):
+                img = img.convert('RGBA')
+
+            output = io.BytesIO()
+            img.save(output, image_format, quality=config.VARIANT_QUALITY)
+            return output.getvalue()
+
+    def stats(self):
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "disk_bytes": self.cache.current_bytes,
+            "disk_evictions": self.cache.evictions
+        }
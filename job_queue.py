@@ -0,0 +1,241 @@
+import json
+import os
+import threading
+import time
+import uuid
+from sqlite_store import SQLiteStore
+import config
+
+
+class PermanentJobError(Exception):
+    """Raised by a job handler when retrying cannot help (e.g. not an image)"""
+
+
+class JobQueue(SQLiteStore):
+    """Durable queue of background upload jobs.
+
+    Jobs survive restarts: the uploaded file is kept in the spool directory
+    and the job row in SQLite until the job is done or has failed for good.
+    Workers claim jobs with a lease; a job whose worker died is picked up
+    again once its lease expires, unless it already had max_attempts (so a
+    job that kills its worker cannot loop forever). Finished jobs are
+    deleted retention seconds after they finished.
+    """
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS jobs (
+            id TEXT PRIMARY KEY,
+            status TEXT NOT NULL,
+            filename TEXT,
+            payload_path TEXT NOT NULL,
+            content_hash TEXT,
+            attempts INTEGER NOT NULL DEFAULT 0,
+            run_at REAL NOT NULL,
+            lease_until REAL,
+            result TEXT,
+            error TEXT,
+            created_at REAL NOT NULL,
+            updated_at REAL NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS jobs_status_run_at ON jobs (status, run_at);
+        CREATE INDEX IF NOT EXISTS jobs_status_updated_at ON jobs (status, updated_at);
+    """
+
+    def __init__(self, path, spool_dir, lease=None, max_attempts=None, retention=None):
+        super().__init__(path)
+        self.spool_dir = spool_dir
+        self.lease = lease or config.JOB_LEASE_SECONDS
+        self.max_attempts = max_attempts or config.JOB_MAX_ATTEMPTS
+        self.retention = config.JOB_RETENTION_SECONDS if retention is None else retention
+        os.makedirs(spool_dir, exist_ok=True)
+
+    def spool_path(self, job_id):
+        return os.path.join(self.spool_dir, f"{job_id}.upload")
+
+    def new_job_id(self):
+        return uuid.uuid4().hex
+
+    def enqueue(self, job_id, filename, content_hash=None):
+        """Queue a job whose upload has already been written to spool_path(job_id)"""
+        now = time.time()
+        self.execute(
+            """INSERT INTO jobs (id, status, filename, payload_path, content_hash, run_at, created_at, updated_at)
+            VALUES (?, 'queued', ?, ?, ?, ?, ?, ?)""",
+            (job_id, filename, self.spool_path(job_id), content_hash, now, now, now)
+        )
+
+    def claim(self):
+        """Take the next due job (or one with an expired lease) and lease it, or return None"""
+        now = time.time()
+        self._fail_abandoned(now)
+        row = self.execute(
+            """UPDATE jobs SET status = 'running', attempts = attempts + 1,
+                lease_until = ?, updated_at = ?
+            WHERE id = (
+                SELECT id FROM jobs
+                WHERE (status = 'queued' AND run_at <= ?)
+                   OR (status = 'running' AND lease_until < ?)
+                ORDER BY run_at LIMIT 1
+            )
+            RETURNING *""",
+            (now + self.lease, now, now, now)
+        ).fetchone()
+        return dict(row) if row is not None else None
+
+    def _fail_abandoned(self, now):
+        """Fail jobs whose lease expired on their last allowed attempt"""
+        rows = self.execute(
+            """UPDATE jobs SET status = 'failed', lease_until = NULL, updated_at = ?,
+                error = 'Worker stopped during attempt ' || attempts || ' of ' || ?
+            WHERE status = 'running' AND lease_until < ? AND attempts >= ?
+            RETURNING id""",
+            (now, self.max_attempts, now, self.max_attempts)
+        ).fetchall()
+        for row in rows:
+            self._remove_payload(row["id"])
+
+    def prune(self):
+        """Delete done and failed jobs older than the retention period; returns how many"""
+        if not self.retention:
+            return 0
+        cursor = self.execute(
+            "DELETE FROM jobs WHERE status IN ('done', 'failed') AND updated_at < ?",
+            (time.time() - self.retention,)
+        )
+        return cursor.rowcount
+
+    def complete(self, job_id, result):
+        self._finish(job_id, "done", result=json.dumps(result))
+
+    def fail(self, job_id, error):
+        self._finish(job_id, "failed", error=error)
+
+    def _finish(self, job_id, status, result=None, error=None):
+        self.execute(
+            "UPDATE jobs SET status = ?, result = ?, error = ?, lease_until = NULL, updated_at = ? WHERE id = ?",
+            (status, result, error, time.time(), job_id)
+        )
+        self._remove_payload(job_id)
+
+    def _remove_payload(self, job_id):
+        try:
+            os.remove(self.spool_path(job_id))
+        except FileNotFoundError:
+            pass
+
+    def retry(self, job_id, error, delay):
+        """Put a job back in the queue to run again after `delay` seconds"""
+        now = time.time()
+        self.execute(
+            """UPDATE jobs SET status = 'queued', error = ?, run_at = ?, lease_until = NULL, updated_at = ?
+            WHERE id = ?""",
+            (error, now + delay, now, job_id)
+        )
+
+    def get(self, job_id):
+        """Return the public view of a job, or None"""
+        row = self.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        if row is None:
+            return None
+        job = {
+            "job_id": row["id"],
+            "status": row["status"],
+            "filename": row["filename"],
+            "attempts": row["attempts"],
+            "created_at": row["created_at"],
+            "updated_at": row["updated_at"]
+        }
+        if row["status"] == "queued" and row["attempts"]:
+            job["next_attempt_at"] = row["run_at"]
+        if row["error"]:
+            job["error"] = row["error"]
+        if row["result"]:
+            job["result"] = json.loads(row["result"])
+        return job
+
+    def stats(self):
+        rows = self.execute("SELECT status, COUNT(*) AS count FROM jobs GROUP BY status").fetchall()
+        return {row["status"]: row["count"] for row in rows}
+
+
+class JobWorker:
+    """Pool of threads running queued jobs through `handler(job)`.
+
+    The handler returns the job result. PermanentJobError fails the job at
+    once; any other exception retries it with capped exponential backoff
+    until max_attempts is reached. Idle workers prune finished jobs every
+    PRUNE_INTERVAL seconds.
+    """
+
+    PRUNE_INTERVAL = 300
+
+    def __init__(self, queue, handler, workers=None, max_attempts=None, backoff=None, max_backoff=None,
+                 poll_interval=None):
+        self.queue = queue
+        self.handler = handler
+        self.workers = config.JOB_WORKERS if workers is None else workers
+        self.max_attempts = max_attempts or queue.max_attempts
+        self.backoff = config.JOB_RETRY_BACKOFF if backoff is None else backoff
+        self.max_backoff = config.JOB_RETRY_MAX_BACKOFF if max_backoff is None else max_backoff
+        self.poll_interval = poll_interval or config.JOB_POLL_INTERVAL
+        self._wakeup = threading.Event()
+        self._threads = []
+        self._pid = None
+        self._pruned_at = 0.0
+        self._lock = threading.Lock()
+
+    def start(self):
+        """Start the worker threads (once per process; threads do not survive a fork)"""
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._threads = []
+            for i in range(self.workers):
+                thread = threading.Thread(target=self._run, name=f"job-worker-{i}", daemon=True)
+                thread.start()
+                self._threads.append(thread)
+            self._pid = os.getpid()
+
+    def notify(self):
+        """Wake an idle worker, e.g. right after a job was enqueued"""
+        self._wakeup.set()
+
+    def _run(self):
+        while True:
+            try:
+                job = self.queue.claim()
+            except Exception:
+                job = None
+            if job is None:
+                self._prune_due()
+                self._wakeup.wait(self.poll_interval)
+                self._wakeup.clear()
+                continue
+            self.run_job(job)
+
+    def _prune_due(self):
+        with self._lock:
+            if time.time() - self._pruned_at < self.PRUNE_INTERVAL:
+                return
+            self._pruned_at = time.time()
+        try:
+            self.queue.prune()
+        except Exception:
+            # Retention is housekeeping; never take a worker down over it
+            pass
+
+    def run_job(self, job):
+        try:
+            result = self.handler(job)
+        except PermanentJobError as e:
+            self.queue.fail(job["id"], str(e))
+        except Exception as e:
+            if job["attempts"] >= self.max_attempts:
+                self.queue.fail(job["id"], str(e))
+            else:
+                delay = min(self.backoff * 2 ** (job["attempts"] - 1), self.max_backoff)
+                self.queue.retry(job["id"], str(e), delay)
+        else:
+            self.queue.complete(job["id"], result)
@@ -0,0 +1,140 @@
+import json
+import threading
+from concurrent.futures import Future
+
+
+def pack_address(pack_blob_id, offset, length):
+    """ID of a packed metadata record: the pack blob plus the record's byte range"""
+    return f"{pack_blob_id}:{offset}:{length}"
+
+
+def parse_pack_address(blob_id):
+    """Return (pack_blob_id, offset, length) for a packed record ID, or None for a plain blob ID"""
+    parts = blob_id.split(":")
+    if len(parts) != 3 or not parts[1].isdigit() or not parts[2].isdigit():
+        return None
+    return parts[0], int(parts[1]), int(parts[2])
+
+
+def build_pack(records):
+    """Lay encoded records out as one pack blob.
+
+    Each record is one line, followed by a last line indexing them:
+    {"pack_index": [[offset, length], ...]}, so a pack can also be read on
+    its own. Returns (pack bytes, [(offset, length), ...]).
+    """
+    parts = []
+    layout = []
+    offset = 0
+    for record in records:
+        layout.append((offset, len(record)))
+        parts.append(record)
+        parts.append(b"\n")
+        offset += len(record) + 1
+    parts.append(json.dumps({"pack_index": layout}).encode('utf-8'))
+    return b"".join(parts), layout
+
+
+class MetadataPacker:
+    """Buffers metadata records and stores them together as one pack blob.
+
+    A pack is flushed once it holds max_records records or max_bytes bytes,
+    or max_delay seconds after its first record arrived, whichever comes
+    first. Uploads hand over their metadata before their image PUT starts,
+    so the wait normally overlaps with it. add() returns a Future for the
+    record's "pack_blob_id:offset:length" address; a failed pack upload
+    fails every record in it.
+    """
+
+    def __init__(self, put_pack, executor, max_records, max_bytes, max_delay):
+        # put_pack(data) uploads one pack and returns (blob_id, object_id)
+        self.put_pack = put_pack
+        self.executor = executor
+        self.max_records = max_records
+        self.max_bytes = max_bytes
+        self.max_delay = max_delay
+        self.packs = 0
+        self.records = 0
+        self._pending = []
+        self._pending_bytes = 0
+        self._generation = 0
+        self._lock = threading.Lock()
+
+    def add(self, record):
+        """Queue one encoded record; returns a Future of {"blob_id", "object_id"}"""
+        future = Future()
+        batch = None
+        with self._lock:
+            self._pending.append((record, future))
+            self._pending_bytes += len(record)
+            if len(self._pending) >= self.max_records or self._pending_bytes >= self.max_bytes:
+                batch = self._take()
+            elif len(self._pending) == 1:
+                timer = threading.Timer(self.max_delay, self._flush_due, (self._generation,))
+                timer.daemon = True
+                timer.start()
+        if batch is not None:
+            # Never upload on the caller's thread, it may be the event loop
+            self.executor.submit(self._flush, batch)
+        return future
+
+    def add_many(self, records):
+        """Queue encoded records and flush them right away; returns one Future per record.
+
+        For callers that already hold a whole group of records (a batch
+        upload): they share packs instead of trickling in one per upload.
+        """
+        futures = []
+        batches = []
+        with self._lock:
+            for record in records:
+                future = Future()
+                futures.append(future)
+                self._pending.append((record, future))
+                self._pending_bytes += len(record)
+                if len(self._pending) >= self.max_records or self._pending_bytes >= self.max_bytes:
+                    batches.append(self._take())
+            if self._pending:
+                batches.append(self._take())
+        for batch in batches:
+            self.executor.submit(self._flush, batch)
+        return futures
+
+    def _take(self):
+        """Detach the pending records as a batch (caller holds _lock)"""
+        batch = self._pending
+        self._pending = []
+        self._pending_bytes = 0
+        self._generation += 1
+        return batch
+
+    def _flush_due(self, generation):
+        with self._lock:
+            # Already flushed for being full
+            if generation != self._generation or not self._pending:
+                return
+            batch = self._take()
+        self._flush(batch)
+
+    def _flush(self, batch):
+        data, layout = build_pack([record for record, _ in batch])
+        try:
+            blob_id, object_id = self.put_pack(data)
+        except Exception as e:
+            for _, future in batch:
+                future.set_exception(e)
+            return
+        with self._lock:
+            self.packs += 1
+            self.records += len(batch)
+        for (_, future), (offset, length) in zip(batch, layout):
+            future.set_result({"blob_id": pack_address(blob_id, offset, length), "object_id": object_id})
+
+    def stats(self):
+        with self._lock:
+            return {
+                "packs": self.packs,
+                "records": self.records,
+                "records_per_pack": self.records / self.packs if self.packs else 0.0,
+                "pending": len(self._pending)
+            }
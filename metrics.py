@@ -0,0 +1,231 @@
+import bisect
+import threading
+import time
+import tracing
+
+# Latency buckets in seconds, from a cache-warm aggregator hit to a slow publisher PUT
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+class Histogram:
+    """Thread-safe fixed-bucket histogram (Prometheus-style, cumulative on export)"""
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = tuple(sorted(buckets))
+        self._counts = [0] * (len(self.buckets) + 1)  # last slot is +Inf
+        self._sum = 0.0
+        self._count = 0
+        self._lock = threading.Lock()
+
+    def observe(self, value):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            self._counts[index] += 1
+            self._sum += value
+            self._count += 1
+
+    def quantile(self, q):
+        """Estimate a quantile by interpolating inside the bucket it falls in"""
+        with self._lock:
+            counts = list(self._counts)
+            total = self._count
+        if total == 0:
+            return None
+        rank = q * total
+        seen = 0
+        lower = 0.0
+        for i, count in enumerate(counts):
+            if i == len(self.buckets):
+                # Beyond the last bound there is nothing to interpolate against
+                return self.buckets[-1]
+            upper = self.buckets[i]
+            if count and seen + count >= rank:
+                return lower + (upper - lower) * (rank - seen) / count
+            seen += count
+            lower = upper
+        return self.buckets[-1]
+
+    def snapshot(self):
+        with self._lock:
+            counts = list(self._counts)
+            total = self._count
+            value_sum = self._sum
+        cumulative = []
+        running = 0
+        for bound, count in zip(self.buckets + (float("inf"),), counts):
+            running += count
+            cumulative.append(("+Inf" if bound == float("inf") else bound, running))
+        return {
+            "count": total,
+            "sum": round(value_sum, 6),
+            "buckets": cumulative,
+            "p50": self.quantile(0.5),
+            "p95": self.quantile(0.95),
+            "p99": self.quantile(0.99)
+        }
+
+
+class Counter:
+    """Thread-safe monotonically increasing value"""
+
+    def __init__(self):
+        self.value = 0
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1):
+        with self._lock:
+            self.value += amount
+
+
+class Gauge:
+    """Thread-safe value that goes up and down"""
+
+    def __init__(self):
+        self.value = 0
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1):
+        with self._lock:
+            self.value += amount
+
+    def dec(self, amount=1):
+        with self._lock:
+            self.value -= amount
+
+    def set(self, value):
+        self.value = value
+
+
+_metrics = {}
+_help = {}
+_collectors = []
+_lock = threading.Lock()
+
+
+def _get(kind, name, labels):
+    key = (name, tuple(sorted(labels.items())))
+    metric = _metrics.get(key)
+    if metric is None:
+        with _lock:
+            metric = _metrics.get(key)
+            if metric is None:
+                metric = _metrics[key] = kind()
+    return metric
+
+
+def histogram(name, **labels):
+    """Get (or create) the histogram for a metric name and label set"""
+    return _get(Histogram, name, labels)
+
+
+def counter(name, **labels):
+    """Get (or create) the counter for a metric name and label set"""
+    return _get(Counter, name, labels)
+
+
+def gauge(name, **labels):
+    """Get (or create) the gauge for a metric name and label set"""
+    return _get(Gauge, name, labels)
+
+
+def describe(name, help_text):
+    """Set the # HELP text of a metric"""
+    _help[name] = help_text
+
+
+def register_collector(collect):
+    """Register a callable returning [(name, type, labels, value)] at scrape time.
+
+    Used for values that services already keep (cache counters, queue
+    sizes), so the hot path pays nothing for them.
+    """
+    _collectors.append(collect)
+
+
+def histograms(name=None):
+    """Snapshot all histograms (optionally of one metric) as a list of dicts"""
+    with _lock:
+        items = list(_metrics.items())
+    return [
+        {"name": metric, "labels": dict(labels), **hist.snapshot()}
+        for (metric, labels), hist in items
+        if isinstance(hist, Histogram) and (name is None or metric == name)
+    ]
+
+
+class stage:
+    """Time one pipeline stage into stage_seconds{stage=...} and the current trace.
+
+    Usable as a context manager; cheap enough to wrap every hot-path call.
+    """
+
+    __slots__ = ("name", "attributes", "_start", "_span")
+
+    def __init__(self, name, **attributes):
+        self.name = name
+        self.attributes = attributes
+
+    def __enter__(self):
+        self._span = tracing.start_span(self.name, self.attributes)
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        histogram("stage_seconds", stage=self.name).observe(time.perf_counter() - self._start)
+        if exc is not None:
+            counter("stage_errors_total", stage=self.name).inc()
+        tracing.end_span(self._span, exc)
+        return False
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels(labels, extra=None):
+    items = list(labels) + (list(extra) if extra else [])
+    if not items:
+        return ""
+    return "{" + ",".join(f'{key}="{_escape(value)}"' for key, value in items) + "}"
+
+
+def _format_value(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def render_prometheus():
+    """Render every metric in the Prometheus text exposition format"""
+    families = {}
+    with _lock:
+        items = list(_metrics.items())
+    for (name, labels), metric in items:
+        kind = {Histogram: "histogram", Counter: "counter", Gauge: "gauge"}[type(metric)]
+        families.setdefault(name, (kind, []))[1].append((labels, metric))
+    for collect in list(_collectors):
+        try:
+            samples = collect()
+        except Exception:
+            continue
+        for name, kind, labels, value in samples:
+            families.setdefault(name, (kind, []))[1].append((tuple(sorted(labels.items())), value))
+
+    lines = []
+    for name in sorted(families):
+        kind, samples = families[name]
+        if name in _help:
+            lines.append(f"# HELP {name} {_help[name]}")
+        lines.append(f"# TYPE {name} {kind}")
+        for labels, metric in samples:
+            if isinstance(metric, Histogram):
+                snapshot = metric.snapshot()
+                for bound, count in snapshot["buckets"]:
+                    le = "+Inf" if bound == "+Inf" else repr(float(bound))
+                    lines.append(f"{name}_bucket{_labels(labels, [('le', le)])} {count}")
+                lines.append(f"{name}_sum{_labels(labels)} {snapshot['sum']}")
+                lines.append(f"{name}_count{_labels(labels)} {snapshot['count']}")
+            else:
+                value = metric.value if isinstance(metric, (Counter, Gauge)) else metric
+                lines.append(f"{name}{_labels(labels)} {_format_value(value)}")
+    return "\n".join(lines) + "\n"
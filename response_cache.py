@@ -0,0 +1,81 @@
+import hashlib
+import threading
+import time
+from sqlite_store import SQLiteStore
+
+
+class ResponseCache(SQLiteStore):
+    """Persistent cache of Gemini replies keyed by model and normalized prompt.
+
+    Entries expire after ttl seconds; beyond max_entries the least recently
+    used ones are dropped.
+    """
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS responses (
+            key TEXT PRIMARY KEY,
+            response TEXT NOT NULL,
+            created_at REAL NOT NULL,
+            last_used REAL NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS idx_responses_last_used ON responses (last_used);
+    """
+
+    def __init__(self, path, ttl=24 * 3600, max_entries=10000):
+        super().__init__(path)
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self.bypassed = 0
+        self._stats_lock = threading.Lock()
+
+    def _count(self, counter):
+        with self._stats_lock:
+            setattr(self, counter, getattr(self, counter) + 1)
+
+    @staticmethod
+    def make_key(model_name, prompt):
+        """Hash of the model name and the prompt with whitespace collapsed"""
+        normalized = " ".join(prompt.split())
+        return hashlib.sha256(f"{model_name}\n{normalized}".encode('utf-8')).hexdigest()
+
+    def get(self, key):
+        """Return the cached reply for key, or None if missing or expired"""
+        now = time.time()
+        row = self.execute(
+            "SELECT response, created_at FROM responses WHERE key = ?", (key,)
+        ).fetchone()
+        if row is None or now - row["created_at"] > self.ttl:
+            self._count("misses")
+            return None
+        self.execute("UPDATE responses SET last_used = ? WHERE key = ?", (now, key))
+        self._count("hits")
+        return row["response"]
+
+    def bypass(self):
+        """Count a lookup skipped at the caller's request"""
+        self._count("bypassed")
+
+    def put(self, key, response):
+        now = time.time()
+        self.execute(
+            "INSERT OR REPLACE INTO responses (key, response, created_at, last_used) VALUES (?, ?, ?, ?)",
+            (key, response, now, now)
+        )
+        self.execute("DELETE FROM responses WHERE created_at < ?", (now - self.ttl,))
+        self.execute(
+            """DELETE FROM responses WHERE key IN (
+                SELECT key FROM responses ORDER BY last_used DESC LIMIT -1 OFFSET ?
+            )""",
+            (self.max_entries,)
+        )
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "bypassed": self.bypassed,
+            "hit_ratio": self.hits / lookups if lookups else 0.0
+        }
@@ -0,0 +1,57 @@
+#!/usr/bin/env python3
+"""
+Production entry point: serves the Flask app with gunicorn.
+
+Workers are threaded (gthread). Each request in flight, async views
+included, holds one thread until it is answered, so WEB_WORKERS x WEB_THREADS
+is the number of uploads and chats served at once; size WEB_THREADS for it.
+Async views run on a shared event loop per worker and do their blocking
+calls on its executor, which has WEB_THREADS threads too. The app is loaded
+and warmed up once in the master before workers are forked, so they share its
+memory copy-on-write. Use run.py for the debug dev server.
+"""
+
+import os
+from gunicorn.app.base import BaseApplication
+from app import app, start_background_workers
+import config
+import services
+
+
+class DonatelloServer(BaseApplication):
+    def __init__(self, application, options=None):
+        self.application = application
+        self.options = options or {}
+        super().__init__()
+
+    def load_config(self):
+        for key, value in self.options.items():
+            if key in self.cfg.settings and value is not None:
+                self.cfg.set(key, value)
+
+    def load(self):
+        return self.application
+
+
+def post_fork(server, worker):
+    # Job worker threads belong in each worker; the master only supervises
+    start_background_workers()
+
+
+if __name__ == "__main__":
+    options = {
+        "bind": os.getenv("BIND", "0.0.0.0:5000"),
+        "workers": int(os.getenv("WEB_WORKERS", 2)),
+        "worker_class": "gthread",
+        "threads": config.WEB_THREADS,
+        # Long enough for a slow Gemini reply or a large publisher PUT
+        "timeout": int(os.getenv("WEB_TIMEOUT", 120)),
+        "keepalive": int(os.getenv("WEB_KEEPALIVE", 5)),
+        "preload_app": True,
+        "post_fork": post_fork,
+    }
+    if config.WARMUP_ENABLED:
+        timings = services.warm_up()
+        print(f"🔥 Warmed up in {sum(timings.values()):.0f} ms before forking workers")
+    print(f"🚀 Serving on http://{options['bind']} with {options['workers']} worker(s) x {options['threads']} thread(s)")
+    DonatelloServer(app, options).run()
@@ -0,0 +1,151 @@
+"""Lazily built, process-wide service instances.
+
+Each service (and the heavy modules behind it: Pillow, numpy, the Gemini
+SDK) is only imported and constructed the first time a request needs it,
+so a new worker answers /health and the storage routes without waiting for
+the rest. Call a service to get it, e.g. `services.walrus_storage()`.
+"""
+
+import threading
+import time
+import config
+
+_UNSET = object()
+
+
+class ServiceUnavailableError(Exception):
+    """Raised when a service cannot be built with the current configuration"""
+
+
+class LazyService:
+    """A service built on first use, once per process, safely across threads.
+
+    A failed build is not cached, so a later call tries again.
+    """
+
+    def __init__(self, factory):
+        self.factory = factory
+        self.name = factory.__name__
+        self.__doc__ = factory.__doc__
+        self._instance = _UNSET
+        self._lock = threading.Lock()
+
+    def __call__(self):
+        instance = self._instance
+        if instance is _UNSET:
+            with self._lock:
+                if self._instance is _UNSET:
+                    self._instance = self.factory()
+                instance = self._instance
+        return instance
+
+    @property
+    def loaded(self):
+        return self._instance is not _UNSET
+
+
+_services = []
+
+
+def lazy(factory):
+    """Decorator turning a factory function into a LazyService"""
+    service = LazyService(factory)
+    _services.append(service)
+    return service
+
+
+def loaded():
+    """Names of the services built so far in this process"""
+    return [service.name for service in _services if service.loaded]
+
+
+@lazy
+def shared_state():
+    """Backend for state shared across worker processes, or None if disabled"""
+    if not config.SHARED_STATE_BACKEND:
+        return None
+    from shared_state import load_backend
+    return load_backend(config.SHARED_STATE_BACKEND)
+
+
+@lazy
+def analyzer():
+    from image_analyzer import ImageAnalyzer
+    return ImageAnalyzer()
+
+
+@lazy
+def walrus_storage():
+    from walrus_storage import WalrusStorage
+    return WalrusStorage(state_store=shared_state())
+
+
+@lazy
+def gemini_chat():
+    from gemini_chat import GeminiChat
+    try:
+        return GeminiChat(session_store=shared_state())
+    except ValueError as e:
+        # Only chat needs Gemini; everything else keeps working without a key
+        raise ServiceUnavailableError(f"Chat is unavailable: {str(e)}")
+
+
+@lazy
+def upload_index():
+    from upload_index import UploadIndex, SharedUploadIndex
+    # The SQLite index file is already shared by the workers of a host
+    if config.SHARED_STATE_BACKEND in ("", "sqlite"):
+        return UploadIndex(config.UPLOAD_INDEX_PATH)
+    return SharedUploadIndex(shared_state())
+
+
+@lazy
+def upload_catalog():
+    from upload_catalog import UploadCatalog
+    return UploadCatalog(config.UPLOAD_CATALOG_PATH)
+
+
+@lazy
+def similarity_index():
+    from similarity_index import SimilarityIndex
+    return SimilarityIndex(config.SIMILARITY_INDEX_PATH)
+
+
+@lazy
+def variant_service():
+    from image_variants import VariantService
+    return VariantService(
+        walrus_storage(),
+        config.VARIANT_CACHE_DIR,
+        max_bytes=config.VARIANT_CACHE_BYTES,
+        max_age=config.VARIANT_CACHE_MAX_AGE
+    )
+
+
+def warm_up():
+    """Build every service and load hot entries, once, before forking workers.
+
+    Run in a pre-fork server's master process: workers then start with the
+    heavy imports, the similarity index and recently used blobs already in
+    memory, shared copy-on-write instead of loaded once per worker. Makes
+    no network calls, so no connection is shared across the fork. Returns
+    the time taken per step in milliseconds.
+    """
+    timings = {}
+
+    def step(name, build):
+        start = time.perf_counter()
+        try:
+            build()
+        except ServiceUnavailableError:
+            pass
+        timings[name] = round((time.perf_counter() - start) * 1000, 1)
+
+    for service in _services:
+        step(service.name, service)
+    if gemini_chat.loaded:
+        step("gemini_sdk", lambda: gemini_chat().model)
+    storage = walrus_storage()
+    if storage.cache is not None:
+        step("blob_cache", lambda: storage.cache.warm(config.WARMUP_BLOB_CACHE_BYTES))
+    return timings
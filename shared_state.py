@@ -0,0 +1,74 @@
+import importlib
+import json
+import time
+from sqlite_store import SQLiteStore
+import config
+
+
+class SQLiteStateBackend(SQLiteStore):
+    """Key-value state shared by all worker processes on a host.
+
+    Values are JSON documents grouped by namespace ("chat_sessions",
+    "uploads", "blob_cache", ...), each with an optional TTL. A custom
+    backend (e.g. on Redis, for workers spread over several hosts) needs
+    the same methods: get, put, delete and recent.
+    """
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS state (
+            namespace TEXT NOT NULL,
+            key TEXT NOT NULL,
+            value TEXT NOT NULL,
+            updated_at REAL NOT NULL,
+            expires_at REAL,
+            PRIMARY KEY (namespace, key)
+        );
+        CREATE INDEX IF NOT EXISTS state_recent ON state (namespace, updated_at);
+    """
+
+    def get(self, namespace, key):
+        """Return the value stored under key, or None if missing or expired"""
+        row = self.execute(
+            "SELECT value, expires_at FROM state WHERE namespace = ? AND key = ?", (namespace, key)
+        ).fetchone()
+        if row is None or (row["expires_at"] is not None and row["expires_at"] < time.time()):
+            return None
+        return json.loads(row["value"])
+
+    def put(self, namespace, key, value, ttl=None):
+        now = time.time()
+        self.execute(
+            "INSERT OR REPLACE INTO state (namespace, key, value, updated_at, expires_at) VALUES (?, ?, ?, ?, ?)",
+            (namespace, key, json.dumps(value), now, now + ttl if ttl else None)
+        )
+
+    def delete(self, namespace, key):
+        self.execute("DELETE FROM state WHERE namespace = ? AND key = ?", (namespace, key))
+
+    def recent(self, namespace, limit):
+        """The most recently written (key, value) pairs of a namespace, newest first"""
+        self.execute(
+            "DELETE FROM state WHERE namespace = ? AND expires_at < ?", (namespace, time.time())
+        )
+        rows = self.execute(
+            "SELECT key, value FROM state WHERE namespace = ? ORDER BY updated_at DESC LIMIT ?",
+            (namespace, limit)
+        ).fetchall()
+        return [(row["key"], json.loads(row["value"])) for row in rows]
+
+
+BACKENDS = {"sqlite": lambda: SQLiteStateBackend(config.SHARED_STATE_PATH)}
+
+
+def load_backend(spec):
+    """Build a shared-state backend from "sqlite" or "package.module:factory"
+
+    A custom factory is called without arguments and must return an object
+    with the methods of SQLiteStateBackend.
+    """
+    if spec in BACKENDS:
+        return BACKENDS[spec]()
+    module_name, _, attribute = spec.partition(":")
+    if not attribute:
+        raise ValueError(f"Unknown shared state backend: {spec}")
+    return getattr(importlib.import_module(module_name), attribute)()
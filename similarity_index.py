@@ -0,0 +1,118 @@
+from itertools import combinations
+import threading
+from sqlite_store import SQLiteStore
+
+HASH_BITS = 64
+CHUNKS = 4
+CHUNK_BITS = HASH_BITS // CHUNKS
+CHUNK_MASK = (1 << CHUNK_BITS) - 1
+# Query cost grows quickly with the per-chunk radius, keep it at most 4 bits
+MAX_SEARCH_DISTANCE = 16
+
+
+def hamming_distance(a, b):
+    return bin(a ^ b).count('1')
+
+
+def _flip_masks(radius):
+    """All CHUNK_BITS-bit masks with at most `radius` bits set"""
+    masks = [0]
+    for bits in range(1, radius + 1):
+        for positions in combinations(range(CHUNK_BITS), bits):
+            mask = 0
+            for position in positions:
+                mask |= 1 << position
+            masks.append(mask)
+    return masks
+
+
+class SimilarityIndex(SQLiteStore):
+    """Near-duplicate search over 64-bit perceptual hashes.
+
+    Uses multi-index hashing: each hash is split into 4 chunks of 16 bits and
+    indexed per chunk. Two hashes within Hamming distance r must agree on at
+    least one chunk to within r // 4 bits, so a query only enumerates the
+    few nearby chunk values instead of scanning every stored hash.
+
+    Hashes are persisted in SQLite; the in-memory tables are loaded at start
+    and topped up incrementally, so uploads from other workers show up too.
+    """
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS hashes (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            image_blob_id TEXT NOT NULL UNIQUE,
+            phash TEXT NOT NULL
+        );
+    """
+
+    def __init__(self, path):
+        super().__init__(path)
+        self._lock = threading.Lock()
+        self._hashes = []
+        self._blob_ids = []
+        self._tables = [{} for _ in range(CHUNKS)]
+        self._last_id = 0
+        self._masks = {}
+        self._refresh()
+
+    def _chunks(self, value):
+        return [(value >> (i * CHUNK_BITS)) & CHUNK_MASK for i in range(CHUNKS)]
+
+    def _refresh(self):
+        """Load hashes added since the last refresh (by this or another process)"""
+        rows = self.execute(
+            "SELECT id, image_blob_id, phash FROM hashes WHERE id > ? ORDER BY id",
+            (self._last_id,)
+        ).fetchall()
+        if not rows:
+            return
+        with self._lock:
+            for row in rows:
+                if row["id"] <= self._last_id:
+                    continue
+                position = len(self._hashes)
+                value = int(row["phash"], 16)
+                self._hashes.append(value)
+                self._blob_ids.append(row["image_blob_id"])
+                for table, chunk in zip(self._tables, self._chunks(value)):
+                    table.setdefault(chunk, []).append(position)
+                self._last_id = row["id"]
+
+    def add(self, image_blob_id, phash):
+        """Persist a blob's perceptual hash (hex string) and index it"""
+        self.execute(
+            "INSERT OR IGNORE INTO hashes (image_blob_id, phash) VALUES (?, ?)",
+            (image_blob_id, phash)
+        )
+        self._refresh()
+
+    def search(self, phash, k=10, max_distance=10):
+        """Return up to k (image_blob_id, distance) pairs within max_distance, nearest first"""
+        self._refresh()
+        query = int(phash, 16)
+        max_distance = max(0, min(int(max_distance), MAX_SEARCH_DISTANCE))
+        chunk_radius = max_distance // CHUNKS
+        if chunk_radius not in self._masks:
+            self._masks[chunk_radius] = _flip_masks(chunk_radius)
+        masks = self._masks[chunk_radius]
+
+        candidates = set()
+        with self._lock:
+            for table, chunk in zip(self._tables, self._chunks(query)):
+                for mask in masks:
+                    positions = table.get(chunk ^ mask)
+                    if positions:
+                        candidates.update(positions)
+
+            matches = []
+            for position in candidates:
+                distance = hamming_distance(query, self._hashes[position])
+                if distance <= max_distance:
+                    matches.append((distance, self._blob_ids[position]))
+
+        matches.sort()
+        return [(blob_id, distance) for distance, blob_id in matches[:k]]
+
+    def __len__(self):
+        return len(self._hashes)
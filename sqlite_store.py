@@ -0,0 +1,81 @@
+import os
+import sqlite3
+import threading
+import time
+
+
+class SQLiteStore:
+    """Base class for small local SQLite-backed stores.
+
+    Each thread gets its own connection (a forked worker opens new ones),
+    the database runs in WAL mode so several worker processes can share
+    one file, and a corrupted file is
+    moved aside and recreated empty instead of taking the app down.
+    Subclasses define SCHEMA (a script of CREATE ... IF NOT EXISTS statements).
+    """
+
+    SCHEMA = ""
+
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+        self._rebuild_lock = threading.Lock()
+        self._generation = 0
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        try:
+            self._initialize(self._connection())
+        except sqlite3.DatabaseError:
+            self._rebuild()
+
+    def _connection(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is not None and self._local.pid != os.getpid():
+            # Inherited across fork: SQLite connections must not be shared
+            # with the parent, so leave it alone and open a new one
+            conn = None
+        if conn is not None and self._local.generation == self._generation:
+            return conn
+        if conn is not None:
+            conn.close()
+        conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+        conn.row_factory = sqlite3.Row
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute("PRAGMA busy_timeout=30000")
+        self._local.conn = conn
+        self._local.generation = self._generation
+        self._local.pid = os.getpid()
+        return conn
+
+    def _initialize(self, conn):
+        conn.execute("PRAGMA quick_check").fetchone()
+        conn.executescript(self.SCHEMA)
+
+    def _rebuild(self):
+        """Move a corrupted database aside and start over with an empty one"""
+        with self._rebuild_lock:
+            conn = getattr(self._local, 'conn', None)
+            if conn is not None:
+                conn.close()
+                self._local.conn = None
+            self._generation += 1
+            suffix = f".corrupt-{int(time.time())}"
+            for extension in ('', '-wal', '-shm'):
+                if os.path.exists(self.path + extension):
+                    os.replace(self.path + extension, self.path + suffix + extension)
+            self._initialize(self._connection())
+
+    def execute(self, sql, params=()):
+        """Run a statement, rebuilding the database once if it turns out to be corrupted"""
+        try:
+            return self._connection().execute(sql, params)
+        except sqlite3.DatabaseError as e:
+            if isinstance(e, sqlite3.IntegrityError) or not self._is_corruption(e):
+                raise
+            self._rebuild()
+            return self._connection().execute(sql, params)
+
+    @staticmethod
+    def _is_corruption(error):
+        message = str(error).lower()
+        return 'malformed' in message or 'not a database' in message or 'no such table' in message
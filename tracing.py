@@ -0,0 +1,175 @@
+import contextvars
+import importlib
+import json
+import logging
+import os
+import queue
+import random
+import threading
+import time
+import uuid
+import config
+
+logger = logging.getLogger("tracing")
+
+_current_span = contextvars.ContextVar("current_span", default=None)
+
+
+class Span:
+    """One timed operation of a trace"""
+
+    __slots__ = ("trace", "span_id", "parent_id", "name", "start", "end", "attributes", "error")
+
+    def __init__(self, trace, name, parent_id=None, attributes=None):
+        self.trace = trace
+        self.span_id = uuid.uuid4().hex[:16]
+        self.parent_id = parent_id
+        self.name = name
+        self.start = time.time()
+        self.end = None
+        self.attributes = attributes or {}
+        self.error = None
+
+    def to_dict(self):
+        span = {
+            "trace_id": self.trace.trace_id,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "name": self.name,
+            "start": self.start,
+            "duration_ms": round((self.end - self.start) * 1000, 3) if self.end else None,
+            "attributes": self.attributes
+        }
+        if self.error:
+            span["error"] = self.error
+        return span
+
+
+class Trace:
+    """The spans of one request; exported together when the root span ends"""
+
+    def __init__(self):
+        self.trace_id = uuid.uuid4().hex
+        self.spans = []
+        self._lock = threading.Lock()
+
+    def add(self, span):
+        with self._lock:
+            self.spans.append(span)
+
+
+class LogExporter:
+    """Write each finished trace as one JSON line to the `tracing` logger"""
+
+    def export(self, spans):
+        logger.info(json.dumps(spans))
+
+
+class JsonlExporter:
+    """Append each finished trace as one JSON line to a file"""
+
+    def __init__(self, path=None):
+        self.path = path or config.TRACE_JSONL_PATH
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+
+    def export(self, spans):
+        with open(self.path, 'a') as f:
+            f.write(json.dumps(spans) + "\n")
+
+
+EXPORTERS = {"log": LogExporter, "jsonl": JsonlExporter}
+
+_exporter = None
+_export_queue = None
+_export_pid = None
+_lock = threading.Lock()
+
+
+def load_exporter(spec):
+    """Build an exporter from "log", "jsonl" or "package.module:factory"
+
+    A custom factory is called without arguments and must return an object
+    with an export(spans) method, where spans is a list of span dicts.
+    """
+    if spec in EXPORTERS:
+        return EXPORTERS[spec]()
+    module_name, _, attribute = spec.partition(":")
+    if not attribute:
+        raise ValueError(f"Unknown trace exporter: {spec}")
+    return getattr(importlib.import_module(module_name), attribute)()
+
+
+def _export_loop():
+    while True:
+        spans = _export_queue.get()
+        try:
+            _exporter.export(spans)
+        except Exception as e:
+            logger.warning(f"Trace export failed: {str(e)}")
+
+
+def _submit(trace):
+    """Hand a finished trace to the exporter thread, never blocking the request"""
+    global _exporter, _export_queue, _export_pid
+    # Started per process: a forked worker does not inherit the thread
+    if _export_pid != os.getpid():
+        with _lock:
+            if _export_pid != os.getpid():
+                _exporter = load_exporter(config.TRACE_EXPORTER)
+                _export_queue = queue.Queue(maxsize=config.TRACE_QUEUE_SIZE)
+                threading.Thread(target=_export_loop, name="trace-export", daemon=True).start()
+                _export_pid = os.getpid()
+    try:
+        _export_queue.put_nowait([span.to_dict() for span in trace.spans])
+    except queue.Full:
+        pass
+
+
+def start_trace(name, **attributes):
+    """Open the root span of a request if tracing is on and the request is sampled.
+
+    Returns (span, token) to pass to finish_trace, or None.
+    """
+    if not config.TRACE_ENABLED or random.random() >= config.TRACE_SAMPLE_RATE:
+        return None
+    trace = Trace()
+    span = Span(trace, name, attributes=attributes)
+    trace.add(span)
+    return span, _current_span.set(span)
+
+
+def finish_trace(handle, error=None, **attributes):
+    """Close a root span opened by start_trace and export its trace"""
+    if handle is None:
+        return
+    span, token = handle
+    span.end = time.time()
+    span.attributes.update(attributes)
+    if error is not None:
+        span.error = str(error)
+    _current_span.reset(token)
+    _submit(span.trace)
+
+
+def start_span(name, attributes=None):
+    """Open a child of the current span; returns (span, token), or None outside a trace"""
+    parent = _current_span.get()
+    if parent is None:
+        return None
+    span = Span(parent.trace, name, parent_id=parent.span_id, attributes=attributes)
+    parent.trace.add(span)
+    return span, _current_span.set(span)
+
+
+def end_span(handle, error=None):
+    if handle is None:
+        return
+    span, token = handle
+    span.end = time.time()
+    if error is not None:
+        span.error = str(error)
+    try:
+        _current_span.reset(token)
+    except ValueError:
+        # Ended in another context (e.g. a generator finished elsewhere)
+        pass
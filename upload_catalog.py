@@ -0,0 +1,164 @@
+from datetime import date
+from sqlite_store import SQLiteStore
+
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 500
+# Rows a page may look at when filtering on a column it is not sorted by
+SCAN_LIMIT = 5000
+
+# sort parameter -> (column, direction)
+SORTS = {
+    "newest": ("analyzed_at", "DESC"),
+    "largest": ("file_size", "DESC"),
+    "smallest": ("file_size", "ASC"),
+}
+DEFAULT_SORT = "newest"
+
+
+class UploadCatalog(SQLiteStore):
+    """Local catalog of every image stored in Walrus, for listing and filtering.
+
+    Listings are keyset-paginated (on the sort column and the id) so each
+    page costs the same no matter how deep the client has scrolled.
+    """
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS blobs (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            image_blob_id TEXT NOT NULL,
+            metadata_blob_id TEXT,
+            image_object_id TEXT,
+            metadata_object_id TEXT,
+            filename TEXT,
+            format TEXT,
+            width INTEGER,
+            height INTEGER,
+            file_size INTEGER,
+            analyzed_at TEXT
+        );
+        CREATE UNIQUE INDEX IF NOT EXISTS idx_blobs_image_blob_id ON blobs (image_blob_id);
+        CREATE INDEX IF NOT EXISTS idx_blobs_format ON blobs (format, id);
+        CREATE INDEX IF NOT EXISTS idx_blobs_analyzed_at ON blobs (analyzed_at, id);
+        CREATE INDEX IF NOT EXISTS idx_blobs_file_size ON blobs (file_size, id);
+        CREATE INDEX IF NOT EXISTS idx_blobs_format_analyzed_at ON blobs (format, analyzed_at, id);
+        CREATE INDEX IF NOT EXISTS idx_blobs_format_file_size ON blobs (format, file_size, id);
+    """
+
+    COLUMNS = (
+        "id", "image_blob_id", "metadata_blob_id", "image_object_id", "metadata_object_id",
+        "filename", "format", "width", "height", "file_size", "analyzed_at"
+    )
+
+    def add(self, upload_result, metadata):
+        """Record a successful upload_image result with its analyzer metadata"""
+        file_info = metadata.get("file_info", {})
+        size = file_info.get("size", {})
+        self.execute(
+            """INSERT OR IGNORE INTO blobs (
+                image_blob_id, metadata_blob_id, image_object_id, metadata_object_id,
+                filename, format, width, height, file_size, analyzed_at
+            ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)""",
+            (
+                upload_result["image_blob_id"],
+                upload_result["metadata_blob_id"],
+                upload_result["image_object_id"],
+                upload_result["metadata_object_id"],
+                file_info.get("filename"),
+                file_info.get("format"),
+                size.get("width"),
+                size.get("height"),
+                file_info.get("file_size"),
+                file_info.get("analyzed_at")
+            )
+        )
+
+    def get(self, image_blob_id):
+        """Return the catalog entry for an image blob, or None"""
+        row = self.execute(
+            "SELECT * FROM blobs WHERE image_blob_id = ?", (image_blob_id,)
+        ).fetchone()
+        return dict(row) if row else None
+
+    def list(self, cursor=None, limit=DEFAULT_PAGE_SIZE, format=None,
+             min_size=None, max_size=None, since=None, until=None, sort=DEFAULT_SORT):
+        """List catalog entries in the given sort order.
+
+        sort is one of SORTS: newest (by analyzed_at, the default), largest
+        or smallest (by file_size). The order never depends on the filters.
+        since/until are ISO timestamps compared against analyzed_at, both
+        inclusive; a date-only until covers that whole day. Filters on the
+        sort column and format are read straight off an index. Filters on
+        the other column look at no more than SCAN_LIMIT rows per page, so a
+        selective one can return a short (even empty) page whose
+        next_cursor still continues the listing. cursor is the next_cursor
+        of the previous page, which is opaque.
+        Returns (entries, next_cursor).
+        """
+        if sort not in SORTS:
+            raise ValueError(f"sort must be one of {', '.join(SORTS)}, not {sort!r}")
+        key, direction = SORTS[sort]
+        limit = max(1, min(int(limit), MAX_PAGE_SIZE))
+        if until and len(until) == len("YYYY-MM-DD"):
+            until = f"{date.fromisoformat(until).isoformat()}T23:59:59.999999"
+
+        ranges = {
+            "file_size": [(">=", None if min_size is None else int(min_size)),
+                          ("<=", None if max_size is None else int(max_size))],
+            "analyzed_at": [(">=", since or None), ("<=", until or None)]
+        }
+
+        clauses = [f"{key} IS NOT NULL"]
+        params = []
+        if cursor is not None:
+            value, separator, last_id = str(cursor).rpartition(":")
+            if not separator:
+                raise ValueError(f"cursor {cursor!r} does not belong to this listing")
+            clauses.append(f"({key}, id) {'<' if direction == 'DESC' else '>'} (?, ?)")
+            params.extend([int(value) if key == "file_size" else value, int(last_id)])
+        if format:
+            clauses.append("format = ?")
+            params.append(format.upper())
+        for operator, bound in ranges[key]:
+            if bound is not None:
+                clauses.append(f"{key} {operator} ?")
+                params.append(bound)
+
+        residual = []
+        residual_params = []
+        other = "analyzed_at" if key == "file_size" else "file_size"
+        for operator, bound in ranges[other]:
+            if bound is not None:
+                residual.append(f"{other} {operator} ?")
+                residual_params.append(bound)
+
+        columns = ", ".join(self.COLUMNS)
+        where = " AND ".join(clauses)
+        order = f"{key} {direction}, id {direction}"
+        if residual:
+            rows = self.execute(
+                f"""SELECT {columns} FROM (
+                    SELECT {columns} FROM blobs WHERE {where} ORDER BY {order} LIMIT ?
+                ) WHERE {' AND '.join(residual)} ORDER BY {order} LIMIT ?""",
+                (*params, SCAN_LIMIT, *residual_params, limit + 1)
+            ).fetchall()
+        else:
+            rows = self.execute(
+                f"SELECT {columns} FROM blobs WHERE {where} ORDER BY {order} LIMIT ?",
+                (*params, limit + 1)
+            ).fetchall()
+
+        entries = [dict(row) for row in rows[:limit]]
+        next_cursor = None
+        if len(rows) > limit:
+            last = entries[-1]
+            next_cursor = f"{last[key]}:{last['id']}"
+        elif residual:
+            # The page came up short; if the scan stopped before the end of
+            # the index, carry on from the last row it looked at.
+            boundary = self.execute(
+                f"SELECT {key}, id FROM blobs WHERE {where} ORDER BY {order} LIMIT 1 OFFSET ?",
+                (*params, SCAN_LIMIT - 1)
+            ).fetchone()
+            if boundary is not None:
+                next_cursor = f"{boundary[key]}:{boundary['id']}"
+        return entries, next_cursor
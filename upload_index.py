@@ -0,0 +1,103 @@
+import hashlib
+import json
+import time
+from sqlite_store import SQLiteStore
+import metrics
+
+HASH_CHUNK_SIZE = 1024 * 1024
+
+
+def content_hash(stream):
+    """Compute the SHA-256 of a binary stream without loading it all at once"""
+    with metrics.stage("hash"):
+        digest = hashlib.sha256()
+        for chunk in iter(lambda: stream.read(HASH_CHUNK_SIZE), b''):
+            digest.update(chunk)
+        return digest.hexdigest()
+
+
+class UploadIndex(SQLiteStore):
+    """Persistent index from image content hash to the blobs it was stored as"""
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS uploads (
+            content_hash TEXT PRIMARY KEY,
+            image_blob_id TEXT NOT NULL,
+            metadata_blob_id TEXT,
+            image_object_id TEXT,
+            metadata_object_id TEXT,
+            metadata TEXT NOT NULL,
+            created_at REAL NOT NULL
+        );
+    """
+
+    def get(self, digest):
+        """Return the stored upload result for a content hash, or None"""
+        row = self.execute(
+            "SELECT * FROM uploads WHERE content_hash = ?", (digest,)
+        ).fetchone()
+        if row is None:
+            return None
+        return {
+            "image_blob_id": row["image_blob_id"],
+            "metadata_blob_id": row["metadata_blob_id"],
+            "image_object_id": row["image_object_id"],
+            "metadata_object_id": row["metadata_object_id"],
+            "metadata": json.loads(row["metadata"])
+        }
+
+    def put(self, digest, upload_result, metadata):
+        """Record an upload; the first one wins since it carries the object IDs"""
+        self.execute(
+            """INSERT OR IGNORE INTO uploads (
+                content_hash, image_blob_id, metadata_blob_id,
+                image_object_id, metadata_object_id, metadata, created_at
+            ) VALUES (?, ?, ?, ?, ?, ?, ?)""",
+            (
+                digest,
+                upload_result["image_blob_id"],
+                upload_result["metadata_blob_id"],
+                upload_result["image_object_id"],
+                upload_result["metadata_object_id"],
+                json.dumps(metadata),
+                time.time()
+            )
+        )
+
+    def update_metadata(self, digest, metadata):
+        """Replace the metadata of a recorded upload, e.g. once its fingerprint is known"""
+        self.execute(
+            "UPDATE uploads SET metadata = ? WHERE content_hash = ?", (json.dumps(metadata), digest)
+        )
+
+
+class SharedUploadIndex:
+    """UploadIndex on top of a custom shared-state backend (see shared_state.py).
+
+    Used when workers do not share a local disk; with the default SQLite
+    backend the UploadIndex file is already shared by every worker process.
+    """
+
+    NAMESPACE = "uploads"
+
+    def __init__(self, store):
+        self.store = store
+
+    def get(self, digest):
+        return self.store.get(self.NAMESPACE, digest)
+
+    def put(self, digest, upload_result, metadata):
+        # Not atomic, but racing uploads of the same content store equal results
+        if self.store.get(self.NAMESPACE, digest) is None:
+            self.store.put(self.NAMESPACE, digest, {
+                "image_blob_id": upload_result["image_blob_id"],
+                "metadata_blob_id": upload_result["metadata_blob_id"],
+                "image_object_id": upload_result["image_object_id"],
+                "metadata_object_id": upload_result["metadata_object_id"],
+                "metadata": metadata
+            })
+
+    def update_metadata(self, digest, metadata):
+        entry = self.store.get(self.NAMESPACE, digest)
+        if entry is not None:
+            self.store.put(self.NAMESPACE, digest, {**entry, "metadata": metadata})
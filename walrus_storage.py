@@ -1,18 +1,92 @@
-from walrus import WalrusClient, WalrusAPIError
+from walrus import WalrusAPIError
+from concurrent.futures import ThreadPoolExecutor
+import contextvars
 import json
 import os
-from dotenv import load_dotenv
+import time
+from blob_cache import BlobCache
+from walrus_transport import WalrusTransport, CircuitOpenError
+from aggregator_pool import AggregatorPool
+from metadata_pack import MetadataPacker, pack_address, parse_pack_address
+import metrics
+import config
+
+# Shared by every WalrusStorage so publisher PUTs of one upload run side by side
+# without spawning threads per request
+_upload_pool = ThreadPoolExecutor(
+    max_workers=config.WALRUS_UPLOAD_WORKERS,
+    thread_name_prefix="walrus-upload"
+)
+
+class BlobUploadError(Exception):
+    """Raised when one part of an upload (image or metadata) fails after retries"""
+
+    def __init__(self, part, error, attempts):
+        self.part = part
+        self.error = error
+        self.attempts = attempts
+        super().__init__(f"{part} upload failed after {attempts} attempt(s): {str(error)}")
+
+STREAM_CHUNK_SIZE = 64 * 1024
+UPLOAD_CHUNK_SIZE = 1024 * 1024
+
+def upload_chunks(stream):
+    """Rewind a file-like upload body and iterate over it in bounded chunks"""
+    stream.seek(0)
+    return iter(lambda: stream.read(UPLOAD_CHUNK_SIZE), b'')
+
+def body_size(data):
+    """Size in bytes of an upload body given as bytes or a seekable file"""
+    if hasattr(data, 'read'):
+        position = data.tell()
+        size = data.seek(0, os.SEEK_END)
+        data.seek(position)
+        return size
+    return len(data)
+
+class BlobNotFoundError(Exception):
+    """Raised when the aggregator does not know a blob ID"""
+
+
+class RangeNotSatisfiableError(Exception):
+    """Raised when a requested byte range lies outside the blob; size is the blob's length"""
+
+    def __init__(self, message, size):
+        super().__init__(message)
+        self.size = size
 
 class WalrusStorage:
-    def __init__(self):
-        load_dotenv()
-        self.client = WalrusClient(
-            publisher_base_url="https://publisher.walrus-testnet.walrus.space", 
-            aggregator_base_url="https://aggregator.walrus-testnet.walrus.space"
-        )
+    def __init__(self, state_store=None):
+        self.publisher_url = config.WALRUS_PUBLISHER_URL.rstrip("/")
+        # Pooled keep-alive connections, timeouts, GET retries and circuit breakers
+        self.transport = WalrusTransport()
+        # Reads go to the fastest healthy aggregator, hedged and with failover
+        self.aggregators = AggregatorPool(config.WALRUS_AGGREGATOR_URLS, self.transport)
         self.bucket_name = os.getenv('WALRUS_BUCKET', 'images')
 
-    def _extract_blob_info(self, response):
+        # Walrus blobs are immutable, so reads can be served from a local cache
+        self.cache = None
+        if config.BLOB_CACHE_ENABLED:
+            self.cache = BlobCache(
+                config.BLOB_CACHE_DIR,
+                memory_bytes=config.BLOB_CACHE_MEMORY_BYTES,
+                disk_bytes=config.BLOB_CACHE_DISK_BYTES,
+                max_age=config.BLOB_CACHE_MAX_AGE,
+                store=state_store
+            )
+
+        # Optionally store the metadata of concurrent uploads as shared pack blobs
+        self.metadata_packer = None
+        if config.METADATA_PACK_ENABLED:
+            self.metadata_packer = MetadataPacker(
+                self._put_metadata_pack,
+                _upload_pool,
+                max_records=config.METADATA_PACK_MAX_RECORDS,
+                max_bytes=config.METADATA_PACK_MAX_BYTES,
+                max_delay=config.METADATA_PACK_MAX_DELAY
+            )
+
+    def extract_blob_info(self, response):
         """Extract blob ID and object ID from Walrus response"""
         if not response:
             return None, None
@@ -36,19 +110,89 @@ class WalrusStorage:
             object_id = response.get('id') or response.get('object_id')
             return blob_id, object_id
 
+    def is_retryable(self, error):
+        """Connection errors and 5xx/429 answers are worth retrying, other 4xx are not"""
+        if isinstance(error, CircuitOpenError):
+            # The publisher is known to be down, waiting a few seconds will not help
+            return False
+        if isinstance(error, WalrusAPIError):
+            return error.code is None or error.code >= 500 or error.code == 429
+        return True
+
+    def _put_blob_with_retries(self, part, data):
+        """Upload one blob, retrying transient failures with exponential backoff.
+
+        data is bytes or a seekable binary file; a file is sent as a chunked
+        stream (re-read from the start on each attempt), never loaded whole.
+        """
+        attempts = config.WALRUS_UPLOAD_ATTEMPTS
+        for attempt in range(1, attempts + 1):
+            try:
+                body = upload_chunks(data) if hasattr(data, 'read') else data
+                with metrics.stage(f"{part}_put"):
+                    response = self.transport.put_blob(self.publisher_url, body)
+                metrics.counter("walrus_bytes_total", direction="out").inc(body_size(data))
+                return response
+            except Exception as e:
+                if attempt == attempts or not self.is_retryable(e):
+                    raise BlobUploadError(part, e, attempt)
+                time.sleep(config.WALRUS_UPLOAD_BACKOFF * 2 ** (attempt - 1))
+
+    def _put_metadata_pack(self, data):
+        return self.extract_blob_info(self._put_blob_with_retries("metadata_pack", data))
+
+    def record_packed_metadata(self, packed, metadata_json):
+        """Return (blob_id, object_id) of a packed metadata record, keeping it in the blob cache.
+
+        Reading a record back otherwise takes a ranged GET on its pack.
+        """
+        if self.cache is not None:
+            self.cache.put(packed["blob_id"], metadata_json)
+        return packed["blob_id"], packed["object_id"]
+
+    def put_image(self, image_data):
+        """Upload only an image, for callers that hand its metadata to the packer themselves.
+
+        Returns (blob_id, object_id); raises BlobUploadError like upload_image.
+        """
+        return self.extract_blob_info(self._put_blob_with_retries("image", image_data))
+
     def upload_image(self, image_data, metadata):
-        """Upload image and its metadata to Walrus using publisher"""
+        """Upload image (bytes or a seekable binary file) and its metadata to Walrus using publisher.
+
+        Both PUTs run concurrently on a shared pool, so latency is roughly the
+        slower of the two. Each part is retried on its own; if either still
+        fails the whole upload fails with a BlobUploadError naming the part,
+        so callers never receive half a result. Walrus blobs are content
+        addressed, so a blob left behind by a failed upload is simply reused
+        (alreadyCertified) when the upload is retried. With metadata packing
+        the metadata goes into the next pack blob instead of a PUT of its own.
+        """
         try:
             # Upload image data (without encoding_type to avoid HTTP 400 errors)
-            image_response = self.client.put_blob(data=image_data)
+            # Each part runs in its own copy of the context so it joins the request's trace
+            image_future = _upload_pool.submit(
+                contextvars.copy_context().run, self._put_blob_with_retries, "image", image_data
+            )
 
             # Upload metadata
             metadata_json = json.dumps(metadata).encode('utf-8')
-            metadata_response = self.client.put_blob(data=metadata_json)
+            if self.metadata_packer is not None:
+                metadata_future = self.metadata_packer.add(metadata_json)
+            else:
+                metadata_future = _upload_pool.submit(
+                    contextvars.copy_context().run, self._put_blob_with_retries, "metadata", metadata_json
+                )
+
+            image_response = image_future.result()
+            metadata_response = metadata_future.result()
 
             # Extract blob information from responses
-            image_blob_id, image_object_id = self._extract_blob_info(image_response)
-            metadata_blob_id, metadata_object_id = self._extract_blob_info(metadata_response)
+            image_blob_id, image_object_id = self.extract_blob_info(image_response)
+            if self.metadata_packer is not None:
+                metadata_blob_id, metadata_object_id = self.record_packed_metadata(metadata_response, metadata_json)
+            else:
+                metadata_blob_id, metadata_object_id = self.extract_blob_info(metadata_response)
 
             return {
                 "image_blob_id": image_blob_id,
@@ -56,30 +200,148 @@ class WalrusStorage:
                 "image_object_id": image_object_id,
                 "metadata_object_id": metadata_object_id
             }
-        except WalrusAPIError as e:
-            raise Exception(f"Walrus API error: {str(e)}")
+        except BlobUploadError as e:
+            if isinstance(e.error, WalrusAPIError):
+                raise Exception(f"Walrus API error: {str(e)}")
+            raise Exception(f"Upload failed: {str(e)}")
         except Exception as e:
             raise Exception(f"Upload failed: {str(e)}")
 
     def get_image_url(self, blob_id):
-        """Get the URL for an image blob using aggregator for reading"""
-        return f"https://aggregator.walrus-testnet.walrus.space/v1/blobs/{blob_id}"
+        """Get the URL for an image blob on the currently best aggregator"""
+        return f"{self.aggregators.best()}/v1/blobs/{blob_id}"
+
+    def _get_blob(self, blob_id):
+        """Fetch a blob through the local cache, falling back to the aggregator"""
+        if self.cache is None:
+            return self._fetch_blob(blob_id)
+        return self.cache.get_or_fetch(blob_id, self._fetch_blob)
+
+    def _fetch_blob(self, blob_id):
+        with metrics.stage("aggregator_get"):
+            data = self.aggregators.get_blob(blob_id)
+        metrics.counter("walrus_bytes_total", direction="in").inc(len(data))
+        return data
+
+    def _get_pack_record(self, pack_blob_id, offset, length):
+        """Read one packed metadata record with a ranged GET, through the blob cache"""
+        def fetch(address):
+            with metrics.stage("aggregator_get"):
+                data = self.aggregators.get_blob(
+                    pack_blob_id, headers={"Range": f"bytes={offset}-{offset + length - 1}"}
+                )
+            metrics.counter("walrus_bytes_total", direction="in").inc(len(data))
+            # An aggregator that ignores Range sends the whole pack
+            return data if len(data) == length else data[offset:offset + length]
+
+        address = pack_address(pack_blob_id, offset, length)
+        if self.cache is None:
+            return fetch(address)
+        return self.cache.get_or_fetch(address, fetch)
+
+    def transport_stats(self):
+        """Get connection pool, circuit breaker, latency, aggregator routing and metadata pack stats"""
+        stats = {**self.transport.stats(), "aggregators": self.aggregators.stats()}
+        if self.metadata_packer is not None:
+            stats["metadata_packs"] = self.metadata_packer.stats()
+        return stats
+
+    def cache_stats(self):
+        """Get hit/miss/eviction counters of the blob cache"""
+        if self.cache is None:
+            return {"enabled": False}
+        return {"enabled": True, **self.cache.stats()}
+
+    def cached_blob_path(self, blob_id):
+        """Get the local file path of a cached blob, or None if it is not cached"""
+        if self.cache is None:
+            return None
+        return self.cache.get_path(blob_id)
+
+    def stream_blob(self, blob_id, range_header=None):
+        """Stream a blob from the aggregator in constant memory.
+
+        Returns (status_code, headers, chunks). The Range header is forwarded
+        as is, so the aggregator may answer 206 or ignore it and send 200.
+        A full (200) read is written through to the disk cache as it streams.
+        """
+        headers = {"Accept-Encoding": "identity"}
+        if range_header:
+            headers["Range"] = range_header
+        try:
+            # No hedging here, a duplicate stream would double the bandwidth
+            with metrics.stage("aggregator_stream_open"):
+                response = self.aggregators.failover(
+                    lambda url: self.transport.open_blob(url, blob_id, headers=headers, attempts=self.aggregators.attempts())
+                )
+        except WalrusAPIError as e:
+            if e.code == 404:
+                raise BlobNotFoundError(f"Blob not found: {blob_id}")
+            if e.code == 416:
+                raise RangeNotSatisfiableError(
+                    f"Range not satisfiable for blob {blob_id}: {range_header}", self._blob_size(blob_id)
+                )
+            raise Exception(f"Walrus API error: {str(e)}")
+        except Exception as e:
+            raise Exception(f"Download failed: {str(e)}")
+
+        def chunks():
+            writer = None
+            if self.cache is not None and response.status_code == 200:
+                writer = self.cache.open_writer(blob_id)
+            streamed = metrics.counter("walrus_bytes_total", direction="in")
+            try:
+                for chunk in response.raw.stream(STREAM_CHUNK_SIZE, decode_content=False):
+                    if writer is not None:
+                        writer.write(chunk)
+                    streamed.inc(len(chunk))
+                    yield chunk
+                if writer is not None:
+                    writer.commit()
+                    writer = None
+            finally:
+                if writer is not None:
+                    writer.abort()
+                response.close()
+
+        passthrough = {
+            name: response.headers[name]
+            for name in ("Content-Length", "Content-Range", "Content-Type")
+            if name in response.headers
+        }
+        return response.status_code, passthrough, chunks()
+
+    def _blob_size(self, blob_id):
+        """Length of a blob in bytes, from the aggregator's HEAD answer"""
+        headers = self.get_blob_metadata(blob_id)
+        length = next((value for name, value in headers.items() if name.lower() == "content-length"), None)
+        if length is None:
+            raise Exception(f"Aggregator sent no Content-Length for blob {blob_id}")
+        return int(length)
 
     def download_image(self, blob_id):
         """Download image data from Walrus using aggregator"""
         try:
-            return self.client.get_blob(blob_id)
+            return self._get_blob(blob_id)
         except WalrusAPIError as e:
+            if e.code == 404:
+                raise BlobNotFoundError(f"Blob not found: {blob_id}")
             raise Exception(f"Walrus API error: {str(e)}")
         except Exception as e:
             raise Exception(f"Download failed: {str(e)}")
 
     def download_metadata(self, blob_id):
-        """Download and parse metadata from Walrus using aggregator"""
+        """Download and parse metadata from Walrus using aggregator (plain or packed record ID)"""
         try:
-            metadata_bytes = self.client.get_blob(blob_id)
+            address = parse_pack_address(blob_id)
+            if address:
+                metadata_bytes = self._get_pack_record(*address)
+            else:
+                metadata_bytes = self._get_blob(blob_id)
             return json.loads(metadata_bytes.decode('utf-8'))
         except WalrusAPIError as e:
+            if e.code == 404:
+                raise BlobNotFoundError(f"Blob not found: {blob_id}")
             raise Exception(f"Walrus API error: {str(e)}")
         except Exception as e:
             raise Exception(f"Metadata download failed: {str(e)}")
@@ -87,7 +349,9 @@ class WalrusStorage:
     def get_blob_metadata(self, blob_id):
         """Get blob metadata from Walrus using aggregator"""
         try:
-            return self.client.get_blob_metadata(blob_id)
+            return self.aggregators.failover(
+                lambda url: self.transport.head_blob(url, blob_id, attempts=self.aggregators.attempts())
+            )
         except WalrusAPIError as e:
             raise Exception(f"Walrus API error: {str(e)}")
         except Exception as e:
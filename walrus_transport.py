@@ -0,0 +1,260 @@
+import random
+import threading
+import time
+import requests
+from requests.adapters import HTTPAdapter
+from walrus import WalrusAPIError
+import metrics
+import config
+
+IDEMPOTENT_METHODS = ("GET", "HEAD")
+
+
+class CircuitOpenError(Exception):
+    """Raised instead of contacting an endpoint whose circuit breaker is open"""
+
+
+class CircuitBreaker:
+    """Per-endpoint circuit breaker.
+
+    After `threshold` consecutive failures (connection errors, timeouts or
+    5xx answers) the circuit opens and calls fail fast. Once `reset_timeout`
+    seconds have passed one probe call is let through (half-open): success
+    closes the circuit, failure opens it again.
+    """
+
+    def __init__(self, threshold=5, reset_timeout=30):
+        self.threshold = threshold
+        self.reset_timeout = reset_timeout
+        self.state = "closed"
+        self.failures = 0
+        self.opened_at = 0.0
+        self.trips = 0
+        self._probing = False
+        self._lock = threading.Lock()
+
+    def allow(self):
+        with self._lock:
+            if self.state == "closed":
+                return True
+            if self.state == "open" and time.monotonic() - self.opened_at >= self.reset_timeout:
+                self.state = "half_open"
+                self._probing = False
+            if self.state == "half_open" and not self._probing:
+                self._probing = True
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self.state = "closed"
+            self.failures = 0
+            self._probing = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.state == "half_open" or (self.state == "closed" and self.failures >= self.threshold):
+                self.state = "open"
+                self.opened_at = time.monotonic()
+                self.trips += 1
+            self._probing = False
+
+    def stats(self):
+        with self._lock:
+            return {"state": self.state, "consecutive_failures": self.failures, "trips": self.trips}
+
+
+def api_error(response, context):
+    """Build a WalrusAPIError from an error response, the way the Walrus SDK does"""
+    code = response.status_code
+    status = getattr(response, "reason", None) or "UNKNOWN"
+    message = f"HTTP {code}: {status}"
+    details = []
+    try:
+        error = response.json().get("error") if response.content else None
+        if isinstance(error, dict):
+            code = error.get("code", code)
+            status = error.get("status", "UNKNOWN")
+            message = error.get("message", "")
+            details = error.get("details", [])
+    except (ValueError, AttributeError):
+        pass
+    return WalrusAPIError(code, status, message, details, context=context)
+
+
+class CallAttempts:
+    """Retry, circuit breaker and latency bookkeeping of one logical Walrus call.
+
+    Per attempt: start(), send, then failed(error) on a network error or
+    answered(response), and sleep next_delay() before trying again.
+    """
+
+    def __init__(self, transport, method, endpoint, operation, context, attempts=None):
+        self.transport = transport
+        self.endpoint = endpoint
+        self.context = context
+        self.attempts = transport.attempts_for(method, attempts)
+        self.breaker = transport.breaker(endpoint)
+        self.latency = transport.latency(endpoint, operation)
+        self.attempt = 0
+        self.error = None
+        self._start = 0.0
+
+    def start(self):
+        """Begin the next attempt; raises CircuitOpenError if the endpoint is known to be down"""
+        if not self.breaker.allow():
+            raise CircuitOpenError(f"{self.context}: circuit open for {self.endpoint}")
+        self.attempt += 1
+        self._start = time.perf_counter()
+
+    def failed(self, error):
+        """Record a network error (connection failure, timeout) of the current attempt"""
+        self.latency.observe(time.perf_counter() - self._start)
+        self.breaker.record_failure()
+        # Some timeouts carry no message, name them instead
+        self.error = WalrusAPIError(500, "REQUEST_FAILED", str(error) or type(error).__name__, [], context=self.context)
+
+    def answered(self, response):
+        """Record an HTTP answer; True if it succeeded, raises if it must not be retried"""
+        self.latency.observe(time.perf_counter() - self._start)
+        if response.status_code >= 500:
+            self.breaker.record_failure()
+        else:
+            self.breaker.record_success()
+        if response.status_code < 400:
+            return True
+        self.error = api_error(response, self.context)
+        if not self.transport.is_retryable_status(response.status_code):
+            raise self.error
+        return False
+
+    def next_delay(self):
+        """Seconds to wait before the next attempt; raises the last error when none are left"""
+        if self.attempt >= self.attempts:
+            raise self.error
+        return self.transport.retry_delay(self.attempt)
+
+
+class WalrusTransport:
+    """Keep-alive HTTP transport for the Walrus publisher and aggregators.
+
+    One pooled requests.Session is shared by all threads of a process.
+    Every call gets connect/read timeouts, goes through the endpoint's
+    circuit breaker and is timed into a per-endpoint latency histogram.
+    Idempotent calls (GET/HEAD) are retried on connection errors, 5xx and
+    429 with jittered exponential backoff; PUT retries are left to callers.
+    """
+
+    def __init__(self, pool_size=None, connect_timeout=None, read_timeout=None,
+                 get_attempts=None, backoff=None, breaker_threshold=None, breaker_reset=None):
+        self.timeout = (
+            connect_timeout or config.WALRUS_CONNECT_TIMEOUT,
+            read_timeout or config.WALRUS_READ_TIMEOUT
+        )
+        self.get_attempts = get_attempts or config.WALRUS_GET_ATTEMPTS
+        self.backoff = config.WALRUS_GET_BACKOFF if backoff is None else backoff
+        self.breaker_threshold = breaker_threshold or config.WALRUS_BREAKER_THRESHOLD
+        self.breaker_reset = config.WALRUS_BREAKER_RESET if breaker_reset is None else breaker_reset
+
+        self.pool_size = pool_size or config.WALRUS_POOL_SIZE
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=8, pool_maxsize=self.pool_size)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+        self._breakers = {}
+        self._lock = threading.Lock()
+
+    def breaker(self, endpoint):
+        with self._lock:
+            breaker = self._breakers.get(endpoint)
+            if breaker is None:
+                breaker = self._breakers[endpoint] = CircuitBreaker(self.breaker_threshold, self.breaker_reset)
+            return breaker
+
+    def latency(self, endpoint, operation):
+        return metrics.histogram("walrus_request_seconds", endpoint=endpoint, operation=operation)
+
+    def is_retryable_status(self, status_code):
+        return status_code >= 500 or status_code == 429
+
+    def retry_delay(self, attempt):
+        """Full-jitter exponential backoff, so retrying clients do not move in lockstep"""
+        return random.uniform(0, self.backoff * 2 ** (attempt - 1))
+
+    def attempts_for(self, method, attempts=None):
+        if attempts is not None:
+            return attempts
+        return self.get_attempts if method in IDEMPOTENT_METHODS else 1
+
+    def call(self, method, endpoint, operation, context, attempts=None):
+        """Start the retry and circuit breaker bookkeeping of one call; see CallAttempts"""
+        return CallAttempts(self, method, endpoint, operation, context, attempts)
+
+    def request(self, method, endpoint, path, operation, context, stream=False, attempts=None, **kwargs):
+        """Send a request to endpoint + path, returning a successful response.
+
+        Raises CircuitOpenError if the endpoint is known to be down and
+        WalrusAPIError for failed calls (code 500 for network errors).
+        `attempts` overrides the retry policy, e.g. when the caller fails
+        over to another endpoint instead of retrying this one.
+        """
+        call = self.call(method, endpoint, operation, context, attempts)
+        while True:
+            call.start()
+            try:
+                response = self.session.request(
+                    method, f"{endpoint}{path}", timeout=self.timeout, stream=stream, **kwargs
+                )
+            except requests.RequestException as e:
+                call.failed(e)
+            else:
+                try:
+                    if call.answered(response):
+                        return response
+                finally:
+                    if response.status_code >= 400:
+                        response.close()
+            time.sleep(call.next_delay())
+
+    def put_blob(self, publisher_url, data):
+        """Store a blob on the publisher and return its JSON answer"""
+        response = self.request(
+            "PUT", publisher_url, "/v1/blobs", "put_blob", "Error uploading blob",
+            data=data, headers={"Content-Type": "application/octet-stream"}
+        )
+        return response.json()
+
+    def get_blob(self, aggregator_url, blob_id, attempts=None, headers=None):
+        """Read a blob (or the part selected by a Range header) from an aggregator"""
+        response = self.request(
+            "GET", aggregator_url, f"/v1/blobs/{blob_id}", "get_blob",
+            f"Error retrieving blob by blob ID: {blob_id}", attempts=attempts, headers=headers
+        )
+        return response.content
+
+    def head_blob(self, aggregator_url, blob_id, attempts=None):
+        """Get the HTTP headers an aggregator sends for a blob"""
+        response = self.request(
+            "HEAD", aggregator_url, f"/v1/blobs/{blob_id}", "head_blob",
+            f"Error retrieving metadata for blob ID: {blob_id}", attempts=attempts
+        )
+        return dict(response.headers)
+
+    def open_blob(self, aggregator_url, blob_id, headers=None, attempts=None):
+        """Open a streaming GET for a blob; the caller must close the response"""
+        return self.request(
+            "GET", aggregator_url, f"/v1/blobs/{blob_id}", "stream_blob",
+            f"Error streaming blob by blob ID: {blob_id}", stream=True, headers=headers, attempts=attempts
+        )
+
+    def stats(self):
+        with self._lock:
+            breakers = {endpoint: breaker.stats() for endpoint, breaker in self._breakers.items()}
+        return {
+            "pool_size": self.pool_size,
+            "timeout": {"connect": self.timeout[0], "read": self.timeout[1]},
+            "breakers": breakers,
+            "latency": metrics.histograms("walrus_request_seconds")
+        }